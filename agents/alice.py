@@ -3,17 +3,32 @@ import numpy as np
 import tensorflow as tf
 ds = tf.contrib.distributions
 
+# logits this large are close to overflowing exp in float32 (~88)
+OVERFLOW_THRESHOLD = 50.
+# importance weights are clipped to exp(+-MAX_LOG_WEIGHT)
+MAX_LOG_WEIGHT = 20.
+# floor on state-goal counts, so count ratios never divide by zero
+MIN_COUNT = 1e-8
+
 class TabularREINFORCE:
     """Tabular multi-goal policy with entropy reguarlization and information
     regularization trained by REINFORCE."""
     
-    def __init__(self, env, use_action_info = True, use_state_info = True, policy = None):
+    def __init__(self, env, use_action_info = True, use_state_info = True, policy = None,
+                 trace_decay = None, exact_gradient = False):
+      # trace_decay = lambda also builds the online actor-critic update
+      # (update_td), which keeps eligibility traces for policy and values;
+      # exact_gradient builds the full-batch update from an expected gradient
+      # computed outside the graph (update_exact)
       
       self.use_action_info = use_action_info
       self.use_state_info = use_state_info
+      self.trace_decay = trace_decay
       
       self.state = tf.placeholder(tf.int32, [], name = 'state')
       self.goal = tf.placeholder(tf.int32, [], name = 'goal')
+      self.near_overflow_events = 0 # running total, updated by update()
+      self.last_feed_dict = None
       
       if policy is not None:
         self.action_probs = policy
@@ -39,47 +54,58 @@ class TabularREINFORCE:
   
         # policy: tabular mapping from (state,goal) to action
         self.logits = tf.Variable(tf.random_normal([env.nG, env.nS, env.nA], stddev = .1), name = 'policy_logits')
-        self.action_probs = tf.nn.softmax(tf.squeeze(self.logits[self.goal, self.state]))
+        self.policy = tf.nn.softmax(self.logits) # goal X state X action
+        self.action_logits = tf.squeeze(self.logits[self.goal, self.state])
+        self.log_action_probs = tf.nn.log_softmax(self.action_logits)
+        self.action_probs = tf.exp(self.log_action_probs)
+        all_log_action_probs = tf.nn.log_softmax(self.logits[:, self.state, :]) # goal X action
+        near_overflow = tf.reduce_sum(tf.cast(tf.abs(self.action_logits) > OVERFLOW_THRESHOLD, tf.int32))
         
-        # action info
+        # action info (all in log space)
         if use_action_info:
-          self.base_action_probs = tf.reduce_mean(tf.nn.softmax(tf.squeeze(self.logits[:, self.state])), axis = 0) # ASSUMES UNIFORM P(G)
-          self.kl = ds.kl_divergence(ds.Categorical(probs = self.action_probs),
-                                     ds.Categorical(probs = self.base_action_probs))/math.log(2) # in bits          
+          # log of mean over goals of policy, ASSUMES UNIFORM P(G)
+          self.base_log_action_probs = tf.reduce_logsumexp(all_log_action_probs, axis = 0) - math.log(env.nG)
+          self.base_action_probs = tf.exp(self.base_log_action_probs)
+          self.kl = ds.kl_divergence(ds.Categorical(logits = self.log_action_probs),
+                                     ds.Categorical(logits = self.base_log_action_probs))/math.log(2) # in bits          
           self.action_info_loss = -self.action_info_scale * self.kl
         else:
           self.action_info_loss = 0
           
         # entropy bonus
-        self.action_entropy = ds.Categorical(probs = self.action_probs).entropy()
+        self.action_entropy = ds.Categorical(logits = self.action_logits).entropy()
         self.ent_loss = -self.entropy_scale * self.action_entropy
         
         # REINFORCE loss
-        self.picked_action_prob = tf.gather(self.action_probs, self.action)
-        self.pg_loss = -tf.log(self.picked_action_prob) * self.advantage
+        self.picked_log_action_prob = tf.gather(self.log_action_probs, self.action)
+        self.picked_action_prob = tf.exp(self.picked_log_action_prob)
+        self.pg_loss = -self.picked_log_action_prob * self.advantage
         
-        # state info (ASSUMES UNIFORM GOAL PROBABILITIES)
+        # state info (ASSUMES UNIFORM GOAL PROBABILITIES), count ratios in log space
         if use_state_info:
-          this_state_count = self.state_goal_counts[self.state, self.goal]
-          this_goal_count = tf.reduce_sum(self.state_goal_counts[:, self.goal])
-          this_state_prob = this_state_count / this_goal_count # p(s_t-1|g)
-          cf_state_counts = tf.squeeze(self.state_goal_counts[self.state, :]) # counterfactual counts
-          cf_goal_counts = tf.reduce_sum(self.state_goal_counts, axis = 0) # counterfactual counts
-          cf_state_probs = cf_state_counts / cf_goal_counts # p(s_t-1|g')
-          cf_policy = tf.squeeze(tf.squeeze(tf.nn.softmax(self.logits[:, self.state, :]))[:, self.action]) # counterfactual policy
-          this_policy = self.picked_action_prob
-          imp_samp_weights = (cf_state_probs / this_state_prob) * tf.stop_gradient(cf_policy / this_policy)
-          next_state_count = self.state_goal_counts[self.next_state, self.goal]
-          next_state_prob = next_state_count / this_goal_count # p(s_t|g)
-          next_total_count = tf.reduce_sum(self.state_goal_counts[self.next_state, :])
-          next_total_prob = next_total_count / tf.reduce_sum(self.state_goal_counts) # p(s_t)      
-          next_state_ratio = next_state_prob / next_total_prob 
-          term1 = tf.log(self.picked_action_prob)
-          term2 = tf.reduce_mean(imp_samp_weights * next_state_ratio * tf.log(cf_policy))
+          log_counts = tf.log(tf.maximum(self.state_goal_counts, MIN_COUNT))
+          log_goal_counts = tf.reduce_logsumexp(log_counts, axis = 0) # counts per goal
+          log_this_state_prob = log_counts[self.state, self.goal] - log_goal_counts[self.goal] # p(s_t-1|g)
+          cf_log_state_probs = log_counts[self.state, :] - log_goal_counts # p(s_t-1|g'), counterfactual
+          cf_log_policy = all_log_action_probs[:, self.action] # counterfactual policy
+          log_weights = (cf_log_state_probs - log_this_state_prob) + \
+                        tf.stop_gradient(cf_log_policy - self.picked_log_action_prob)
+          clipped_log_weights = tf.clip_by_value(log_weights, -MAX_LOG_WEIGHT, MAX_LOG_WEIGHT)
+          imp_samp_weights = tf.exp(clipped_log_weights)
+          log_next_state_prob = log_counts[self.next_state, self.goal] - log_goal_counts[self.goal] # p(s_t|g)
+          log_next_total_prob = tf.reduce_logsumexp(log_counts[self.next_state, :]) - \
+                                tf.reduce_logsumexp(log_counts) # p(s_t)
+          next_state_ratio = tf.exp(log_next_state_prob - log_next_total_prob)
+          term1 = self.picked_log_action_prob
+          term2 = tf.reduce_mean(imp_samp_weights * next_state_ratio * cf_log_policy)
           self.log_state_odds = (term1 - term2) / np.log(2) # convert from nats to bits
           self.state_info_loss = -self.state_info_scale * self.log_state_odds
+          near_overflow += tf.reduce_sum(tf.cast(tf.not_equal(log_weights, clipped_log_weights), tf.int32))
         else:
            self.state_info_loss = 0
+        
+        # diagnostic: # of logits near overflow + # of clipped importance weights
+        self.near_overflow = near_overflow
   
         # total loss and train op
         self.loss = self.pg_loss + self.action_info_loss + self.state_info_loss + \
@@ -87,6 +113,56 @@ class TabularREINFORCE:
         self.optimizer = tf.train.AdamOptimizer(learning_rate = self.learning_rate)
         self.train_op = self.optimizer.minimize(
             self.loss, global_step = tf.contrib.framework.get_global_step())
+        
+        # actor-critic with TD(lambda): td error of the value table, and
+        # accumulating traces of grad log pi(a|s,g) and grad V(s,g)
+        if trace_decay is not None:
+          self.reward = tf.placeholder(tf.float32, [], name = 'reward')
+          self.done = tf.placeholder(tf.float32, [], name = 'done')
+          self.discount_factor = tf.placeholder(tf.float32, [], name = 'discount_factor')
+          next_value = self.value_estimates[self.goal, self.next_state] * (1 - self.done)
+          self.td_error = tf.stop_gradient(self.reward + self.discount_factor * next_value - self.value)
+          self.actor_trace = tf.Variable(tf.zeros([env.nG, env.nS, env.nA]), trainable = False, name = 'actor_trace')
+          self.critic_trace = tf.Variable(tf.zeros([env.nG, env.nS]), trainable = False, name = 'critic_trace')
+          decay = self.discount_factor * trace_decay
+          actor_trace = tf.assign(self.actor_trace, decay * self.actor_trace +
+                                  _dense_gradient(self.picked_log_action_prob, self.logits))
+          critic_trace = tf.assign(self.critic_trace, decay * self.critic_trace +
+                                   _dense_gradient(self.value, self.value_estimates))
+          # regularizers (entropy, info) are still followed by their gradients at each step
+          regularizer_loss = self.action_info_loss + self.state_info_loss + self.ent_loss
+          # td_loss is the per-step loss whose (semi-)gradient the update follows
+          # when trace_decay = 0: the critic step -value_scale*td_error*trace is
+          # that of .5*value_scale*td_error^2 (half of value_loss's convention)
+          self.td_loss = -self.td_error * self.picked_log_action_prob + \
+                         .5 * self.value_scale * tf.square(self.td_error) + regularizer_loss
+          self.td_train_op = self.optimizer.apply_gradients(
+              [(_dense_gradient(regularizer_loss, self.logits) - self.td_error * actor_trace, self.logits),
+               (-self.value_scale * self.td_error * critic_trace, self.value_estimates)])
+          self.reset_traces_op = tf.group(tf.assign(self.actor_trace, tf.zeros_like(self.actor_trace)),
+                                          tf.assign(self.critic_trace, tf.zeros_like(self.critic_trace)))
+        
+        # exact full-batch update: loss gradient wrt all logits, and values
+        # (see training.exact_gradient_alice)
+        if exact_gradient:
+          self.logits_gradient = tf.placeholder(tf.float32, [env.nG, env.nS, env.nA], name = 'logits_gradient')
+          self.exact_values = tf.placeholder(tf.float32, [env.nG, env.nS], name = 'exact_values')
+          self.exact_train_op = tf.group(self.optimizer.apply_gradients([(self.logits_gradient, self.logits)]),
+                                         tf.assign(self.value_estimates, self.exact_values))
+          self.all_near_overflow = tf.reduce_sum(tf.cast(tf.abs(self.logits) > OVERFLOW_THRESHOLD, tf.int32))
+            
+    def update_exact(self, logits_gradient, values, learning_rate, sess = None):
+      """Full-batch step along logits_gradient (goal X state X action, of the
+      loss), and sets the value table to values (goal X state). Requires
+      exact_gradient."""
+      if self.trainable:
+        sess = sess or tf.get_default_session()
+        feed_dict = {self.logits_gradient: logits_gradient,
+                     self.exact_values: values,
+                     self.learning_rate: learning_rate}
+        _, near_overflow = sess.run([self.exact_train_op, self.all_near_overflow], feed_dict)
+        self.near_overflow_events += near_overflow
+        self.last_feed_dict = feed_dict # for profiling
             
     def get_kl(self, state, goal, sess = None):
       sess = sess or tf.get_default_session()
@@ -103,6 +179,14 @@ class TabularREINFORCE:
       else:
         return self.action_probs[goal,state,:]
       
+    def get_policy(self, sess = None):
+      """Full policy table (goal X state X action) in one session call."""
+      if self.trainable:
+        sess = sess or tf.get_default_session()
+        return sess.run(self.policy)
+      else:
+        return self.action_probs
+      
     def get_value(self, state, goal, sess = None):
       sess = sess or tf.get_default_session()
       feed_dict = {self.state: state,
@@ -137,11 +221,55 @@ class TabularREINFORCE:
                      self.state_info_scale: state_info_scale,
                      self.state_goal_counts: state_goal_counts,
                      self.next_state: next_state}
-        _, loss = sess.run([self.train_op, self.loss], feed_dict)
+        _, loss, near_overflow = sess.run([self.train_op, self.loss, self.near_overflow], feed_dict)
+        self.near_overflow_events += near_overflow
+        self.last_feed_dict = feed_dict # for profiling
         return loss
       else:
         return None
     
+    def reset_traces(self, sess = None):
+      """Clears the eligibility traces, at the start of each episode."""
+      if self.trainable:
+        sess = sess or tf.get_default_session()
+        sess.run(self.reset_traces_op)
+    
+    def update_td(self, state, goal, action, reward, next_state, done, discount_factor,
+                  learning_rate, entropy_scale, value_scale,
+                  action_info_scale = None, state_info_scale = None,
+                  state_goal_counts = None, sess = None):
+      """Online actor-critic step on the transition (state, action, reward,
+      next_state): traces are decayed by discount_factor*trace_decay and
+      incremented, then policy and values move along td error X trace.
+      Requires trace_decay; returns the td loss."""
+      if self.trainable:
+        sess = sess or tf.get_default_session()
+        feed_dict = {self.state: state,
+                     self.goal: goal,
+                     self.action: action,
+                     self.reward: reward,
+                     self.next_state: next_state,
+                     self.done: float(done),
+                     self.discount_factor: discount_factor,
+                     self.learning_rate: learning_rate,
+                     self.entropy_scale: entropy_scale,
+                     self.value_scale: value_scale,
+                     self.action_info_scale: action_info_scale,
+                     self.state_info_scale: state_info_scale,
+                     self.state_goal_counts: state_goal_counts}
+        _, loss, near_overflow = sess.run([self.td_train_op, self.td_loss, self.near_overflow], feed_dict)
+        self.near_overflow_events += near_overflow
+        self.last_feed_dict = feed_dict # for profiling
+        return loss
+      else:
+        return None
+    
+def _dense_gradient(y, x):
+  """Gradient of y wrt variable x as a dense tensor (zeros if independent)."""
+  g = tf.gradients(y, x)[0]
+  if g is None: return tf.zeros_like(x)
+  return tf.convert_to_tensor(g)
+
 def get_action_probs(agent, env, sess):
   """"Extracts policy array from agent."""
   action_probs = np.ones((env.nS, env.nG, env.nA))
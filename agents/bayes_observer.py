@@ -0,0 +1,98 @@
+import numpy as np
+from envs.TwoGoalGridWorld import expected_next
+
+# floor on policy probabilities, so an action alice never takes under a goal
+# rules that goal out without making the posterior nan
+MIN_PROB = 1e-12
+
+class BayesObserver:
+  """Exact goal posterior p(g | alice's trajectory so far) from alice's policy
+  table, updated by a recursive Bayes filter over batches of trajectories.
+  Start states and transitions don't depend on the goal, so each observed
+  (state, action) multiplies the posterior by policy[state, :, action];
+  alice's STAY steps after she's done (in a terminal state) are skipped.
+  Beliefs are kept as log posteriors, episode X goal."""
+
+  def __init__(self, policy, terminal, goal_dist = None):
+    self.log_policy = np.log(np.maximum(policy, MIN_PROB)) # state X goal X action
+    self.terminal = np.asarray(terminal, dtype = bool)
+    self.nG = policy.shape[1]
+    if goal_dist is None: goal_dist = np.ones(self.nG) / self.nG
+    self.log_prior = np.log(np.asarray(goal_dist, dtype = float))
+
+  def initial_belief(self, n):
+    return np.tile(self.log_prior, (n, 1))
+
+  def observe(self, log_belief, alice_states, alice_actions):
+    """One filter step on each episode's newest (state, action) of alice."""
+    alice_states, alice_actions = np.asarray(alice_states), np.asarray(alice_actions)
+    log_likelihood = self.log_policy[alice_states, :, alice_actions]
+    log_likelihood[self.terminal[alice_states]] = 0. # done, no information
+    return _normalize(log_belief + log_likelihood)
+
+  def posteriors(self, alice_states, alice_actions):
+    """Posteriors after each step of whole trajectories (step X episode), as
+    step X episode X goal probabilities, in one pass."""
+    alice_states, alice_actions = np.asarray(alice_states), np.asarray(alice_actions)
+    log_likelihood = self.log_policy[alice_states, :, alice_actions]
+    log_likelihood[self.terminal[alice_states]] = 0.
+    return np.exp(_normalize(self.log_prior + np.cumsum(log_likelihood, axis = 0)))
+
+  def posterior(self, log_belief):
+    return np.exp(log_belief)
+
+def _normalize(log_p):
+  return log_p - np.logaddexp.reduce(log_p, axis = -1, keepdims = True)
+
+def goal_q_values(T, R, discount_factor, tol = 1e-8, max_iterations = 10000):
+  """Optimal Q-values per goal (goal X state X action) of the fully observed
+  task, by value iteration on the model (T, R) of
+  TwoGoalGridWorld.get_transition_model."""
+  V = np.zeros(R.shape[:2]) # goal X state
+  for _ in range(max_iterations):
+    Q = R + discount_factor * expected_next(T, V)
+    V_new = Q.max(axis = 2)
+    if np.max(np.abs(V_new - V)) < tol: break
+    V = V_new
+  return Q
+
+class BayesBob:
+  """Bob acting on the exact goal posterior of a BayesObserver, as a baseline
+  for RNNObserver bobs. mode = 'qmdp' picks argmax_a sum_g p(g) Q_g(s,a), the
+  DP solution under the current posterior assuming the goal is revealed
+  next step; 'greedy' heads for the most probable goal, argmax_a Q_g*(s,a).
+  (qmdp can dither, e.g. between goals, while the posterior stays uncertain,
+  and alice's posterior stops changing once she's done; greedy commits.)
+  Same interface as agents.numpy_observer.NumpyObserver (the belief is the
+  'state' passed around), so evaluate.rollout can run it."""
+
+  use_RNN = True # acts on beliefs built from alice's trajectory
+
+  def __init__(self, env, policy, discount_factor = .9, mode = 'qmdp'):
+    if mode not in ['qmdp', 'greedy']: raise ValueError('unknown mode %s' % mode)
+    self.mode = mode
+    self.nA = env.nA
+    self.observer = BayesObserver(policy, env.get_dynamics().terminal, env.goal_dist)
+    T, R = env.get_transition_model()
+    self.Q = goal_q_values(T, R, discount_factor) # goal X state X action
+
+  def initial_state(self, n):
+    return self.observer.initial_belief(n)
+
+  def observe(self, log_belief, alice_states, alice_actions):
+    return self.observer.observe(log_belief, alice_states, alice_actions)
+
+  def decode(self, log_belief):
+    """Most probable goal per episode."""
+    return np.argmax(log_belief, axis = 1)
+
+  def action_probs(self, states, log_belief):
+    """Deterministic policy, as one-hot action probabilities."""
+    q = self.Q[:, states, :] # goal X episode X action
+    if self.mode == 'qmdp':
+      values = np.einsum('eg,gea->ea', self.observer.posterior(log_belief), q)
+    else:
+      values = q[self.decode(log_belief), np.arange(len(states))]
+    probs = np.zeros((len(states), self.nA))
+    probs[np.arange(len(states)), np.argmax(values, axis = 1)] = 1.
+    return probs
@@ -1,6 +1,10 @@
+import numpy as np
 import tensorflow as tf
 ds = tf.contrib.distributions
 
+# logits this large are close to overflowing exp in float32 (~88)
+OVERFLOW_THRESHOLD = 50.
+
 class RNNObserver():
     """Processes observations of another agent with RNN to create 'belief state'
     over goal. Own state plus RNN output is fed into two networks to produce
@@ -10,6 +14,8 @@ class RNNObserver():
                  policy_layer_sizes = [], value_layer_sizes = [], use_RNN = True):
       
       self.use_RNN = use_RNN             
+      self.near_overflow_events = 0 # running total, updated by update()
+      self.last_feed_dict = None
       self.obs_states = tf.placeholder(tf.int32, [None], name = "observed_states")
       self.obs_actions = tf.placeholder(tf.int32, [None], name = "observed_actions")
       self.state = tf.placeholder(tf.int32, [], name = 'self_state')
@@ -77,10 +83,13 @@ class RNNObserver():
         self.action_logits = tf.squeeze(tf.layers.dense(x_policy, env.nA,
                                                         activation = None,
                                                         name = 'layer_%i' % i), axis = 0)
-        self.action_probs = tf.nn.softmax(self.action_logits)
-        self.picked_action_prob = tf.gather(self.action_probs, self.action)
-        self.action_entropy = ds.Categorical(probs = self.action_probs).entropy()
-        self.pg_loss = -tf.log(self.picked_action_prob) * self.advantage
+        self.log_action_probs = tf.nn.log_softmax(self.action_logits)
+        self.action_probs = tf.exp(self.log_action_probs)
+        self.picked_log_action_prob = tf.gather(self.log_action_probs, self.action)
+        self.picked_action_prob = tf.exp(self.picked_log_action_prob)
+        self.action_entropy = ds.Categorical(logits = self.action_logits).entropy()
+        self.pg_loss = -self.picked_log_action_prob * self.advantage
+        self.near_overflow = tf.reduce_sum(tf.cast(tf.abs(self.action_logits) > OVERFLOW_THRESHOLD, tf.int32))
         self.ent_loss =  -self.entropy_scale * self.action_entropy
       
       # total loss and train op
@@ -130,5 +139,19 @@ class RNNObserver():
                        self.learning_rate: learning_rate,
                        self.entropy_scale: entropy_scale,
                        self.value_scale: value_scale}
-        _, loss = sess.run([self.train_op, self.loss], feed_dict)
-        return loss
\ No newline at end of file
+        _, loss, near_overflow = sess.run([self.train_op, self.loss, self.near_overflow], feed_dict)
+        self.near_overflow_events += near_overflow
+        self.last_feed_dict = feed_dict # for profiling
+        return loss
+
+def export_weights(checkpoint_path, path, scope = 'bob'):
+  """Saves the weights of the RNNObserver under scope in a checkpoint to an
+  npz (names relative to scope, optimizer slots dropped), for
+  agents.numpy_observer.NumpyObserver."""
+  reader = tf.train.NewCheckpointReader(checkpoint_path)
+  weights = {}
+  for name in reader.get_variable_to_shape_map():
+    if not name.startswith(scope+'/') or 'Adam' in name or name.endswith('_power'): continue
+    weights[name[len(scope)+1:]] = reader.get_tensor(name)
+  np.savez(path, **weights)
+  return weights
@@ -0,0 +1,98 @@
+import re
+import numpy as np
+
+WEIGHTS_FILE = 'bob_weights.npz'
+
+class NumpyObserver:
+  """Numpy forward pass of a trained RNNObserver (agents/bob.py), batched over
+  episodes, from weights exported by agents.bob.export_weights. Needs no TF.
+
+  The GRU is stepped one observation at a time, so after t steps its state is
+  the z RNNObserver computes from the first t (state, action) pairs.
+
+  Usage:
+    bob = load_observer(directory+'bob/')
+    h = bob.initial_state(n)
+    h = bob.observe(h, alice_states, alice_actions) # each step
+    probs = bob.action_probs(bob_states, h)
+  """
+
+  def __init__(self, weights):
+    self.weights = weights
+    self.use_RNN = _find(weights, 'gates/(kernel|weights)') is not None
+    if self.use_RNN:
+      self.gates_kernel = _find(weights, 'gates/(kernel|weights)')
+      self.gates_bias = _find(weights, 'gates/(bias|biases)')
+      self.candidate_kernel = _find(weights, 'candidate/(kernel|weights)')
+      self.candidate_bias = _find(weights, 'candidate/(bias|biases)')
+    self.shared = _layers(weights, 'shared')
+    self.policy = _layers(weights, 'policy')
+    self.value_layers = _layers(weights, 'value')
+    first = (self.shared or self.policy)[0][0]
+    self.nS = first.shape[0] - 1 # input is one-hot state plus z
+    self.nA = self.policy[-1][0].shape[1]
+    self.n_units = 1 # RNNObserver's GRU has a scalar core state
+
+  def initial_state(self, n):
+    return np.zeros((n, self.n_units))
+
+  def observe(self, h, alice_states, alice_actions):
+    """One GRU step on each episode's newest observation of alice; input is the
+    one-hot of (state, action), so its matmul is a row lookup."""
+    rows = np.asarray(alice_states) * self.nA + np.asarray(alice_actions)
+    n_inputs = self.gates_kernel.shape[0] - self.n_units
+    gates = _sigmoid(self.gates_kernel[rows] + h.dot(self.gates_kernel[n_inputs:]) + self.gates_bias)
+    r, u = gates[:, :self.n_units], gates[:, self.n_units:]
+    c = np.tanh(self.candidate_kernel[rows] + (r * h).dot(self.candidate_kernel[n_inputs:]) +
+                self.candidate_bias)
+    return u * h + (1 - u) * c
+
+  def _features(self, states, z):
+    # one-hot state concatenated with z, through the shared layers
+    x = np.zeros((len(states), self.nS + z.shape[1]))
+    x[np.arange(len(states)), states] = 1.
+    x[:, self.nS:] = z
+    return _mlp(x, self.shared, final_relu = True)
+
+  def action_logits(self, states, z):
+    return _mlp(self._features(np.asarray(states), np.asarray(z, dtype = float)), self.policy)
+
+  def action_probs(self, states, z):
+    logits = self.action_logits(states, z)
+    logits -= logits.max(axis = 1, keepdims = True)
+    p = np.exp(logits)
+    return p / p.sum(axis = 1, keepdims = True)
+
+  def value(self, states, z):
+    return _mlp(self._features(np.asarray(states), np.asarray(z, dtype = float)), self.value_layers)[:, 0]
+
+def load_observer(directory):
+  """NumpyObserver from directory+WEIGHTS_FILE."""
+  with np.load(directory + WEIGHTS_FILE) as f:
+    weights = {k: f[k] for k in f.files}
+  return NumpyObserver(weights)
+
+def _find(weights, pattern):
+  for name, w in weights.items():
+    if re.search(pattern + '$', name): return w
+  return None
+
+def _layers(weights, scope):
+  """(kernel, bias) of scope/layer_i, in order of i."""
+  layers = []
+  i = 1
+  while _find(weights, '%s/layer_%i/(kernel|weights)' % (scope, i)) is not None:
+    layers.append((_find(weights, '%s/layer_%i/(kernel|weights)' % (scope, i)),
+                   _find(weights, '%s/layer_%i/(bias|biases)' % (scope, i))))
+    i += 1
+  return layers
+
+def _mlp(x, layers, final_relu = False):
+  # relu on hidden layers; the last layer of a head is linear
+  for i, (kernel, bias) in enumerate(layers):
+    x = x.dot(kernel) + bias
+    if final_relu or i < len(layers) - 1: x = np.maximum(x, 0.)
+  return x
+
+def _sigmoid(x):
+  return 1. / (1. + np.exp(-x))
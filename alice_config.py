@@ -1,5 +1,5 @@
 from collections import namedtuple
-from util.anneal import log_decay
+from util.anneal import LogDecay, Piecewise
 
 experiment_name = 'alice_state_positive_cooperative'
 
@@ -33,13 +33,33 @@ unregularized_steps = 10000 # 10k
 state_info_reg_strength = .15
 training_param = TrainingParam(training_steps = training_steps,
                                learning_rate = .025,
-                               entropy_scale = log_decay(.5, .005, training_steps),
+                               entropy_scale = LogDecay(.5, .005, training_steps),
                                value_scale = .5,
                                action_info_scale = None,
-                               state_info_scale = [0]*unregularized_steps+[state_info_reg_strength]*int(training_steps-unregularized_steps),
+                               state_info_scale = Piecewise([0, state_info_reg_strength], [unregularized_steps]),
                                state_count_discount = 1,
                                discount_factor = .8,
                                max_episode_length = 100)
 
+# optional early stopping once metrics plateau (see util.convergence), e.g.
+#   ConvergenceParam(window = 10000, patience = 50000, check_every = 5000,
+#                    tolerances = {'reward_rate': .005}, min_steps = 0)
+# None always trains for training_steps
+ConvergenceParam = namedtuple('ConvergenceParameters',
+                             ['window',
+                              'patience',
+                              'check_every',
+                              'tolerances',
+                              'min_steps'])
+convergence_param = None
+
+# training algorithm: 'reinforce' (Monte Carlo, updates after each episode),
+# 'actor_critic' (online TD(lambda), updates every step; lambda = trace_decay) or
+# 'exact_gradient' (model-based expected gradient, exact_updates full-batch
+# updates; schedules above are stretched over them)
+algorithm = 'reinforce'
+trace_decay = .9
+exact_updates = 5000
+
 def get_config():
     return agent_param, training_param, experiment_name
\ No newline at end of file
@@ -0,0 +1,68 @@
+import numpy as np
+import tensorflow as tf
+from benchmarks.harness import make_env, case_name, measure
+
+TRAJECTORY_LENGTHS = [1, 10, 50, 100]
+
+def bench_alice(shapes, goal_counts, number = 200):
+  """TabularREINFORCE predict/get_kl/update latency, with and without info
+  regularization."""
+  from agents.alice import TabularREINFORCE
+  results = {}
+  for shape in shapes:
+    for n_goals in goal_counts:
+      env = make_env(shape, n_goals)
+      for info in [False, True]:
+        tf.reset_default_graph()
+        with tf.variable_scope('alice'):
+          alice = TabularREINFORCE(env, use_action_info = info, use_state_info = info)
+        state_goal_counts = np.ones((env.nS, env.nG))
+        with tf.Session() as sess:
+          sess.run(tf.global_variables_initializer())
+          tag = {'info': int(info)}
+          results[case_name('alice.predict', shape, n_goals, **tag)] = \
+            measure(lambda: alice.predict(state = 1, goal = 0), number = number)
+          if info:
+            results[case_name('alice.get_kl', shape, n_goals, **tag)] = \
+              measure(lambda: alice.get_kl(state = 1, goal = 0), number = number)
+          update = lambda: alice.update(state = 1, goal = 0, action = 0,
+                                        return_estimate = 1.,
+                                        learning_rate = 1e-3,
+                                        entropy_scale = .1,
+                                        value_scale = .5,
+                                        action_info_scale = .1,
+                                        state_info_scale = .1,
+                                        state_goal_counts = state_goal_counts,
+                                        next_state = 2)
+          results[case_name('alice.update', shape, n_goals, **tag)] = measure(update, number = number)
+  return results
+
+def bench_bob(shapes, goal_counts, trajectory_lengths = TRAJECTORY_LENGTHS,
+              shared_layer_sizes = [128], number = 100):
+  """RNNObserver predict/update latency against observed trajectory length."""
+  from agents.bob import RNNObserver
+  results = {}
+  for shape in shapes:
+    for n_goals in goal_counts:
+      env = make_env(shape, n_goals)
+      tf.reset_default_graph()
+      with tf.variable_scope('bob'):
+        bob = RNNObserver(env = env, shared_layer_sizes = shared_layer_sizes, use_RNN = True)
+      rng = np.random.RandomState(0)
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        for T in trajectory_lengths:
+          obs_states = list(rng.randint(env.nS, size = T))
+          obs_actions = list(rng.randint(env.nA, size = T))
+          results[case_name('bob.predict', shape, n_goals, T = T)] = \
+            measure(lambda: bob.predict(state = 1, obs_states = obs_states,
+                                        obs_actions = obs_actions), number = number)
+          update = lambda: bob.update(state = 1, action = 0,
+                                      return_estimate = 1.,
+                                      learning_rate = 1e-6,
+                                      entropy_scale = .01,
+                                      value_scale = .5,
+                                      obs_states = obs_states,
+                                      obs_actions = obs_actions)
+          results[case_name('bob.update', shape, n_goals, T = T)] = measure(update, number = number)
+  return results
@@ -0,0 +1,42 @@
+import numpy as np
+from benchmarks.harness import make_env, case_name, measure
+from training.rollout_kernel import rollout, action_kl_table
+
+def bench_env(shapes, goal_counts, number = 100, steps = 1000, p_rand = 0.):
+  """Env reset (incl. transition matrix rebuild) latency, step throughput and
+  rollout kernel throughput."""
+  results = {}
+  for shape in shapes:
+    for n_goals in goal_counts:
+      np.random.seed(0)
+      env = make_env(shape, n_goals, r_wall = -.1, p_rand = p_rand)
+      env.seed(0) # start states and goals come from the env's RNG
+      results[case_name('env.reset', shape, n_goals)] = measure(env._reset, number = number)
+
+      # steps from random states; on termination jump back to the start state
+      # rather than resetting, so only step cost is measured
+      actions = np.random.randint(env.nA, size = steps)
+      start_state, _ = env._reset()
+      def run_steps():
+        env.s = start_state
+        for a in actions:
+          _, _, done, _ = env.step(a)
+          if done: env.s = start_state
+      results[case_name('env.step', shape, n_goals)] = measure(run_steps, number = 1,
+                                                               per_call = steps)
+
+      # whole episodes of a random policy table, with per-step kl and lso,
+      # from the rollout kernel (numba if installed); per step, on average
+      policy = np.random.dirichlet(np.ones(env.nA), size = (env.nG, env.nS))
+      dynamics = env.get_dynamics()
+      action_kls = action_kl_table(policy)
+      n_episodes = max(1, steps // 10)
+      def run_rollouts():
+        episodes = rollout(policy, dynamics, env.goal_dist, n_episodes, 100,
+                           action_kls = action_kls,
+                           state_goal_counts = np.ones((env.nS, env.nG)))
+        run_rollouts.steps = int(np.sum(episodes.lengths))
+      run_rollouts()
+      results[case_name('env.rollout_kernel', shape, n_goals)] = measure(run_rollouts, number = 1,
+                                                                         per_call = run_rollouts.steps)
+  return results
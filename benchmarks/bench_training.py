@@ -0,0 +1,86 @@
+import time
+import numpy as np
+import tensorflow as tf
+from benchmarks.harness import make_env, case_name
+
+def _record(seconds, steps):
+  """Same format as harness.measure, from repeated (seconds, steps) runs."""
+  per_step = np.array(seconds) / np.array(steps)
+  return {'median': float(np.median(per_step)),
+          'min': float(np.min(per_step)),
+          'mean': float(np.mean(per_step)),
+          'std': float(np.std(per_step)),
+          'ops_per_second': float(1 / np.median(per_step)),
+          'number': int(np.sum(steps)),
+          'repeat': len(steps)}
+
+def bench_alice_training(shapes, goal_counts, training_steps = 2000, repeat = 3):
+  """Full REINFORCE_alice training steps/sec (with state info, as configured
+  in experiments)."""
+  from agents.alice import TabularREINFORCE
+  from training.REINFORCE_alice import reinforce
+  results = {}
+  for shape in shapes:
+    for n_goals in goal_counts:
+      seconds, steps = [], []
+      for r in range(repeat):
+        np.random.seed(r)
+        env = make_env(shape, n_goals, r_wall = -.1)
+        env.seed(r) # start states and goals come from the env's RNG
+        tf.reset_default_graph()
+        with tf.variable_scope('alice'):
+          alice = TabularREINFORCE(env, use_action_info = False, use_state_info = True)
+        with tf.Session() as sess:
+          sess.run(tf.global_variables_initializer())
+          t = time.perf_counter()
+          stats, _ = reinforce(env = env,
+                               agent = alice,
+                               training_steps = training_steps,
+                               learning_rate = .025,
+                               entropy_scale = .1,
+                               value_scale = .5,
+                               action_info_scale = 0.,
+                               state_info_scale = .1,
+                               state_count_discount = 1,
+                               discount_factor = .8,
+                               max_episode_length = 100)
+          seconds.append(time.perf_counter() - t)
+          steps.append(sum(stats.episode_lengths))
+      results[case_name('train.alice', shape, n_goals)] = _record(seconds, steps)
+  return results
+
+def bench_bob_training(shapes, goal_counts, training_steps = 1000, repeat = 3):
+  """Full REINFORCE_bob training steps/sec (RNN bob, untrained alice)."""
+  from agents.alice import TabularREINFORCE
+  from agents.bob import RNNObserver
+  from training.REINFORCE_bob import reinforce
+  results = {}
+  for shape in shapes:
+    for n_goals in goal_counts:
+      seconds, steps = [], []
+      for r in range(repeat):
+        np.random.seed(r)
+        env = make_env(shape, n_goals, r_wall = -.1)
+        env.seed(r) # start states and goals come from the env's RNG
+        tf.reset_default_graph()
+        with tf.variable_scope('alice'):
+          alice = TabularREINFORCE(env, use_action_info = False, use_state_info = True)
+        with tf.variable_scope('bob'):
+          bob = RNNObserver(env = env, shared_layer_sizes = [128], use_RNN = True)
+        with tf.Session() as sess:
+          sess.run(tf.global_variables_initializer())
+          t = time.perf_counter()
+          _, bob_stats, _ = reinforce(env = env,
+                                      alice = alice,
+                                      bob = bob,
+                                      training_steps = training_steps,
+                                      learning_rate = 5e-5,
+                                      entropy_scale = .05,
+                                      value_scale = .5,
+                                      discount_factor = .9,
+                                      max_episode_length = 100,
+                                      viz_episode_every = 10**9)
+          seconds.append(time.perf_counter() - t)
+          steps.append(sum(bob_stats.episode_lengths))
+      results[case_name('train.bob', shape, n_goals)] = _record(seconds, steps)
+  return results
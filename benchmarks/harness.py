@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import subprocess
+import numpy as np
+
+# default grid sizes and goal counts benchmarks sweep over
+SHAPES = [[5,5], [8,4], [10,10], [20,20]]
+GOAL_COUNTS = [2, 4]
+QUICK_SHAPES = [[5,5], [10,10]]
+QUICK_GOAL_COUNTS = [2]
+
+def make_env(shape, n_goals, **kwargs):
+  """TwoGoalGridWorld with n_goals spread evenly along the top row."""
+  from envs.TwoGoalGridWorld import TwoGoalGridWorld
+  if n_goals > shape[1]: raise ValueError('more goals than top row states')
+  goal_locs = [int(x) for x in np.linspace(0, shape[1]-1, n_goals).round()]
+  return TwoGoalGridWorld(shape = shape, goal_locs = goal_locs, **kwargs)
+
+def case_name(name, shape, n_goals, **extra):
+  """Benchmark key, e.g. 'env.step[8x4,g2]' or 'bob.predict[8x4,g2,T50]'."""
+  tags = ['%ix%i' % tuple(shape), 'g%i' % n_goals]
+  tags += ['%s%s' % (k, v) for k, v in sorted(extra.items())]
+  return '%s[%s]' % (name, ','.join(tags))
+
+def measure(fn, number = 100, repeat = 5, warmup = 1, per_call = 1):
+  """Times fn() number times, repeat times (after warmup calls). per_call is
+  the # of operations one fn() call performs (e.g. steps). Returns a dict
+  with seconds per operation; 'median' is what comparisons use."""
+  for _ in range(warmup): fn()
+  times = []
+  for _ in range(repeat):
+    t = time.perf_counter()
+    for _ in range(number): fn()
+    times.append((time.perf_counter() - t) / (number * per_call))
+  times = np.array(times)
+  return {'median': float(np.median(times)),
+          'min': float(np.min(times)),
+          'mean': float(np.mean(times)),
+          'std': float(np.std(times)),
+          'ops_per_second': float(1 / np.median(times)),
+          'number': number * per_call,
+          'repeat': repeat}
+
+def machine_info():
+  info = {'host': socket.gethostname(),
+          'platform': platform.platform(),
+          'python': platform.python_version(),
+          'numpy': np.__version__,
+          'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+  try:
+    import tensorflow as tf
+    info['tensorflow'] = tf.__version__
+  except ImportError:
+    pass
+  try:
+    directory = os.path.dirname(os.path.abspath(__file__))
+    info['commit'] = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd = directory,
+                                             stderr = subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    pass
+  return info
+
+def save(results, path):
+  with open(path, 'w') as f:
+    json.dump({'machine': machine_info(), 'results': results}, f, indent = 1, sort_keys = True)
+
+def load(path):
+  with open(path) as f:
+    return json.load(f)['results']
+
+def compare(baseline, current, threshold = .1):
+  """Compares median seconds per op of benchmarks present in both result
+  dicts. Returns (regressions, improvements) as lists of (name, baseline,
+  current, ratio), where ratio = current/baseline is beyond 1 +- threshold."""
+  regressions = []
+  improvements = []
+  for name in sorted(set(baseline) & set(current)):
+    ratio = current[name]['median'] / baseline[name]['median']
+    row = (name, baseline[name]['median'], current[name]['median'], ratio)
+    if ratio > 1 + threshold: regressions.append(row)
+    elif ratio < 1 - threshold: improvements.append(row)
+  return regressions, improvements
+
+def print_results(results, file = sys.stdout):
+  for name in sorted(results):
+    r = results[name]
+    file.write('%-45s %12.2f us/op %14.0f ops/s\n' % (name, 1e6*r['median'], r['ops_per_second']))
+
+def print_comparison(regressions, improvements, file = sys.stdout):
+  for title, rows in [('REGRESSIONS', regressions), ('improvements', improvements)]:
+    if not rows: continue
+    file.write('%s:\n' % title)
+    for name, old, new, ratio in rows:
+      file.write('  %-43s %10.2f -> %10.2f us/op (x%.2f)\n' % (name, 1e6*old, 1e6*new, ratio))
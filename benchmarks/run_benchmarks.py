@@ -0,0 +1,61 @@
+"""Runs the benchmark suites and writes results as json; optionally compares
+against a baseline json and exits with status 1 on regressions.
+
+  python -m benchmarks.run_benchmarks --output bench.json
+  python -m benchmarks.run_benchmarks --quick --suites env,agents --compare bench.json
+"""
+import os
+import sys
+import argparse
+if "../" not in sys.path: sys.path.append("../")
+from benchmarks import harness
+
+SUITES = ['env', 'agents', 'training']
+
+def run(suites = SUITES, quick = False):
+  """Runs the given suites; returns {benchmark name: timing dict}."""
+  shapes = harness.QUICK_SHAPES if quick else harness.SHAPES
+  goal_counts = harness.QUICK_GOAL_COUNTS if quick else harness.GOAL_COUNTS
+  results = {}
+  if 'env' in suites:
+    from benchmarks.bench_env import bench_env
+    results.update(bench_env(shapes, goal_counts))
+  if 'agents' in suites:
+    from benchmarks.bench_agents import bench_alice, bench_bob
+    results.update(bench_alice(shapes, goal_counts, number = 50 if quick else 200))
+    results.update(bench_bob(shapes, goal_counts, number = 20 if quick else 100))
+  if 'training' in suites:
+    from benchmarks.bench_training import bench_alice_training, bench_bob_training
+    results.update(bench_alice_training(shapes, goal_counts,
+                                        training_steps = 500 if quick else 2000,
+                                        repeat = 1 if quick else 3))
+    results.update(bench_bob_training(shapes, goal_counts,
+                                      training_steps = 200 if quick else 1000,
+                                      repeat = 1 if quick else 3))
+  return results
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = 'Run benchmarks.')
+  parser.add_argument('--suites', default = ','.join(SUITES),
+                      help = 'comma-separated subset of %s' % ','.join(SUITES))
+  parser.add_argument('--quick', action = 'store_true', help = 'fewer sizes and iterations')
+  parser.add_argument('--output', default = None, help = 'json file to write results to')
+  parser.add_argument('--compare', default = None, help = 'baseline json to compare against')
+  parser.add_argument('--threshold', type = float, default = .1,
+                      help = 'relative slowdown flagged as a regression')
+  args = parser.parse_args()
+
+  results = run(args.suites.split(','), quick = args.quick)
+  print('')
+  harness.print_results(results)
+  if args.output is not None:
+    harness.save(results, args.output)
+    print('Saved results to %s.' % args.output)
+  if args.compare is not None:
+    regressions, improvements = harness.compare(harness.load(args.compare), results,
+                                                threshold = args.threshold)
+    harness.print_comparison(regressions, improvements)
+    if regressions:
+      print('%i regression(s) against %s.' % (len(regressions), args.compare))
+      sys.exit(1)
+    print('No regressions against %s.' % os.path.basename(args.compare))
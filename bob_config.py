@@ -1,5 +1,5 @@
 from collections import namedtuple
-from util.anneal import log_decay
+from util.anneal import LogDecay
 
 experiment_name = 'bob_shared128_200k'
 
@@ -36,11 +36,28 @@ TrainingParam = namedtuple('TrainingParameters',
 training_steps = 200000 # 200k
 training_param = TrainingParam(training_steps = training_steps,
                                learning_rate = 0.00005,
-                               entropy_scale = log_decay(.05, .01, training_steps),
+                               entropy_scale = LogDecay(.05, .01, training_steps),
                                value_scale = .5,
                                discount_factor = .9,
                                max_episode_length = 100,
                                bob_goal_access = None)
 
+# optional early stopping once metrics plateau (see util.convergence), e.g.
+#   ConvergenceParam(window = 10000, patience = 50000, check_every = 5000,
+#                    tolerances = {'reward_rate': .005}, min_steps = 0)
+# None always trains for training_steps
+ConvergenceParam = namedtuple('ConvergenceParameters',
+                             ['window',
+                              'patience',
+                              'check_every',
+                              'tolerances',
+                              'min_steps'])
+convergence_param = None
+
+# training algorithm: 'reinforce' (Monte Carlo, updates after each episode) or
+# 'actor_critic' (online, updates with n_step bootstrapped returns)
+algorithm = 'reinforce'
+n_step = 5
+
 def get_config():
     return agent_param, training_param, experiment_name, alice_experiment
\ No newline at end of file
@@ -0,0 +1,49 @@
+import numpy as np
+from envs.TwoGoalGridWorld import STAY
+
+class BatchedTwoGoalGridWorld:
+  """n_envs independent episodes of a TwoGoalGridWorld, stepped together with
+  numpy from the env's transition model (get_dynamics), e.g. to evaluate a
+  policy over thousands of episodes at once. Episodes that are done stay
+  frozen in their terminal state, with zero reward, until the next reset.
+  Needs no TF (and no gym, given the env's dynamics)."""
+
+  def __init__(self, env, n_envs, seed = None):
+    self.n_envs = n_envs
+    self.nS, self.nA, self.nG = env.nS, env.nA, env.nG
+    self.goal_locs = np.asarray(env.goal_locs)
+    self.goal_dist = np.asarray(env.goal_dist, dtype = float)
+    self.dynamics = env.get_dynamics()
+    # non-terminal states, where episodes start
+    self.start_states = np.flatnonzero(~self.dynamics.terminal)
+    self.np_random = np.random.RandomState(seed)
+    self.states = None
+    self.goals = None
+    self.dones = None
+
+  def reset(self, goals = None):
+    """Samples goals (unless given) and uniform non-terminal start states."""
+    if goals is None: goals = self.np_random.choice(self.nG, size = self.n_envs, p = self.goal_dist)
+    self.goals = np.broadcast_to(np.asarray(goals), (self.n_envs,)).copy()
+    self.states = self.start_states[self.np_random.randint(len(self.start_states), size = self.n_envs)]
+    self.dones = np.zeros(self.n_envs, dtype = bool)
+    return self.states.copy(), self.goals.copy()
+
+  def step(self, actions):
+    """Steps every episode that isn't done yet. Returns next states, rewards
+    and dones (True from the step an episode reaches a goal on)."""
+    dyn = self.dynamics
+    actions = np.where(self.dones, STAY, actions)
+    next_states = dyn.next_states[self.states, actions]
+    wall = dyn.hit_wall[self.states, actions]
+    if dyn.p_rand > 0:
+      # random transitions: any action's outcome, without the wall penalty
+      rand = self.np_random.rand(self.n_envs) < dyn.p_rand
+      rand_actions = self.np_random.randint(self.nA, size = self.n_envs)
+      next_states = np.where(rand, dyn.next_states[self.states, rand_actions], next_states)
+      wall &= ~rand
+    rewards = dyn.state_rewards[self.goals, next_states] + dyn.r_wall * wall
+    rewards[self.dones] = 0.
+    self.states = next_states
+    self.dones = self.dones | dyn.terminal[next_states]
+    return next_states.copy(), rewards, self.dones.copy()
@@ -0,0 +1,73 @@
+import numpy as np
+from envs.BatchedTwoGoalGridWorld import BatchedTwoGoalGridWorld
+
+class JointTwoGoalGridWorld:
+  """
+  alice and bob in the same episode of a TwoGoalGridWorld: one goal and one
+  transition model (env's P, built once per reset, rather than once per
+  agent), stepped with a pair of actions. An agent that's done stays frozen
+  in its terminal state, with zero reward, until the next reset; its action
+  is ignored. Leaves env.s at alice's state, so env._render(bob_state = ...)
+  draws both.
+  """
+
+  def __init__(self, env):
+    self.env = env
+    self.action_to_index = env.action_to_index
+    self.index_to_action = env.index_to_action
+    self.goal = None
+    self.states = None
+    self.dones = None
+
+  def reset(self, goal = None):
+    """Samples the goal (unless given) and both agents' start states, uniform
+    over non-terminal states. Returns alice's and bob's states and the goal."""
+    env = self.env
+    alice_state, self.goal = env._reset(goal)
+    bob_state = env.start_states[env.sampler.index(len(env.start_states))]
+    self.states = [alice_state, bob_state]
+    self.dones = [False, False]
+    return alice_state, bob_state, self.goal
+
+  def step(self, alice_action, bob_action):
+    """Moves alice, then bob (unless done). Returns (alice_state, bob_state),
+    (alice_reward, bob_reward) and (alice_done, bob_done)."""
+    env = self.env
+    rewards = [0., 0.]
+    for agent, action in enumerate([alice_action, bob_action]):
+      if self.dones[agent]: continue
+      env.s = self.states[agent]
+      self.states[agent], rewards[agent], self.dones[agent], _ = env.step(action)
+    env.s = self.states[0]
+    return tuple(self.states), tuple(rewards), tuple(self.dones)
+
+class BatchedJointTwoGoalGridWorld:
+  """n_envs joint alice and bob episodes, stepped together with numpy: a
+  BatchedTwoGoalGridWorld of 2*n_envs episodes (alice's, then bob's) on the
+  same goals. Returns per-agent arrays, as JointTwoGoalGridWorld does scalars."""
+
+  def __init__(self, env, n_envs, seed = None):
+    self.n_envs = n_envs
+    self.batched_env = BatchedTwoGoalGridWorld(env, 2*n_envs, seed = seed)
+    self.goal_locs = self.batched_env.goal_locs
+    self.goals = None
+
+  def reset(self, goals = None):
+    """Samples goals (unless given) and start states for both agents.
+    Returns alice's and bob's states and the goals."""
+    batched_env = self.batched_env
+    if goals is None:
+      goals = batched_env.np_random.choice(batched_env.nG, size = self.n_envs, p = batched_env.goal_dist)
+    self.goals = np.broadcast_to(np.asarray(goals), (self.n_envs,)).copy()
+    states, _ = batched_env.reset(np.tile(self.goals, 2))
+    return states[:self.n_envs], states[self.n_envs:], self.goals.copy()
+
+  def step(self, alice_actions, bob_actions):
+    """Steps both agents of every episode (agents that are done STAY).
+    Returns (alice_states, bob_states), (alice_rewards, bob_rewards) and
+    (alice_dones, bob_dones)."""
+    actions = np.concatenate([np.broadcast_to(alice_actions, (self.n_envs,)),
+                              np.broadcast_to(bob_actions, (self.n_envs,))])
+    states, rewards, dones = self.batched_env.step(actions)
+    n = self.n_envs
+    return (states[:n], states[n:]), (rewards[:n], rewards[n:]), (dones[:n], dones[n:])
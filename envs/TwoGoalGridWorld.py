@@ -1,6 +1,8 @@
 import numpy as np
 import sys
+from collections import namedtuple
 from gym.envs.toy_text import discrete
+from util.sampling import Sampler, AliasTable
 
 UP = 0
 RIGHT = 1
@@ -11,6 +13,27 @@ STAY = 4
 action_to_index = {'UP': UP, 'RIGHT': RIGHT, 'DOWN': DOWN, 'LEFT': LEFT, 'STAY': STAY}
 index_to_action = {v: k for k, v in action_to_index.items()}
 
+# transition model as arrays (see TwoGoalGridWorld.get_dynamics)
+Dynamics = namedtuple('Dynamics', ['next_states', 'hit_wall', 'state_rewards',
+                                   'terminal', 'r_wall', 'p_rand'])
+# sparse transition model (see TwoGoalGridWorld.get_transition_model): the
+# possible next states of each (state, action), and their probabilities
+Transitions = namedtuple('Transitions', ['next_states', 'probs'])
+
+def expected_next(transitions, values):
+  """Expected goal X state values of the next state, per (goal, state,
+  action), i.e. sum_s' T[s,a,s'] values[g,s']."""
+  return np.sum(transitions.probs * values[:, transitions.next_states], axis = -1)
+
+def push_forward(transitions, weights):
+  """Next-state distribution (goal X state) of goal X state X action
+  weights (e.g. state distribution X policy), i.e.
+  sum_s,a weights[g,s,a] T[s,a,s']."""
+  nG, nS = weights.shape[:2]
+  indices = np.arange(nG)[:, None, None, None] * nS + transitions.next_states
+  mass = weights[..., None] * transitions.probs
+  return np.bincount(indices.ravel(), weights = mass.ravel(), minlength = nG * nS).reshape(nG, nS)
+
 # for more control, could subclass the superclass Env in gym/core.py
 class TwoGoalGridWorld(discrete.DiscreteEnv):
   """
@@ -98,6 +121,13 @@ class TwoGoalGridWorld(discrete.DiscreteEnv):
     if len(self.goal_locs) != len(self.goal_dist):
       raise ValueError('length of goal_dist and goal_locs must be equal')
 
+    # episodes start uniformly in non-terminal states
+    self.start_states = [s for s in range(self.nS) if s not in self.goal_locs]
+    # alias tables of P's transition probabilities (the same for all goals),
+    # built on the first step
+    self._transition_table = None
+    self._sampler = None
+
     # transition matrix built by _reset
     P = None
 
@@ -128,7 +158,7 @@ class TwoGoalGridWorld(discrete.DiscreteEnv):
     
     # sample goal
     if goal is None:
-      self.g = np.random.choice(self.nG, size = None, p = self.goal_dist)
+      self.g = self.sampler.choice(self.goal_dist)
     else:
       self.g = goal
     
@@ -195,16 +225,91 @@ class TwoGoalGridWorld(discrete.DiscreteEnv):
       
     self.P = P
       
-    # sample starting state (uniform, but resample if terminal)
-    s = np.random.choice(self.nS)
-    while is_done(s): s = np.random.choice(self.nS)
-    self.s = s
+    # sample starting state (uniform over non-terminal states)
+    self.s = self.start_states[self.sampler.index(len(self.start_states))]
 
     self.lastaction = None
     return self.s, self.g
   
+  def _step(self, a):
+    """Overwrites inherited step to sample P[s][a] with alias tables and
+    pre-drawn uniforms (self.sampler), rather than a fresh categorical
+    sample from the list of transitions every step."""
+    if self._transition_table is None:
+      k = max(len(self.P[s][b]) for s in range(self.nS) for b in range(self.nA))
+      probs = np.zeros((self.nS*self.nA, k))
+      for s in range(self.nS):
+        for b in range(self.nA):
+          probs[s*self.nA + b, :len(self.P[s][b])] = [t[0] for t in self.P[s][b]]
+      self._transition_table = AliasTable(probs)
+    transitions = self.P[self.s][a]
+    i = self._transition_table.sample(self.s*self.nA + a, self.sampler.uniform())
+    p, s, r, d = transitions[i]
+    self.s = s
+    self.lastaction = a
+    return (s, r, d, {'prob': p})
+  
+  @property
+  def sampler(self):
+    """util.sampling.Sampler on np_random (rebuilt when seed replaces it)."""
+    if self._sampler is None or self._sampler.random_state is not self.np_random:
+      self._sampler = Sampler(self.np_random)
+    return self._sampler
+  
   def set_goal(self, goal):
     return self._reset(goal)
+  
+  def get_dynamics(self):
+    """Transition model of P as arrays, for all goals at once:
+      next_states: state X action, intended next state (terminal states stay)
+      hit_wall: state X action, whether the intended move hits a wall
+      state_rewards: goal X state, reward for arriving in a state (no wall)
+      terminal: state, whether a state is a goal
+    With probability p_rand, the next state is instead next_states[s,a'] for a
+    uniformly random a' (incl. STAY), without the r_wall penalty."""
+    s = np.arange(self.nS)
+    y, x = s // self.max_x, s % self.max_x
+    next_states = np.stack([np.where(y == 0, s, s - self.max_x), # UP
+                            np.where(x == self.max_x - 1, s, s + 1), # RIGHT
+                            np.where(y == self.max_y - 1, s, s + self.max_x), # DOWN
+                            np.where(x == 0, s, s - 1), # LEFT
+                            s], axis = 1) # STAY
+    terminal = np.isin(s, self.goal_locs)
+    next_states[terminal] = s[terminal, None]
+    hit_wall = next_states == s[:, None]
+    hit_wall[:, STAY] = False
+    hit_wall[terminal] = False
+    state_rewards = np.full((self.nG, self.nS), float(self.r_step))
+    state_rewards[:, self.goal_locs] = self.r_incorrect
+    state_rewards[np.arange(self.nG), self.goal_locs] = self.r_correct
+    return Dynamics(next_states = next_states, hit_wall = hit_wall,
+                    state_rewards = state_rewards, terminal = terminal,
+                    r_wall = self.r_wall, p_rand = self.p_rand)
+  
+  def get_transition_model(self):
+    """Transition model from get_dynamics: T, a sparse Transitions with
+    nA + 1 outcomes per (state, action), the intended move and each action's
+    random one (so memory is linear in nS; see expected_next and
+    push_forward), and R, goal X state X action expected rewards. Outcomes
+    may repeat a next state, their probabilities adding up.
+    Terminal states are absorbing with zero reward (episodes end there)."""
+    dyn = self.get_dynamics()
+    s = np.arange(self.nS)
+    next_states = np.empty((self.nS, self.nA, self.nA + 1), dtype = dyn.next_states.dtype)
+    probs = np.empty((self.nS, self.nA, self.nA + 1))
+    next_states[:, :, 0] = dyn.next_states
+    probs[:, :, 0] = 1 - dyn.p_rand
+    R = (1 - dyn.p_rand) * (dyn.state_rewards[:, dyn.next_states] + dyn.r_wall * dyn.hit_wall)
+    # random transitions: each action's outcome w.p. p_rand/nA, no wall penalty
+    next_states[:, :, 1:] = dyn.next_states[:, None, :]
+    probs[:, :, 1:] = dyn.p_rand / self.nA
+    R += dyn.p_rand / self.nA * np.sum(dyn.state_rewards[:, dyn.next_states], axis = 2)[:, :, None]
+    terminal = np.flatnonzero(dyn.terminal)
+    next_states[terminal] = terminal[:, None, None]
+    probs[terminal] = 0
+    probs[terminal, :, 0] = 1
+    R[:, terminal] = 0
+    return Transitions(next_states = next_states, probs = probs), R
 
   def _render(self, mode = 'human', close = False, bob_state = None):
       if close: return
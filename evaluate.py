@@ -0,0 +1,273 @@
+import os
+import sys
+import importlib.util
+import json
+import numpy as np
+if "../" not in sys.path: sys.path.append("../")
+from envs.TwoGoalGridWorld import TwoGoalGridWorld, STAY
+from envs.BatchedTwoGoalGridWorld import BatchedTwoGoalGridWorld
+from agents.numpy_observer import load_observer, WEIGHTS_FILE
+from agents.bayes_observer import BayesBob
+from util.results_store import load_results
+from util.sampling import inverse_cdf
+
+EVALUATION_FILE = 'evaluation.json'
+EVALUATION_DIRECTORY = 'evaluation/' # figures
+PERCENTILES = [5, 25, 50, 75, 95]
+KL_THRESH = .8 # alice kl (bits) after which bob_goal_access = 'delayed' reveals the goal
+
+def _load_source(name, path):
+  """Imports a config file copied into a run's directory (imp.load_source)."""
+  spec = importlib.util.spec_from_file_location(name, path)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+def evaluate(experiment_name, results_directory = None, n_episodes = 10000,
+             seed = 0, plot = True, bayes_bob = 'greedy'):
+  """Evaluates a trained alice or bob run over n_episodes vectorized episodes,
+  without TF: alice from her policy table, bob from his exported weights
+  (exported from bob/bob.ckpt, which does need TF, if an older run lacks
+  them). Saves metrics to <run>/evaluation.json (and figures to
+  <run>/evaluation/) and returns them.
+  Unless bayes_bob is None, also evaluates a BayesBob (mode bayes_bob) with
+  alice, under 'bayes_bob': the bob baseline with the exact goal posterior."""
+
+  if results_directory is None: results_directory = os.getcwd()+'/results/'
+  directory = results_directory+experiment_name+'/'
+  env_config = _load_source('env_config', directory+'env_config.py')
+  env_param, _ = env_config.get_config()
+  env = make_env(env_param)
+
+  if os.path.exists(directory+'bob_config.py'):
+    bob_config = _load_source('bob_config', directory+'bob_config.py')
+    _, training_param, _, alice_experiment = bob_config.get_config()
+    result = load_results(directory)
+    alice_policy = load_alice_policy(results_directory+alice_experiment+'/', directory+'alice/')
+    state_goal_counts = result.alice.state_goal_counts
+    bob = load_bob(directory+'bob/')
+    evaluation = rollout(env, alice_policy, n_episodes, training_param.max_episode_length,
+                         bob = bob, bob_goal_access = training_param.bob_goal_access,
+                         state_goal_counts = state_goal_counts, seed = seed)
+  else:
+    alice_config = _load_source('alice_config', directory+'alice_config.py')
+    _, training_param, _ = alice_config.get_config()
+    alice_policy = load_alice_policy(directory)
+    state_goal_counts = load_results(directory).state_goal_counts
+    evaluation = rollout(env, alice_policy, n_episodes, training_param.max_episode_length,
+                         state_goal_counts = state_goal_counts, seed = seed)
+
+  metrics = summarize(evaluation, env)
+  if bayes_bob is not None:
+    baseline = BayesBob(env, alice_policy, discount_factor = training_param.discount_factor,
+                        mode = bayes_bob)
+    bayes_evaluation = rollout(env, alice_policy, n_episodes, training_param.max_episode_length,
+                               bob = baseline, state_goal_counts = state_goal_counts, seed = seed)
+    metrics['bayes_bob'] = dict(summarize(bayes_evaluation, env)['bob'], mode = bayes_bob)
+  metrics.update({'experiment': experiment_name, 'n_episodes': n_episodes, 'seed': seed})
+  with open(directory+EVALUATION_FILE+'.tmp', 'w') as f:
+    json.dump(metrics, f, indent = 2)
+  os.replace(directory+EVALUATION_FILE+'.tmp', directory+EVALUATION_FILE)
+  print('Saved evaluation to %s.' % (directory+EVALUATION_FILE))
+  if plot:
+    from plotting.plot_evaluation import plot_evaluation
+    plot_evaluation(evaluation, metrics, directory+EVALUATION_DIRECTORY)
+    print('Saved evaluation figures.')
+  return metrics
+
+def make_env(env_param):
+  return TwoGoalGridWorld(shape = env_param.shape,
+                          r_correct = env_param.r_correct,
+                          r_incorrect = env_param.r_incorrect,
+                          r_step = env_param.r_step,
+                          r_wall = env_param.r_wall,
+                          p_rand = env_param.p_rand,
+                          goal_locs = env_param.goal_locs,
+                          goal_dist = env_param.goal_dist)
+
+def load_alice_policy(directory, checkpoint_directory = None):
+  """Alice's policy table (state X goal X action): action_probs from her
+  results, else softmax of the logits in checkpoint_directory+'alice.ckpt'."""
+  if os.path.exists(directory):
+    action_probs = getattr(load_results(directory), 'action_probs', None)
+    if action_probs is not None: return np.asarray(action_probs)
+  if checkpoint_directory is None: raise ValueError('no policy found for alice in %s' % directory)
+  import tensorflow as tf
+  reader = tf.train.NewCheckpointReader(checkpoint_directory+'alice.ckpt')
+  logits = reader.get_tensor('alice/policy_logits') # goal X state X action
+  logits = logits - logits.max(axis = 2, keepdims = True)
+  policy = np.exp(logits) / np.exp(logits).sum(axis = 2, keepdims = True)
+  return np.transpose(policy, (1, 0, 2))
+
+def load_bob(directory):
+  """NumpyObserver for the bob saved in directory, exporting his weights from
+  the checkpoint first if needed."""
+  if not os.path.exists(directory+WEIGHTS_FILE):
+    from agents.bob import export_weights
+    export_weights(directory+'bob.ckpt', directory+WEIGHTS_FILE)
+  return load_observer(directory)
+
+def action_kls(policy):
+  """KL (bits) of alice's policy from her goal-averaged policy, state X goal,
+  as TabularREINFORCE.get_kl (ASSUMES UNIFORM P(G))."""
+  base = policy.mean(axis = 1, keepdims = True)
+  with np.errstate(divide = 'ignore', invalid = 'ignore'):
+    terms = np.where(policy > 0, policy * np.log2(policy / base), 0.)
+  return terms.sum(axis = 2)
+
+def log_state_odds(state_goal_counts):
+  """log2 p(s|g)/p(s), state X goal, from state-goal visit counts."""
+  counts = np.asarray(state_goal_counts, dtype = float)
+  ps_g = counts / counts.sum(axis = 0)
+  ps = counts.sum(axis = 1, keepdims = True) / counts.sum()
+  with np.errstate(divide = 'ignore', invalid = 'ignore'):
+    return np.log2(ps_g / ps)
+
+def rollout(env, alice_policy, n_episodes, max_episode_length, bob = None,
+            bob_goal_access = None, state_goal_counts = None, seed = None):
+  """Runs n_episodes episodes at once, stepped as in the training loops:
+  alice moves first (and STAYs once done), then bob, who sees alice's
+  (state, action) pairs so far; an episode ends once both are done or after
+  max_episode_length+1 steps. Returns a dict of per-episode arrays (episode X)
+  and per-step arrays (step X episode)."""
+  rng = np.random.RandomState(seed)
+  alice_env = BatchedTwoGoalGridWorld(env, n_episodes, seed = rng.randint(2**31))
+  alice_states, goals = alice_env.reset()
+  kls = action_kls(alice_policy)
+  alice = {'length': np.zeros(n_episodes, dtype = int), 'return': np.zeros(n_episodes),
+           'kl': np.zeros(n_episodes)}
+  steps = {'alice_states': [], 'alice_active': []}
+  if bob is not None:
+    bob_env = BatchedTwoGoalGridWorld(env, n_episodes, seed = rng.randint(2**31))
+    bob_states, _ = bob_env.reset(goals)
+    h = bob.initial_state(n_episodes) if bob.use_RNN else None
+    bob_stats = {'length': np.zeros(n_episodes, dtype = int), 'return': np.zeros(n_episodes)}
+    # bob's goal estimate, if he decodes one (BayesBob), else his z
+    decodes = hasattr(bob, 'decode')
+    steps['decoded' if decodes else 'z'] = []
+  alice_done = np.zeros(n_episodes, dtype = bool)
+  bob_done = np.zeros(n_episodes, dtype = bool)
+
+  for t in range(1, max_episode_length + 2):
+
+    # alice steps (STAY once done)
+    active = ~alice_done
+    actions = inverse_cdf(np.cumsum(alice_policy[alice_states, goals], axis = 1), rng.rand(n_episodes))
+    actions = np.where(active, actions, STAY)
+    alice['kl'] += np.where(active, kls[alice_states, goals], 0.)
+    steps['alice_states'].append(alice_states)
+    steps['alice_active'].append(active)
+    next_alice_states, rewards, alice_done = alice_env.step(actions)
+    alice['return'] += rewards
+    alice['length'][active] = t
+
+    # then bob, given alice's trajectory so far (or the goal)
+    if bob is not None:
+      if bob_goal_access is None:
+        h = bob.observe(h, alice_states, actions)
+        z = h
+      elif bob_goal_access == 'immediate':
+        z = np.where(goals == 0, -1., +1.)[:, None]
+      elif bob_goal_access == 'delayed':
+        z = np.where(alice['kl'] > KL_THRESH, np.where(goals == 0, -1., +1.), 0.)[:, None]
+      bob_active = ~bob_done
+      bob_actions = inverse_cdf(np.cumsum(bob.action_probs(bob_states, z), axis = 1), rng.rand(n_episodes))
+      bob_states, rewards, bob_done = bob_env.step(np.where(bob_active, bob_actions, STAY))
+      bob_stats['return'] += rewards
+      bob_stats['length'][bob_active] = t
+      if decodes: steps['decoded'].append(np.where(bob_active, bob.decode(z), -1))
+      else: steps['z'].append(np.where(bob_active, z[:, 0], np.nan))
+    else:
+      bob_done = alice_done
+
+    alice_states = next_alice_states
+    if (alice_done & bob_done).all(): break
+
+  alice['success'] = alice_states == alice_env.goal_locs[goals]
+  alice['done'] = alice_done
+  steps = {k: np.array(v) for k, v in steps.items()}
+  # state info with the counts alice trained with, else those of this evaluation
+  if state_goal_counts is None:
+    state_goal_counts = np.zeros((env.nS, env.nG))
+    visited = steps['alice_active']
+    np.add.at(state_goal_counts, (steps['alice_states'][visited],
+                                  np.broadcast_to(goals, visited.shape)[visited]), 1)
+  lso = log_state_odds(state_goal_counts)
+  alice['lso'] = np.where(steps['alice_active'], lso[steps['alice_states'], goals], 0.).sum(axis = 0)
+  evaluation = {'goals': goals, 'alice': alice, 'steps': steps}
+  if bob is not None:
+    bob_stats['success'] = bob_states == alice_env.goal_locs[goals]
+    bob_stats['done'] = bob_done
+    evaluation['bob'] = bob_stats
+  return evaluation
+
+def goal_decoding(z, goals, n_goals):
+  """Accuracy, per step, of decoding the goal from bob's z with the
+  nearest class mean (over all steps); z is step X episode, NaN where bob
+  is done. Returns accuracies (NaN for steps without data) and the means."""
+  valid = np.isfinite(z)
+  goals = np.broadcast_to(goals, z.shape)
+  means = np.array([z[valid & (goals == g)].mean() if (valid & (goals == g)).any() else np.nan
+                    for g in range(n_goals)])
+  decoded = np.argmin(np.abs(np.where(valid, z, 0.)[..., None] - np.where(np.isnan(means), np.inf, means)), axis = -1)
+  correct = (decoded == goals) & valid
+  counts = valid.sum(axis = 1)
+  with np.errstate(invalid = 'ignore'):
+    accuracy = correct.sum(axis = 1) / counts
+  return accuracy, means
+
+def _distribution(x):
+  x = np.asarray(x, dtype = float)
+  summary = {'mean': float(x.mean()), 'std': float(x.std()),
+             'min': float(x.min()), 'max': float(x.max())}
+  for p, v in zip(PERCENTILES, np.percentile(x, PERCENTILES)): summary['p%i' % p] = float(v)
+  values, counts = np.unique(x, return_counts = True)
+  if len(values) <= 20: # e.g. returns with no step/wall rewards
+    summary['histogram'] = {'values': values.tolist(), 'counts': counts.tolist()}
+  else:
+    counts, edges = np.histogram(x, bins = 20)
+    summary['histogram'] = {'edges': edges.tolist(), 'counts': counts.tolist()}
+  return summary
+
+def _agent_metrics(stats):
+  return {'success_rate': float(stats['success'].mean()),
+          'timeout_rate': float(1 - stats['done'].mean()),
+          'return': _distribution(stats['return']),
+          'episode_length': _distribution(stats['length'])}
+
+def summarize(evaluation, env):
+  """json-able metrics of a rollout."""
+  alice = evaluation['alice']
+  metrics = {'alice': _agent_metrics(alice)}
+  steps = alice['length'].sum()
+  metrics['alice'].update({'action_info': float(alice['kl'].sum() / steps), # bits per step
+                           'state_info': float(alice['lso'].sum() / steps),
+                           'episode_action_kl': _distribution(alice['kl']),
+                           'episode_lso': _distribution(alice['lso'])})
+  if 'bob' in evaluation:
+    bob = evaluation['bob']
+    metrics['bob'] = _agent_metrics(bob)
+    metrics['bob'].update({'win_rate': float((bob['length'] < alice['length']).mean()),
+                           'win_or_tie_rate': float((bob['length'] <= alice['length']).mean())})
+    steps = evaluation['steps']
+    if 'decoded' in steps:
+      valid = steps['decoded'] >= 0
+      with np.errstate(invalid = 'ignore'):
+        accuracy = ((steps['decoded'] == evaluation['goals']) & valid).sum(axis = 1) / valid.sum(axis = 1)
+      means = None
+    else:
+      accuracy, means = goal_decoding(steps['z'], evaluation['goals'], env.nG)
+      means = [None if np.isnan(m) else float(m) for m in means]
+    metrics['bob']['goal_decoding'] = {'accuracy_by_step': [None if np.isnan(a) else float(a) for a in accuracy],
+                                       'z_means': means, 'n_goals': env.nG}
+  return metrics
+
+if __name__ == "__main__":
+  # usage: python evaluate.py EXPERIMENT_NAME [N_EPISODES]
+  n_episodes = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+  metrics = evaluate(sys.argv[1], n_episodes = n_episodes)
+  for agent in ['alice', 'bob']:
+    if agent in metrics:
+      print('%s: success rate %.3f, mean return %.3f, mean episode length %.2f' %
+            (agent, metrics[agent]['success_rate'], metrics[agent]['return']['mean'],
+             metrics[agent]['episode_length']['mean']))
@@ -1,12 +1,13 @@
 import itertools
-import copy
 import os
-import pickle
 import tensorflow as tf
 import numpy as np
 from envs.TwoGoalGridWorld import TwoGoalGridWorld
+from envs.JointTwoGoalGridWorld import JointTwoGoalGridWorld
 from agents.bob import RNNObserver
 from agents.alice import TabularREINFORCE
+from util.results_store import load_results
+from util.sampling import Sampler
 
 def play_from_directory(experiment_name):
   
@@ -15,8 +16,8 @@ def play_from_directory(experiment_name):
   os.chdir(directory)
   #sys.path.append('/results/'+experiment_name)
   
-  # unpickle results
-  results = pickle.load(open(directory+'results.pkl','rb'))
+  # load results
+  results = load_results(directory)
   
   # import configs
   import alice_config
@@ -64,14 +65,14 @@ def play_from_directory(experiment_name):
   return
 
 def play(env, alice, bob, state_goal_counts = None,
-         max_episode_length = 100, bob_goal_access = None, gamma = None):
+         max_episode_length = 100, bob_goal_access = None, gamma = None,
+         sampler = None):
   # if alice.use_state_info, need to include her state_goal_counts
+  # sampler: util.sampling.Sampler for actions (e.g. the trainer's)
+  if sampler is None: sampler = Sampler()
   
-  alice_env = env
-  bob_env = copy.copy(alice_env)
-  
-  alice_state, goal = alice_env._reset()
-  bob_state, _ = bob_env.set_goal(goal)
+  joint_env = JointTwoGoalGridWorld(env)
+  alice_state, bob_state, goal = joint_env.reset()
   
   alice_states = []
   alice_actions = []
@@ -92,19 +93,19 @@ def play(env, alice, bob, state_goal_counts = None,
   
   # draw initial env
   print('')
-  alice_env._render(bob_state = bob_state)
+  env._render(bob_state = bob_state)
   print('')
   
   # one step in the environment
   for t in itertools.count(start = 1):
+    alice_active, bob_active = not alice_done, not bob_done
     
     # first alice
-    if not alice_done:
+    if alice_active:
       
-      # take a step
+      # pick an action
       alice_action_probs, alice_value = alice.predict(alice_state, goal)
-      alice_action = np.random.choice(np.arange(len(alice_action_probs)), p = alice_action_probs)
-      next_alice_state, alice_reward, alice_done, _ = alice_env.step(alice_action)
+      alice_action = sampler.choice(alice_action_probs)
 
       # update stats
       if alice.use_action_info:
@@ -113,31 +114,14 @@ def play(env, alice, bob, state_goal_counts = None,
         ps_g = state_goal_counts[alice_state, goal] / np.sum(state_goal_counts[:,goal])
         ps = np.sum(state_goal_counts[alice_state,:]) / np.sum(state_goal_counts)
         total_lso += np.log2(ps_g/ps)
-        
-      alice_total_reward += alice_reward
-      alice_episode_length = t
        
     else: # if done, sit still
-      alice_action = alice_env.action_to_index['STAY']
-      next_alice_state = alice_state
+      alice_action = env.action_to_index['STAY']
     alice_states.append(alice_state)
     alice_actions.append(alice_action)
     
-    # draw env with alice step
-    if draw_alice:
-      if total_kl is not None: kl_str = ', tot kl = %.2f' % total_kl
-      else: kl_str = ''
-      if total_lso is not None: lso_str = ', tot lso = %.2f' % total_lso
-      else: lso_str = ''
-      print('alice step %i: reward = %i%s%s, action: %s' %
-            (t, alice_total_reward, kl_str, lso_str, env.index_to_action[alice_action]))
-      print('')
-      alice_env._render(bob_state = bob_state)
-      print('')
-      if alice_done: draw_alice = False # only draw alice step first step after done
-      
-    # then bob takes a step
-    if not bob_done:
+    # then bob picks an action
+    if bob_active:
       if bob_goal_access is None:
         bob_action_probs, bob_value, z, logits = bob.predict(state = bob_state,
                                                              obs_states = alice_states,
@@ -156,13 +140,35 @@ def play(env, alice, bob, state_goal_counts = None,
           z = [0]
         bob_action_probs, bob_value, _, logits = bob.predict(state = bob_state,
                                                              z = z)
-      bob_action = np.random.choice(np.arange(len(bob_action_probs)), p = bob_action_probs)
-      next_bob_state, bob_reward, bob_done, _ = bob_env.step(bob_action)
+      bob_action = sampler.choice(bob_action_probs)
+    else: # if done, sit still
+      bob_action = env.action_to_index['STAY']
+    
+    # both take their step
+    next_states, rewards, dones = joint_env.step(alice_action, bob_action)
+    next_alice_state, next_bob_state = next_states
+    alice_reward, bob_reward = rewards
+    alice_done, bob_done = dones
+    if alice_active:
+      alice_total_reward += alice_reward
+      alice_episode_length = t
+    if bob_active:
       bob_total_reward += bob_reward
       bob_rewards.append(bob_reward)
       bob_episode_length = t
-    else: # if done, sit still
-      next_bob_state = bob_state
+    
+    # draw env with alice step
+    if draw_alice:
+      if total_kl is not None: kl_str = ', tot kl = %.2f' % total_kl
+      else: kl_str = ''
+      if total_lso is not None: lso_str = ', tot lso = %.2f' % total_lso
+      else: lso_str = ''
+      print('alice step %i: reward = %i%s%s, action: %s' %
+            (t, alice_total_reward, kl_str, lso_str, env.index_to_action[alice_action]))
+      print('')
+      env._render(bob_state = bob_state)
+      print('')
+      if alice_done: draw_alice = False # only draw alice step first step after done
     
     # draw env with bob step
     if draw_bob:
@@ -182,7 +188,7 @@ def play(env, alice, bob, state_goal_counts = None,
              logits[env.action_to_index['DOWN']],
              logits[env.action_to_index['STAY']]))
       print('')
-      alice_env._render(bob_state = next_bob_state)
+      env._render(bob_state = next_bob_state)
       print('')
       if bob_done: draw_bob = False # only draw bob step first step after done
 
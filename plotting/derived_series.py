@@ -0,0 +1,119 @@
+import os
+import numpy as np
+import pandas as pd
+from util.stats import first_time_to
+from util.columns import as_views
+
+# rolling means are saved in <run directory>/DERIVED_DIRECTORY/ if persisted
+DERIVED_DIRECTORY = 'derived/'
+
+def rolling_mean(y, window):
+  """pd.Series(y).rolling(window, min_periods = window).mean() as an O(n)
+  cumulative-sum kernel: NaN until the window holds window finite values."""
+  y = np.asarray(y, dtype = float)
+  out = np.full(len(y), np.nan)
+  if len(y) < window: return out
+  valid = np.isfinite(y)
+  values = np.where(valid, y, 0.)
+  # centering before summing keeps the differences of sums accurate
+  offset = values[valid].mean() if valid.any() else 0.
+  sums = np.concatenate([[0.], np.cumsum(np.where(valid, values - offset, 0.))])
+  counts = np.concatenate([[0], np.cumsum(valid)])
+  full = counts[window:] - counts[:-window] == window
+  out[window-1:] = np.where(full, (sums[window:] - sums[:-window])/window + offset, np.nan)
+  return out
+
+def _fields(stats):
+  return dict(as_views(stats)._asdict())
+
+class RunSeries:
+  """Series derived from one run's stats (alice stats, or a bob Result with
+  alice and bob), each computed once. Rolling means are memoized by
+  (agent, series, window) and, if directory is given, saved under
+  directory+DERIVED_DIRECTORY, so later plots of the run reuse them.
+
+  Series: episode_lengths, episode_rewards, cumulative_steps,
+  cumulative_rewards, action_info and state_info (per-step kl/lso),
+  total_steps and steps_per_reward (first_time_to), and for bob runs
+  bob_over_alice (steps per reward over alice's average), bob_wins and
+  bob_wins_or_ties (bob's episode shorter than / no longer than alice's).
+  """
+
+  def __init__(self, result, directory = None):
+    # stats as plain dicts, so a RunSeries can be pickled (e.g. to plot in
+    # another process) whatever namedtuple class the stats came in
+    if hasattr(result, 'bob'):
+      self.stats = {'alice': _fields(result.alice), 'bob': _fields(result.bob)}
+      self.two_agents = True
+    else:
+      stats = _fields(result)
+      self.stats = {'alice': stats, 'bob': stats} # as in plot_episode_stats
+      self.two_agents = False
+    self.directory = directory
+    self._series = {}
+    self._rolling = {}
+
+  def _agent(self, agent):
+    return agent if self.two_agents else 'alice'
+
+  def series(self, agent, name):
+    """Derived series, or None if the stats don't have what it needs."""
+    key = (self._agent(agent), name)
+    if key not in self._series: self._series[key] = self._compute(key[0], name)
+    return self._series[key]
+
+  def _compute(self, agent, name):
+    stats = self.stats[agent]
+    if name in ['episode_lengths', 'episode_rewards']:
+      return np.asarray(stats[name])
+    if name == 'cumulative_steps': return np.cumsum(stats['episode_lengths'])
+    if name == 'cumulative_rewards': return np.cumsum(stats['episode_rewards'])
+    if name in ['action_info', 'state_info']:
+      totals = stats.get('episode_action_kl' if name == 'action_info' else 'episode_lso')
+      if totals is None: return None
+      return np.asarray(totals)/np.asarray(stats['episode_lengths'])
+    if name in ['total_steps', 'steps_per_reward']:
+      if stats.get('total_steps') is not None: # saved by the trainers
+        total_steps, steps_per_reward = np.asarray(stats['total_steps']), np.asarray(stats['steps_per_reward'])
+      else:
+        total_steps, steps_per_reward = first_time_to(stats['episode_lengths'], stats['episode_rewards'])
+      self._series[(agent, 'total_steps')] = total_steps
+      self._series[(agent, 'steps_per_reward')] = steps_per_reward
+      return total_steps if name == 'total_steps' else steps_per_reward
+    if not self.two_agents: return None
+    if name == 'bob_over_alice':
+      return self.series('bob', 'steps_per_reward')/self.average_steps_per_reward('alice')
+    if name == 'bob_wins':
+      return self.series('bob', 'episode_lengths') < self.series('alice', 'episode_lengths')
+    if name == 'bob_wins_or_ties':
+      return self.series('bob', 'episode_lengths') <= self.series('alice', 'episode_lengths')
+    raise ValueError('unknown series %s' % name)
+
+  def average_steps_per_reward(self, agent):
+    """Steps per reward over the whole run."""
+    return np.sum(self.series(agent, 'episode_lengths'))/np.sum(self.series(agent, 'episode_rewards'))
+
+  def rolling(self, agent, name, window):
+    """Rolling mean of a series over window entries (NaN for the first
+    window-1), as a pd.Series like pd.Series(...).rolling(window,
+    min_periods = window).mean(); None if the series is."""
+    key = (self._agent(agent), name, window)
+    if key not in self._rolling:
+      y = self.series(agent, name)
+      if y is None: return None
+      self._rolling[key] = pd.Series(self._load_or_compute(key, y))
+    return self._rolling[key]
+
+  def _load_or_compute(self, key, y):
+    if self.directory is None: return rolling_mean(y, key[2])
+    path = self.directory + DERIVED_DIRECTORY + '%s.%s.rolling%i.npy' % key
+    if os.path.exists(path):
+      smoothed = np.load(path)
+      if len(smoothed) == len(y): return smoothed # else stale
+    smoothed = rolling_mean(y, key[2])
+    os.makedirs(self.directory + DERIVED_DIRECTORY, exist_ok = True)
+    # written under a temporary name, as figures may be drawn concurrently
+    with open(path+'.%i.tmp' % os.getpid(), 'wb') as f:
+      np.save(f, smoothed)
+    os.rename(path+'.%i.tmp' % os.getpid(), path)
+    return smoothed
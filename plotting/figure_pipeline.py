@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import pickle
+import tempfile
+import threading
+import traceback
+import subprocess
+import multiprocessing
+import queue
+from io import BytesIO
+import matplotlib.pyplot as plt
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIRECTORY not in sys.path: sys.path.append(REPO_DIRECTORY)
+
+DONE = '.done' # completion marker, written next to a figure's files
+FORMATS = ['pdf', 'png']
+
+# set while a pipeline worker runs a plotting function: save_figure then
+# hands rendered bytes back to the pipeline instead of writing files
+_rendered = None
+
+def save_figure(path, formats = FORMATS, fig = None):
+  """Saves fig (default: the current figure) as path.<format> for each format.
+  Plotting functions save through this, so the figure pipeline can render
+  them in worker processes and write the files elsewhere."""
+  fig = fig or plt.gcf()
+  for fmt in formats:
+    if _rendered is None:
+      fig.savefig(path+'.'+fmt, format = fmt)
+    else:
+      buffer = BytesIO()
+      fig.savefig(buffer, format = fmt)
+      _rendered.append((path, fmt, buffer.getvalue()))
+
+def _render(fn, args, kwargs):
+  """Runs a plotting function in a worker, returning what it saved as a list
+  of (path, format, bytes) and the seconds it took."""
+  global _rendered
+  _rendered = []
+  start = time.time()
+  try:
+    fn(*args, **kwargs)
+    return _rendered, time.time() - start
+  finally:
+    _rendered = None
+    plt.close('all')
+
+def _init_worker():
+  plt.switch_backend('Agg')
+
+class FigurePipeline:
+  """Renders figures in a pool of worker processes (Agg backend) while a
+  background thread writes their files, each file to a temporary name that
+  is then renamed, followed by a path.done marker per figure (json with the
+  formats written and render time).
+
+  Tasks are plotting functions that save through save_figure (e.g.
+  plot_value_map with noshow = True and a directory); functions and
+  arguments must be picklable.
+
+  Usage:
+    with FigurePipeline(processes = 4) as pipeline:
+      pipeline.submit(plot_value_map, values, action_probs, env, figure_sizes,
+                      noshow = True, directory = directory)
+  """
+
+  def __init__(self, processes = None, verbose = True):
+    self.verbose = verbose
+    self.pool = multiprocessing.Pool(processes, initializer = _init_worker)
+    self.to_write = queue.Queue()
+    self.errors = []
+    self.lock = threading.Lock()
+    self.writer = threading.Thread(target = self._write_loop)
+    self.writer.daemon = True
+    self.writer.start()
+
+  def submit(self, fn, *args, **kwargs):
+    name = getattr(fn, '__name__', repr(fn))
+    self.pool.apply_async(_render, (fn, args, kwargs),
+                          callback = self.to_write.put,
+                          error_callback = lambda e: self._failed(name, e))
+
+  def _failed(self, name, e):
+    message = '%s failed: %s' % (name, ''.join(traceback.format_exception_only(type(e), e)).strip())
+    print('Figure pipeline: %s' % message)
+    with self.lock:
+      self.errors.append(message)
+
+  def _write_loop(self):
+    while True:
+      item = self.to_write.get()
+      if item is None: return
+      rendered, seconds = item
+      formats = {}
+      try:
+        for path, fmt, data in rendered:
+          directory = os.path.dirname(path)
+          if directory and not os.path.exists(directory): os.makedirs(directory)
+          with open(path+'.'+fmt+'.tmp', 'wb') as f:
+            f.write(data)
+          os.rename(path+'.'+fmt+'.tmp', path+'.'+fmt)
+          formats.setdefault(path, []).append(fmt)
+        for path, fmts in formats.items():
+          with open(path+DONE, 'w') as f:
+            json.dump({'formats': fmts, 'render_seconds': seconds, 'written': time.time()}, f)
+          if self.verbose: print('Saved figure %s (%s)' % (path, ', '.join(fmts)))
+      except Exception as e:
+        self._failed('writing %s' % ', '.join(formats), e)
+
+  def close(self):
+    """Waits for all figures to be rendered and written."""
+    self.pool.close()
+    self.pool.join()
+    self.to_write.put(None)
+    self.writer.join()
+    return self.errors
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+def run_detached(tasks, directory, processes = None):
+  """Renders tasks, a list of (fn, args, kwargs), in a separate background
+  process, so the caller (e.g. a training job) can return right away; that
+  process's output goes to directory+'figures.log'. Check for the .done
+  markers to see which figures are finished."""
+  if not os.path.exists(directory): os.makedirs(directory)
+  with tempfile.NamedTemporaryFile(suffix = '.pkl', prefix = 'figures_', dir = directory, delete = False) as f:
+    pickle.dump({'tasks': tasks, 'processes': processes}, f, pickle.HIGHEST_PROTOCOL)
+  env = dict(os.environ, MPLBACKEND = 'Agg')
+  with open(directory+'figures.log', 'a') as log:
+    return subprocess.Popen([sys.executable, '-m', 'plotting.figure_pipeline', f.name],
+                            cwd = REPO_DIRECTORY, env = env, stdout = log, stderr = subprocess.STDOUT,
+                            start_new_session = True)
+
+if __name__ == "__main__":
+  # usage (via run_detached): python -m plotting.figure_pipeline TASKS.pkl
+  path = sys.argv[1]
+  with open(path, 'rb') as f:
+    job = pickle.load(f)
+  pipeline = FigurePipeline(processes = job['processes'])
+  for fn, args, kwargs in job['tasks']: pipeline.submit(fn, *args, **kwargs)
+  errors = pipeline.close()
+  os.remove(path)
+  sys.exit(1 if errors else 0)
@@ -0,0 +1,196 @@
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+
+# levels are built until they have fewer than MIN_BINS bins
+MIN_BINS = 256
+LOD_DIRECTORY = 'lod/'
+
+class Pyramid:
+  """Multi-resolution summary of a line series for plotting. Level k bins
+  factor**k consecutive points and keeps, per bin, the first, min, max and
+  last points (the M4 reduction) plus the bin mean. Drawing the first/min/max/
+  last polyline of a level with at least as many bins as the figure has pixel
+  columns renders identically to drawing every point, with ~4 points per pixel.
+  Non-finite points (e.g. the warm-up of rolling means) are dropped."""
+
+  def __init__(self, x = None, y = None, factor = 4, min_bins = MIN_BINS):
+    self.factor = factor
+    self.levels = [] # dicts of polyline x, y (n_bins X 4), mean, count
+    self.raw = None # (x, y); loaded pyramids only keep it for short series
+    self.n = 0
+    if y is None: return # filled in by load_pyramid
+    if x is None and hasattr(y, 'index'): x = y.index.values # pandas series
+    y = np.asarray(y, dtype = float)
+    x = np.arange(len(y), dtype = float) if x is None else np.asarray(x, dtype = float)
+    keep = np.isfinite(y)
+    self.raw = (x[keep], y[keep])
+    self.n = int(np.sum(keep))
+    level = _first_level(self.raw[0], self.raw[1], factor)
+    while level is not None:
+      self.levels.append(level)
+      if len(level['count']) < min_bins * factor: break
+      level = _merge(level, factor)
+
+  def _level_for(self, pixels):
+    """Coarsest level with at least pixels bins, or None."""
+    level = None
+    for candidate in self.levels:
+      if len(candidate['count']) < pixels: break
+      level = candidate
+    return level
+
+  def polyline(self, pixels = None):
+    """Points to draw for a figure pixels wide: the raw series if it is small
+    (or pixels is None), else the coarsest level with >= pixels bins."""
+    if self.raw is not None and (pixels is None or self.n <= 4 * pixels): return self.raw
+    level = self._level_for(pixels)
+    if level is None:
+      if self.raw is not None: return self.raw
+      level = self.levels[0] # finest stored level
+    return level['x'].ravel(), level['y'].ravel()
+
+  def mean(self, pixels):
+    """Bin centers and means of the coarsest level with >= pixels bins."""
+    level = self._level_for(pixels)
+    if level is None:
+      if self.raw is not None: return self.raw
+      level = self.levels[0]
+    return level['x'].mean(axis = 1), level['mean']
+
+def _first_level(x, y, factor):
+  n = len(y)
+  if n < 2 * factor: return None
+  n_bins = -(-n // factor)
+  pad = n_bins * factor - n
+  xb = np.concatenate([x, np.full(pad, np.nan)]).reshape(n_bins, factor)
+  yb = np.concatenate([y, np.full(pad, np.nan)]).reshape(n_bins, factor)
+  rows = np.arange(n_bins)
+  count = np.full(n_bins, factor)
+  count[-1] = factor - pad
+  i_min = np.nanargmin(yb, axis = 1)
+  i_max = np.nanargmax(yb, axis = 1)
+  first = np.zeros(n_bins, dtype = int)
+  last = count - 1
+  return _level(xb[rows, first], yb[rows, first], xb[rows, i_min], yb[rows, i_min],
+                xb[rows, i_max], yb[rows, i_max], xb[rows, last], yb[rows, last],
+                np.nansum(yb, axis = 1) / count, count)
+
+def _merge(level, factor):
+  """Next coarser level: groups of factor consecutive bins."""
+  n = len(level['count'])
+  n_bins = -(-n // factor)
+  pad = n_bins * factor - n
+  def group(a, fill):
+    return np.concatenate([a, np.full(pad, fill)]).reshape(n_bins, factor)
+  rows = np.arange(n_bins)
+  count = group(level['count'], 0)
+  total = count.sum(axis = 1)
+  last = (count > 0).sum(axis = 1) - 1
+  # min and max of each bin are in columns 1 and 2, in x order
+  bins = np.arange(n)
+  j_min = 1 + np.argmin(level['y'][:,1:3], axis = 1)
+  j_max = 1 + np.argmax(level['y'][:,1:3], axis = 1)
+  x_min, y_min = group(level['x'][bins, j_min], np.nan), group(level['y'][bins, j_min], np.inf)
+  x_max, y_max = group(level['x'][bins, j_max], np.nan), group(level['y'][bins, j_max], -np.inf)
+  i_min, i_max = np.argmin(y_min, axis = 1), np.argmax(y_max, axis = 1)
+  x_first, y_first = group(level['x'][:,0], np.nan), group(level['y'][:,0], np.nan)
+  x_last, y_last = group(level['x'][:,3], np.nan), group(level['y'][:,3], np.nan)
+  means = group(level['mean'] * level['count'], 0.)
+  return _level(x_first[:,0], y_first[:,0], x_min[rows, i_min], y_min[rows, i_min],
+                x_max[rows, i_max], y_max[rows, i_max], x_last[rows, last], y_last[rows, last],
+                means.sum(axis = 1) / total, total)
+
+def _level(x_first, y_first, x_min, y_min, x_max, y_max, x_last, y_last, mean, count):
+  # per bin, points ordered first, min, max, last; min and max swap if the
+  # max comes first, so the polyline visits them in x order
+  swap = x_max < x_min
+  x = np.stack([x_first, np.where(swap, x_max, x_min), np.where(swap, x_min, x_max), x_last], axis = 1)
+  y = np.stack([y_first, np.where(swap, y_max, y_min), np.where(swap, y_min, y_max), y_last], axis = 1)
+  return {'x': x, 'y': y, 'mean': mean, 'count': count}
+
+def lttb(x, y, n_out):
+  """Largest-triangle-three-buckets downsampling of (x, y) to n_out points;
+  an alternative to the M4 pyramid when a fixed point budget is wanted."""
+  x, y = np.asarray(x, dtype = float), np.asarray(y, dtype = float)
+  n = len(y)
+  if n_out >= n or n_out < 3: return x, y
+  edges = np.linspace(1, n-1, n_out-1).astype(int) # buckets between first and last
+  keep = np.empty(n_out, dtype = int)
+  keep[0], keep[-1] = 0, n-1
+  a = 0
+  for b in range(n_out-2):
+    lo, hi = edges[b], edges[b+1]
+    # average of the next bucket (or the last point)
+    if b+2 < len(edges): nlo, nhi = edges[b+1], edges[b+2]
+    else: nlo, nhi = n-1, n
+    x_avg, y_avg = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+    area = np.abs((x[a] - x_avg) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (y_avg - y[a]))
+    a = lo + int(np.argmax(area))
+    keep[b+1] = a
+  return x[keep], y[keep]
+
+def figure_pixels(fig = None):
+  """Width of a figure in pixels (an upper bound on the axes' width)."""
+  fig = fig or plt.gcf()
+  return int(np.ceil(fig.get_figwidth() * fig.dpi))
+
+def plot_lod(x, y = None, pixels = None, ax = None, mode = 'm4', **kwargs):
+  """Drop-in for plt.plot(x, y, **kwargs) (or plt.plot(y)) that draws only as
+  many points as the figure can show. x may also be a precomputed Pyramid.
+  mode = 'm4' (visually identical), 'mean' (bin means) or 'lttb'."""
+  ax = ax or plt.gca()
+  if pixels is None: pixels = figure_pixels(ax.figure)
+  if y is None and not isinstance(x, Pyramid): x, y = None, x
+  if mode == 'lttb':
+    if y is not None and x is None and hasattr(y, 'index'): x = y.index.values
+    y_ = np.asarray(y, dtype = float)
+    x_ = np.arange(len(y_), dtype = float) if x is None else np.asarray(x, dtype = float)
+    keep = np.isfinite(y_)
+    px, py = lttb(x_[keep], y_[keep], 4 * pixels)
+  else:
+    pyramid = x if isinstance(x, Pyramid) else Pyramid(x, y)
+    px, py = pyramid.mean(pixels) if mode == 'mean' else pyramid.polyline(pixels)
+  return ax.plot(px, py, **kwargs)
+
+def lod_series(result):
+  """Series worth precomputing pyramids for at save time, by name, as
+  (x, y) pairs; result is an alice Result or a bob Result (alice, bob)."""
+  if hasattr(result, 'bob'): named = [('alice.', result.alice), ('bob.', result.bob)]
+  else: named = [('', result)]
+  series = {}
+  for prefix, stats in named:
+    lengths = np.asarray(stats.episode_lengths)
+    rewards = np.asarray(stats.episode_rewards)
+    series[prefix+'episode_lengths'] = (None, lengths)
+    series[prefix+'episode_rewards'] = (None, rewards)
+    series[prefix+'cumulative_rewards'] = (np.cumsum(lengths), np.cumsum(rewards))
+    if getattr(stats, 'total_steps', None) is not None:
+      series[prefix+'steps_per_reward'] = (stats.total_steps, stats.steps_per_reward)
+  return series
+
+def save_pyramids(directory, series, factor = 4):
+  """Precomputes and saves a Pyramid per (x, y) series in directory+'lod/'."""
+  lod_directory = directory + LOD_DIRECTORY
+  if not os.path.exists(lod_directory): os.makedirs(lod_directory)
+  for name, (x, y) in series.items():
+    pyramid = Pyramid(x, y, factor = factor)
+    arrays = {'factor': factor, 'n': pyramid.n}
+    for k, level in enumerate(pyramid.levels):
+      for field, a in level.items(): arrays['%s%i' % (field, k)] = a
+    if not pyramid.levels: arrays['raw_x'], arrays['raw_y'] = pyramid.raw # too short to reduce
+    np.savez_compressed(lod_directory+name+'.npz', **arrays)
+
+def load_pyramid(directory, name):
+  """Pyramid saved by save_pyramids, or None if there isn't one."""
+  path = directory + LOD_DIRECTORY + name + '.npz'
+  if not os.path.exists(path): return None
+  with np.load(path) as f:
+    pyramid = Pyramid(factor = int(f['factor']))
+    pyramid.n = int(f['n'])
+    k = 0
+    while 'count%i' % k in f:
+      pyramid.levels.append({field: f['%s%i' % (field, k)] for field in ['x', 'y', 'mean', 'count']})
+      k += 1
+    if 'raw_x' in f: pyramid.raw = (f['raw_x'], f['raw_y'])
+  return pyramid
@@ -1,175 +1,197 @@
 import matplotlib
 matplotlib.use('Agg')
 matplotlib.rcParams['agg.path.chunksize'] = 10000
-import pandas as pd
-import numpy as np
+from collections import namedtuple
 import matplotlib.pyplot as plt
-from util.stats import rate_last_N, mean_last_N, first_time_to
+from util.stats import rate_last_N, mean_last_N
+from plotting.lod import plot_lod
+from plotting.derived_series import RunSeries
+from plotting.figure_pipeline import save_figure
 
-def plot_episode_stats(stats, figure_sizes, noshow = False, directory = None):
+# figure size and font sizes, as given to all plotting functions
+FigureSizes = namedtuple('FigureSizes', ['figure', 'tick_label', 'axis_label', 'title'])
+
+
+def plot_episode_stats(stats, figure_sizes, noshow = False, directory = None, series = None,
+                       pipeline = None):
   
-  if type(stats).__name__ == 'Result':
-    alice = stats.alice
-    stats = stats.bob
-    two_agents = True
-  else:
-    alice = stats
-    two_agents = False
+  # rolling means etc. are computed once per run and shared by the figures;
+  # series may be a RunSeries of stats that persists them next to the results
+  if series is None: series = RunSeries(stats)
+  
+  for plot_figure in episode_stats_figures(series):
+    if pipeline is not None and directory:
+      # rendered in pipeline's worker processes, written in the background
+      pipeline.submit(plot_figure, series, figure_sizes, noshow = True, directory = directory)
+    else:
+      plot_figure(series, figure_sizes, noshow = noshow, directory = directory)
   
+  return summarize_episode_stats(stats, series = series)
+
+def episode_stats_figures(series):
+  """The figure functions plot_episode_stats draws for a run; each takes
+  (series, figure_sizes, noshow, directory)."""
+  figures = [plot_smoothed_episode_lengths, plot_episode_lengths,
+             plot_episode_rewards, plot_reward_per_timestep]
+  if series.series('alice', 'action_info') is not None: figures.append(plot_action_info)
+  if series.series('alice', 'state_info') is not None: figures.append(plot_state_info)
+  figures.append(plot_steps_per_reward)
+  return figures
+
+def episode_stats_tasks(series, figure_sizes, directory):
+  """plot_episode_stats' figures as (fn, args, kwargs) tasks, e.g. for
+  plotting.figure_pipeline.run_detached."""
+  return [(plot_figure, (series, figure_sizes), {'noshow': True, 'directory': directory})
+          for plot_figure in episode_stats_figures(series)]
+
+def plot_smoothed_episode_lengths(series, figure_sizes, noshow = False, directory = None):
   # Plot the episode length over time (smoothed)
   window = 500
-  fig0 = plt.figure(figsize = figure_sizes.figure)
-  episode_lengths_smoothed = pd.Series(stats.episode_lengths).rolling(window, min_periods = window).mean()
-  plt.plot(episode_lengths_smoothed, label = 'bob')
-  if two_agents:
-    episode_lengths_smoothed = pd.Series(alice.episode_lengths).rolling(window, min_periods = window).mean()
-    plt.plot(episode_lengths_smoothed, label = 'alice')
+  fig = plt.figure(figsize = figure_sizes.figure)
+  plot_lod(series.rolling('bob', 'episode_lengths', window), label = 'bob')
+  if series.two_agents:
+    plot_lod(series.rolling('alice', 'episode_lengths', window), label = 'alice')
     plt.legend(loc = 'upper right', fontsize = figure_sizes.axis_label)
   plt.xlabel("Episode", fontsize = figure_sizes.axis_label)
   plt.ylabel("Episode Length", fontsize = figure_sizes.axis_label)
   plt.ylim(ymin = 0)
   plt.title("Episode Length over Time (Smoothed over {} episodes)".format(window), fontsize = figure_sizes.title)
   plt.tick_params(labelsize = figure_sizes.tick_label)
-  if directory:
-    plt.savefig(directory+'smoothed_episode_lengths.pdf', format='pdf')
-    plt.savefig(directory+'smoothed_episode_lengths.png', format='png')
-  if noshow: plt.close(fig0)
-  else: plt.show(fig0)
+  if directory: save_figure(directory+'smoothed_episode_lengths')
+  if noshow: plt.close(fig)
+  else: plt.show(fig)
 
+def plot_episode_lengths(series, figure_sizes, noshow = False, directory = None):
   # Plot the episode length over time
-  fig1 = plt.figure(figsize = figure_sizes.figure)
-  plt.plot(stats.episode_lengths, label = 'bob')
-  if two_agents:
-    plt.plot(alice.episode_lengths, label = 'alice')
+  fig = plt.figure(figsize = figure_sizes.figure)
+  plot_lod(series.series('bob', 'episode_lengths'), label = 'bob')
+  if series.two_agents:
+    plot_lod(series.series('alice', 'episode_lengths'), label = 'alice')
     plt.legend(loc = 'upper right', fontsize = figure_sizes.axis_label)
   plt.xlabel("Episode", fontsize = figure_sizes.axis_label)
   plt.ylabel("Episode Length", fontsize = figure_sizes.axis_label)
   plt.ylim(ymin = 0)
   plt.title("Episode Length over Time", fontsize = figure_sizes.title)
   plt.tick_params(labelsize = figure_sizes.tick_label)
-  if directory:
-    plt.savefig(directory+'episode_lengths.pdf', format='pdf')
-    plt.savefig(directory+'episode_lengths.png', format='png')
-  if noshow: plt.close(fig1)
-  else: plt.show(fig1)
+  if directory: save_figure(directory+'episode_lengths')
+  if noshow: plt.close(fig)
+  else: plt.show(fig)
 
+def plot_episode_rewards(series, figure_sizes, noshow = False, directory = None):
   # Plot the episode reward per episode
   window = 10
-  fig2 = plt.figure(figsize = figure_sizes.figure)
-  rewards_smoothed = pd.Series(stats.episode_rewards).rolling(window, min_periods = window).mean()
-  plt.plot(rewards_smoothed, label = 'bob')
-  if two_agents:
-    rewards_smoothed = pd.Series(alice.episode_rewards).rolling(window, min_periods = window).mean()
-    plt.plot(rewards_smoothed, label = 'alice')
+  fig = plt.figure(figsize = figure_sizes.figure)
+  plot_lod(series.rolling('bob', 'episode_rewards', window), label = 'bob')
+  if series.two_agents:
+    plot_lod(series.rolling('alice', 'episode_rewards', window), label = 'alice')
     plt.legend(loc = 'lower right', fontsize = figure_sizes.axis_label)
   plt.xlabel("Episode", fontsize = figure_sizes.axis_label)
   plt.ylabel("Episode Reward (Smoothed)", fontsize = figure_sizes.axis_label)
   plt.title("Episode Reward over Time (Smoothed over window size {})".format(window), fontsize = figure_sizes.title)
   plt.tick_params(labelsize = figure_sizes.tick_label)
-  if directory:
-    plt.savefig(directory+'episode_rewards.pdf', format='pdf')
-    plt.savefig(directory+'episode_rewards.png', format='png')
-  if noshow: plt.close(fig2)
-  else: plt.show(fig2)
-  
+  if directory: save_figure(directory+'episode_rewards')
+  if noshow: plt.close(fig)
+  else: plt.show(fig)
+
+def plot_reward_per_timestep(series, figure_sizes, noshow = False, directory = None):
   # Plot the episode reward per time step
-  fig3 = plt.figure(figsize = figure_sizes.figure) 
+  fig = plt.figure(figsize = figure_sizes.figure) 
   rate_per_what = 100
   N = 10000
-  cumulative_steps = np.cumsum(stats.episode_lengths)
-  cumulative_rewards = np.cumsum(stats.episode_rewards)
+  cumulative_steps = series.series('bob', 'cumulative_steps')
+  cumulative_rewards = series.series('bob', 'cumulative_rewards')
   r = rate_per_what*rate_last_N(cumulative_steps, cumulative_rewards, N = N)
   title = 'Reward per %i steps (last %i steps): %i' % (rate_per_what, N, r)
-  plt.plot(cumulative_steps, cumulative_rewards, linewidth = 8, label = 'bob')
-  if two_agents:
-    cumulative_steps = np.cumsum(alice.episode_lengths)
-    cumulative_rewards = np.cumsum(alice.episode_rewards)
+  plot_lod(cumulative_steps, cumulative_rewards, linewidth = 8, label = 'bob')
+  if series.two_agents:
+    cumulative_steps = series.series('alice', 'cumulative_steps')
+    cumulative_rewards = series.series('alice', 'cumulative_rewards')
     r_alice = rate_per_what*rate_last_N(cumulative_steps, cumulative_rewards, N = N)
     title = 'Reward per %i steps (last %i steps): Bob %i, Alice %i' % (rate_per_what, N, r, r_alice)
-    plt.plot(cumulative_steps, cumulative_rewards, linewidth = 8, label = 'alice')
+    plot_lod(cumulative_steps, cumulative_rewards, linewidth = 8, label = 'alice')
     plt.legend(loc = 'upper left', fontsize = figure_sizes.axis_label)
   plt.xlabel("Time Steps", fontsize = figure_sizes.axis_label)
   plt.ylabel("Total Reward", fontsize = figure_sizes.axis_label)
   plt.title(title, fontsize = figure_sizes.title)
   plt.tick_params(labelsize = figure_sizes.tick_label)
-  if directory:
-    plt.savefig(directory+'reward_per_timestep.pdf', format='pdf')
-    plt.savefig(directory+'reward_per_timestep.png', format='png')
-  if noshow: plt.close(fig3)
-  else: plt.show(fig3)
-  
-  if alice.episode_action_kl is not None:
-    # Plot a rolling estimate of I(action;goal|state)
-    window = 1000 # measure in episodes
-    fig4 = plt.figure(figsize = figure_sizes.figure)
-    cumulative_steps = np.cumsum(alice.episode_lengths)
-    info_smoothed = pd.Series(np.asarray(alice.episode_action_kl)/np.asarray(alice.episode_lengths)).rolling(window, min_periods = window).mean()
-    N = 10000
-    action_info = mean_last_N(cumulative_steps, info_smoothed, N = N)
-    plt.plot(cumulative_steps, info_smoothed)
-    plt.xlabel("Time Steps", fontsize = figure_sizes.axis_label)
-    plt.ylabel("I(action;goal|state)", fontsize = figure_sizes.axis_label)
-    plt.title("Info estimated over sliding window of {} episodes".format(window), fontsize = figure_sizes.title)
-    plt.tick_params(labelsize = figure_sizes.tick_label)
-    if directory:
-      plt.savefig(directory+'action_info.pdf', format='pdf')
-      plt.savefig(directory+'action_info.png', format='png')
-    if noshow: plt.close(fig4)
-    else: plt.show(fig4)
-  else:
-    fig4 = None
-    action_info = None
-  
-  if alice.episode_lso is not None:
-    # Plot a rolling estimate of I(state;goal)
-    window = 1000 # measure in episodes
-    fig5 = plt.figure(figsize = figure_sizes.figure)
-    cumulative_steps = np.cumsum(alice.episode_lengths)
-    info_smoothed = pd.Series(np.asarray(alice.episode_lso)/np.asarray(alice.episode_lengths)).rolling(window, min_periods = window).mean()
-    N = 10000
-    state_info = mean_last_N(cumulative_steps, info_smoothed, N = N)
-    plt.plot(cumulative_steps, info_smoothed)
-    plt.xlabel("Time Steps", fontsize = figure_sizes.axis_label)
-    plt.ylabel("I(state;goal)", fontsize = figure_sizes.axis_label)
-    plt.title("Info estimated over sliding window of {} episodes".format(window), fontsize = figure_sizes.title)
-    plt.tick_params(labelsize = figure_sizes.tick_label)
-    if directory:
-      plt.savefig(directory+'state_info.pdf', format='pdf')
-      plt.savefig(directory+'state_info.png', format='png')
-    if noshow: plt.close(fig5)
-    else: plt.show(fig5)
-  else:
-    fig5 = None
-    state_info = None
-  
+  if directory: save_figure(directory+'reward_per_timestep')
+  if noshow: plt.close(fig)
+  else: plt.show(fig)
+
+def plot_action_info(series, figure_sizes, noshow = False, directory = None):
+  # Plot a rolling estimate of I(action;goal|state)
+  window = 1000 # measure in episodes
+  fig = plt.figure(figsize = figure_sizes.figure)
+  plot_lod(series.series('alice', 'cumulative_steps'), series.rolling('alice', 'action_info', window))
+  plt.xlabel("Time Steps", fontsize = figure_sizes.axis_label)
+  plt.ylabel("I(action;goal|state)", fontsize = figure_sizes.axis_label)
+  plt.title("Info estimated over sliding window of {} episodes".format(window), fontsize = figure_sizes.title)
+  plt.tick_params(labelsize = figure_sizes.tick_label)
+  if directory: save_figure(directory+'action_info')
+  if noshow: plt.close(fig)
+  else: plt.show(fig)
+
+def plot_state_info(series, figure_sizes, noshow = False, directory = None):
+  # Plot a rolling estimate of I(state;goal)
+  window = 1000 # measure in episodes
+  fig = plt.figure(figsize = figure_sizes.figure)
+  plot_lod(series.series('alice', 'cumulative_steps'), series.rolling('alice', 'state_info', window))
+  plt.xlabel("Time Steps", fontsize = figure_sizes.axis_label)
+  plt.ylabel("I(state;goal)", fontsize = figure_sizes.axis_label)
+  plt.title("Info estimated over sliding window of {} episodes".format(window), fontsize = figure_sizes.title)
+  plt.tick_params(labelsize = figure_sizes.tick_label)
+  if directory: save_figure(directory+'state_info')
+  if noshow: plt.close(fig)
+  else: plt.show(fig)
+
+def plot_steps_per_reward(series, figure_sizes, noshow = False, directory = None):
   # Plot time steps per unit reward (smoothed)
   window = 500
-  fig6 = plt.figure(figsize = figure_sizes.figure)
-  total_steps, steps_per_reward = first_time_to(stats.episode_lengths, stats.episode_rewards) 
+  fig = plt.figure(figsize = figure_sizes.figure)
+  total_steps = series.series('bob', 'total_steps')
   N = 10000
-  average_steps_per_reward = mean_last_N(total_steps, steps_per_reward, N = N)
-  steps_per_reward_smoothed = pd.Series(steps_per_reward).rolling(window, min_periods = window).mean()
-  if two_agents: lab = 'bob'
+  average_steps_per_reward = mean_last_N(total_steps, series.series('bob', 'steps_per_reward'), N = N)
+  steps_per_reward_smoothed = series.rolling('bob', 'steps_per_reward', window)
+  if series.two_agents: lab = 'bob'
   else: lab = 'alice'
-  plt.plot(total_steps, steps_per_reward_smoothed, color = 'b', label = lab, linewidth = 8)
-  if two_agents:
-    average_steps_per_reward_alice = np.sum(alice.episode_lengths)/np.sum(alice.episode_rewards)
+  plot_lod(total_steps, steps_per_reward_smoothed, color = 'b', label = lab, linewidth = 8)
+  if series.two_agents:
+    average_steps_per_reward_alice = series.average_steps_per_reward('alice')
     plt.axhline(y = average_steps_per_reward_alice, color = 'r', label = 'alice', linewidth = 8)
     plt.legend(loc = 'upper right', fontsize = figure_sizes.axis_label)
     _, ymax = plt.gca().get_ylim()
     plt.ylim(0, min(6*average_steps_per_reward_alice,ymax))
     tit = "Smoothed over ~%i episodes, Mean (last %i steps): Bob %.1f, Alice %.1f" % (window, N, average_steps_per_reward, average_steps_per_reward_alice)
   else:
-    average_steps_per_reward_alice = None
     tit = "Smoothed over ~%i episodes, Mean (last %i steps): %.1f" % (window, N, average_steps_per_reward)
   plt.title(tit, fontsize = figure_sizes.title)
   plt.xlabel("Time Steps", fontsize = figure_sizes.axis_label)
   plt.ylabel("Time Steps per Reward", fontsize = figure_sizes.axis_label)  
   plt.tick_params(labelsize = figure_sizes.tick_label)
-  if directory:
-    plt.savefig(directory+'steps_per_reward.pdf', format='pdf')
-    plt.savefig(directory+'steps_per_reward.png', format='png')
-  if noshow: plt.close(fig6)
-  else: plt.show(fig6)
+  if directory: save_figure(directory+'steps_per_reward')
+  if noshow: plt.close(fig)
+  else: plt.show(fig)
 
-  return average_steps_per_reward, average_steps_per_reward_alice, action_info, state_info
\ No newline at end of file
+def summarize_episode_stats(stats, series = None):
+  """Computes the summary numbers returned by plot_episode_stats, without
+  drawing anything."""
+  
+  if series is None: series = RunSeries(stats)
+  
+  N = 10000
+  window = 1000 # info windows, measured in episodes
+  cumulative_steps = series.series('alice', 'cumulative_steps')
+  info_smoothed = series.rolling('alice', 'action_info', window)
+  if info_smoothed is not None: action_info = mean_last_N(cumulative_steps, info_smoothed, N = N)
+  else: action_info = None
+  info_smoothed = series.rolling('alice', 'state_info', window)
+  if info_smoothed is not None: state_info = mean_last_N(cumulative_steps, info_smoothed, N = N)
+  else: state_info = None
+  average_steps_per_reward = mean_last_N(series.series('bob', 'total_steps'),
+                                         series.series('bob', 'steps_per_reward'), N = N)
+  if series.two_agents:
+    average_steps_per_reward_alice = series.average_steps_per_reward('alice')
+  else:
+    average_steps_per_reward_alice = None
+  
+  return average_steps_per_reward, average_steps_per_reward_alice, action_info, state_info
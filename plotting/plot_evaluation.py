@@ -0,0 +1,37 @@
+import os
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from plotting.figure_pipeline import save_figure
+
+def plot_evaluation(evaluation, metrics, directory, figsize = (12,6)):
+  """Summary figures of an evaluate.rollout: return and episode length
+  distributions per agent and goal decoding accuracy per step of bob and
+  the bayes_bob baseline."""
+  if not os.path.exists(directory): os.makedirs(directory)
+  agents = [a for a in ['alice', 'bob'] if a in evaluation]
+  for field, label in [('return', 'Episode Return'), ('length', 'Episode Length')]:
+    fig = plt.figure(figsize = figsize)
+    for agent in agents:
+      plt.hist(evaluation[agent][field], bins = 30, alpha = .5, label = agent)
+    plt.xlabel(label)
+    plt.ylabel('Episodes')
+    plt.legend(loc = 'upper right')
+    plt.title('%s over %i episodes' % (label, len(evaluation['goals'])))
+    save_figure(directory+'%s_distribution' % field)
+    plt.close(fig)
+  bobs = [b for b in ['bob', 'bayes_bob'] if b in metrics]
+  if bobs:
+    fig = plt.figure(figsize = figsize)
+    for bob in bobs:
+      accuracy = metrics[bob]['goal_decoding']['accuracy_by_step']
+      plt.plot(np.arange(1, len(accuracy)+1), [np.nan if a is None else a for a in accuracy], label = bob)
+    plt.axhline(y = 1./metrics[bobs[0]]['goal_decoding']['n_goals'], color = 'k', linestyle = '--')
+    plt.legend(loc = 'lower right')
+    plt.ylim(0, 1.05)
+    plt.xlabel('Step')
+    plt.ylabel('Goal Decoding Accuracy')
+    plt.title("Goal decoded from bob's z (nearest class mean) or posterior (bayes_bob)")
+    save_figure(directory+'goal_decoding')
+    plt.close(fig)
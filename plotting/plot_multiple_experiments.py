@@ -1,26 +1,30 @@
 import os
-import pickle
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 from collections import namedtuple
 os.chdir("..")
-from util.stats import rate_last_N, first_time_to
+from util.stats import rate_last_N
+from util.results_store import load_results
+from plotting.lod import Pyramid, plot_lod, load_pyramid
+from plotting.derived_series import RunSeries
+from plotting.figure_pipeline import FigurePipeline, save_figure
 
 FigureSizes = namedtuple('FigureSizes', ['figure', 'tick_label', 'axis_label', 'title'])
+FORMATS = ['eps', 'pdf', 'png']
 
 def plot_multiple_experiments(list_of_directories, exp_names_and_colors,
-                              figure_sizes, collection_name):
+                              figure_sizes, collection_name, save_series = True,
+                              pipeline = None):
   
   # load results
   results_directory = os.getcwd()+'/results/'
-  results = []
+  series = [] # derived series, saved next to each run's results if save_series
   colors = []
   labels = []
   labels_added = set()
   for d in list_of_directories:
-    r = pickle.load(open(results_directory+d+'/results.pkl','rb'))
-    results.append(r)
+    r = load_results(results_directory+d) # lazy if stored in columns
+    series.append(RunSeries(r, directory = results_directory+d+'/' if save_series else None))
     # if directory name contains exp_name, color it with corresponding color
     color_found = False
     for k in exp_names_and_colors.keys():
@@ -34,38 +38,51 @@ def plot_multiple_experiments(list_of_directories, exp_names_and_colors,
           labels_added.add(k) # will this work?
         break
     if not color_found: raise ValueError('No names in exp_names_and_colors appeared in {}'.format(d))
-    
+
+  # the figures are independent: drawn here, or by pipeline's worker processes
+  args = (series, list_of_directories, colors, labels, figure_sizes,
+          results_directory, collection_name)
+  for plot_figure in FIGURES:
+    if pipeline is not None: pipeline.submit(plot_figure, *args)
+    else: plot_figure(*args)
+  
+  return
+
+def plot_reward_per_timestep(series, list_of_directories, colors, labels, figure_sizes,
+                             results_directory, collection_name):
   # plot rewards vs time and write reward rates to text file
   rate_per_what = 100
-  f = open(os.getcwd()+'/results/'+collection_name+'_reward_per_timestep.txt','w')
+  f = open(results_directory+collection_name+'_reward_per_timestep.txt','w')
   f.write('REWARD RATES PER %i TIME STEPS\n' % rate_per_what)
-  fig1 = plt.figure(figsize = figure_sizes.figure)
+  fig = plt.figure(figsize = figure_sizes.figure)
   # plot bob
   f.write("***** BOB *****\n")
-  for n in range(len(results)):
-    r = results[n]
+  for n in range(len(series)):
     c = colors[n]
     l = labels[n]
     d = list_of_directories[n]
-    cumulative_steps = np.cumsum(r.bob.episode_lengths)
-    cumulative_rewards = np.cumsum(r.bob.episode_rewards)
-    plt.plot(cumulative_steps, cumulative_rewards,
-             color = c, linestyle = '-', label = l, linewidth = 8)
+    cumulative_steps = series[n].series('bob', 'cumulative_steps')
+    cumulative_rewards = series[n].series('bob', 'cumulative_rewards')
+    # pyramid precomputed at save time, if the run has one
+    curve = (load_pyramid(results_directory+d+'/', 'bob.cumulative_rewards') or
+             Pyramid(cumulative_steps, cumulative_rewards))
+    plot_lod(curve, color = c, linestyle = '-', label = l, linewidth = 8)
     # write reward rates to text file
     N = 10000
     rate = rate_per_what*rate_last_N(cumulative_steps, cumulative_rewards, N = N)
     f.write("'%s': %i (last %i steps)\n" % (d, rate, N))
   # plot alice
   f.write("***** ALICE *****\n")
-  for n in range(len(results)):
-    r = results[n]
+  for n in range(len(series)):
     c = colors[n]
     l = labels[n]
     d = list_of_directories[n]
-    cumulative_steps = np.cumsum(r.alice.episode_lengths)
-    cumulative_rewards = np.cumsum(r.alice.episode_rewards)
-    plt.plot(cumulative_steps, cumulative_rewards,
-             color = c, linestyle = '--', label = None, linewidth = 8)
+    cumulative_steps = series[n].series('alice', 'cumulative_steps')
+    cumulative_rewards = series[n].series('alice', 'cumulative_rewards')
+    # pyramid precomputed at save time, if the run has one
+    curve = (load_pyramid(results_directory+d+'/', 'alice.cumulative_rewards') or
+             Pyramid(cumulative_steps, cumulative_rewards))
+    plot_lod(curve, color = c, linestyle = '--', label = None, linewidth = 8)
     # write reward rates to text file
     N = 10000
     rate = rate_per_what*rate_last_N(cumulative_steps, cumulative_rewards, N = N)
@@ -77,30 +94,29 @@ def plot_multiple_experiments(list_of_directories, exp_names_and_colors,
   plt.title("Total Reward over Time", fontsize = figure_sizes.title)
   plt.legend(loc = 'upper left', fontsize = figure_sizes.axis_label)
   plt.tick_params(labelsize = figure_sizes.tick_label)  
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_reward_per_timestep.eps', format='eps')
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_reward_per_timestep.pdf', format='pdf')
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_reward_per_timestep.png', format='png')
-  plt.close(fig1)
-  
+  save_figure(results_directory+collection_name+'_reward_per_timestep', formats = FORMATS)
+  plt.close(fig)
+  f.close()
+
+def plot_smoothed_episode_lengths(series, list_of_directories, colors, labels, figure_sizes,
+                                  results_directory, collection_name):
   # plot smoothed episode lengths over time
   window = 1000
-  fig2 = plt.figure(figsize = figure_sizes.figure)
+  fig = plt.figure(figsize = figure_sizes.figure)
   # plot bob
-  for n in range(len(results)):
-    r = results[n]
+  for n in range(len(series)):
     c = colors[n]
     l = labels[n]
     d = list_of_directories[n]
-    episode_lengths_smoothed = pd.Series(r.bob.episode_lengths).rolling(window, min_periods = window).mean()
-    plt.plot(episode_lengths_smoothed,
+    episode_lengths_smoothed = series[n].rolling('bob', 'episode_lengths', window)
+    plot_lod(episode_lengths_smoothed,
              color = c, linestyle = '-', label = l, linewidth = 8)
   # plot alice
-  for n in range(len(results)):
-    r = results[n]
+  for n in range(len(series)):
     c = colors[n]
     l = labels[n]
     d = list_of_directories[n]
-    average_episode_length = np.mean(r.alice.episode_lengths)
+    average_episode_length = np.mean(series[n].series('alice', 'episode_lengths'))
     plt.axhline(y = average_episode_length,
                 color = c, linestyle = '--', label = None, linewidth = 8)
   plt.xlabel("Episode", fontsize = figure_sizes.axis_label)
@@ -110,31 +126,29 @@ def plot_multiple_experiments(list_of_directories, exp_names_and_colors,
   plt.ylim(ymin = 0)
   plt.legend(loc = 'upper right', fontsize = figure_sizes.axis_label)
   plt.tick_params(labelsize = figure_sizes.tick_label)  
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_smoothed_episode_lengths.eps', format='eps')
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_smoothed_episode_lengths.pdf', format='pdf')
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_smoothed_episode_lengths.png', format='png')
-  plt.close(fig2)  
-  
+  save_figure(results_directory+collection_name+'_smoothed_episode_lengths', formats = FORMATS)
+  plt.close(fig)
+
+def plot_steps_per_reward(series, list_of_directories, colors, labels, figure_sizes,
+                          results_directory, collection_name):
   # Plot time steps per unit reward (smoothed)
   window = 500
-  fig3 = plt.figure(figsize = figure_sizes.figure)
+  fig = plt.figure(figsize = figure_sizes.figure)
   # plot bob
-  for n in range(len(results)):
-    r = results[n]
+  for n in range(len(series)):
     c = colors[n]
     l = labels[n]
     d = list_of_directories[n]
-    total_steps, steps_per_reward = first_time_to(r.bob.episode_lengths, r.bob.episode_rewards)
-    steps_per_reward_smoothed = pd.Series(steps_per_reward).rolling(window, min_periods = window).mean()
-    plt.plot(total_steps, steps_per_reward_smoothed,
+    total_steps = series[n].series('bob', 'total_steps')
+    steps_per_reward_smoothed = series[n].rolling('bob', 'steps_per_reward', window)
+    plot_lod(total_steps, steps_per_reward_smoothed,
              color = c, linestyle = '-', label = l, linewidth = 8)
   # plot alice
-  for n in range(len(results)):
-    r = results[n]
+  for n in range(len(series)):
     c = colors[n]
     l = labels[n]
     d = list_of_directories[n]
-    average_steps_per_reward = np.sum(r.alice.episode_lengths)/np.sum(r.alice.episode_rewards)
+    average_steps_per_reward = series[n].average_steps_per_reward('alice')
     plt.axhline(y = average_steps_per_reward,
                 color = c, linestyle = '--', label = None, linewidth = 8)
   plt.xlabel("Time Steps", fontsize = figure_sizes.axis_label)
@@ -145,25 +159,22 @@ def plot_multiple_experiments(list_of_directories, exp_names_and_colors,
   plt.ylim(0, min(2*average_steps_per_reward,ymax))
   plt.legend(loc = 'upper right', fontsize = figure_sizes.axis_label)
   plt.tick_params(labelsize = figure_sizes.tick_label)  
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_steps_per_reward.eps', format='eps')
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_steps_per_reward.pdf', format='pdf')
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_steps_per_reward.png', format='png')
-  plt.close(fig3)
+  save_figure(results_directory+collection_name+'_steps_per_reward', formats = FORMATS)
+  plt.close(fig)
 
+def plot_normalized_steps_per_reward(series, list_of_directories, colors, labels, figure_sizes,
+                                     results_directory, collection_name):
   # Plot time steps per unit reward as % of Alice's
   window = 500
-  fig4 = plt.figure(figsize = figure_sizes.figure)
+  fig = plt.figure(figsize = figure_sizes.figure)
   # plot bob
-  for n in range(len(results)-1,-1,-1):
-    r = results[n]
+  for n in range(len(series)-1,-1,-1):
     c = colors[n]
     l = labels[n]
     d = list_of_directories[n]
-    total_steps, steps_per_reward = first_time_to(r.bob.episode_lengths, r.bob.episode_rewards)
-    average_steps_per_reward = np.sum(r.alice.episode_lengths)/np.sum(r.alice.episode_rewards)
-    bob_over_alice = steps_per_reward/average_steps_per_reward
-    bob_over_alice_smoothed = pd.Series(bob_over_alice).rolling(window, min_periods = window).mean()
-    plt.plot(total_steps, bob_over_alice_smoothed,
+    total_steps = series[n].series('bob', 'total_steps')
+    bob_over_alice_smoothed = series[n].rolling('bob', 'bob_over_alice', window)
+    plot_lod(total_steps, bob_over_alice_smoothed,
              color = c, linestyle = '-', label = l, linewidth = 8)
   plt.xlabel("Time Steps", fontsize = figure_sizes.axis_label)
   plt.ylabel("Bob Normalized Episode Length", fontsize = figure_sizes.axis_label)
@@ -173,24 +184,22 @@ def plot_multiple_experiments(list_of_directories, exp_names_and_colors,
   plt.ylim((.95, 2))
   plt.legend(loc = 'upper right', fontsize = figure_sizes.axis_label)
   plt.tick_params(labelsize = figure_sizes.tick_label)  
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_normalized_steps_per_reward.eps', format='eps')
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_normalized_steps_per_reward.pdf', format='pdf')
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_normalized_steps_per_reward.png', format='png')
-  plt.close(fig4) 
-  
+  save_figure(results_directory+collection_name+'_normalized_steps_per_reward', formats = FORMATS)
+  plt.close(fig)
+
+def plot_bob_win_percentage(series, list_of_directories, colors, labels, figure_sizes,
+                            results_directory, collection_name):
   # Plot percentage of time Bob beats Alice to the goal
   window = 1000
-  fig5 = plt.figure(figsize = figure_sizes.figure)
+  fig = plt.figure(figsize = figure_sizes.figure)
   # plot bob
-  for n in range(len(results)):
-    r = results[n]
+  for n in range(len(series)):
     c = colors[n]
     l = labels[n]
     d = list_of_directories[n]
-    bob_beats_alice = np.array(r.bob.episode_lengths) < np.array(r.alice.episode_lengths)
-    bob_win_percentage = pd.Series(bob_beats_alice).rolling(window, min_periods = window).mean()
-    total_steps = np.cumsum(r.bob.episode_lengths)
-    plt.plot(total_steps, bob_win_percentage,
+    bob_win_percentage = series[n].rolling('bob', 'bob_wins', window)
+    total_steps = series[n].series('bob', 'cumulative_steps')
+    plot_lod(total_steps, bob_win_percentage,
              color = c, linestyle = '-', label = l, linewidth = 8)
   plt.xlabel("Time Steps", fontsize = figure_sizes.axis_label)
   plt.ylabel("% of time Bob beats Alice to goal", fontsize = figure_sizes.axis_label)
@@ -200,24 +209,22 @@ def plot_multiple_experiments(list_of_directories, exp_names_and_colors,
   plt.ylim((0, .5))
   plt.legend(loc = 'upper left', fontsize = figure_sizes.axis_label)
   plt.tick_params(labelsize = figure_sizes.tick_label)  
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_bob_win_percentage.eps', format='eps')
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_bob_win_percentage.pdf', format='pdf')
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_bob_win_percentage.png', format='png')
-  plt.close(fig5)
-  
+  save_figure(results_directory+collection_name+'_bob_win_percentage', formats = FORMATS)
+  plt.close(fig)
+
+def plot_bob_win_tie_percentage(series, list_of_directories, colors, labels, figure_sizes,
+                                results_directory, collection_name):
   # Plot percentage of time Bob beats or ties Alice to the goal
   window = 1000
-  fig6 = plt.figure(figsize = figure_sizes.figure)
+  fig = plt.figure(figsize = figure_sizes.figure)
   # plot bob
-  for n in range(len(results)):
-    r = results[n]
+  for n in range(len(series)):
     c = colors[n]
     l = labels[n]
     d = list_of_directories[n]
-    bob_beats_alice = np.array(r.bob.episode_lengths) <= np.array(r.alice.episode_lengths)
-    bob_win_percentage = pd.Series(bob_beats_alice).rolling(window, min_periods = window).mean()
-    total_steps = np.cumsum(r.bob.episode_lengths)
-    plt.plot(total_steps, bob_win_percentage,
+    bob_win_percentage = series[n].rolling('bob', 'bob_wins_or_ties', window)
+    total_steps = series[n].series('bob', 'cumulative_steps')
+    plot_lod(total_steps, bob_win_percentage,
              color = c, linestyle = '-', label = l, linewidth = 8)
   plt.xlabel("Time Steps", fontsize = figure_sizes.axis_label)
   plt.ylabel("% of time Bob beats/ties Alice to goal", fontsize = figure_sizes.axis_label)
@@ -227,14 +234,13 @@ def plot_multiple_experiments(list_of_directories, exp_names_and_colors,
   plt.ylim((0, .7))
   plt.legend(loc = 'upper left', fontsize = figure_sizes.axis_label)
   plt.tick_params(labelsize = figure_sizes.tick_label)  
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_bob_win_tie_percentage.eps', format='eps')
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_bob_win_tie_percentage.pdf', format='pdf')
-  plt.savefig(os.getcwd()+'/results/'+collection_name+'_bob_win_tie_percentage.png', format='png')
-  plt.close(fig6) 
-  
-  return
-  
-    
+  save_figure(results_directory+collection_name+'_bob_win_tie_percentage', formats = FORMATS)
+  plt.close(fig)
+
+FIGURES = [plot_reward_per_timestep, plot_smoothed_episode_lengths, plot_steps_per_reward,
+           plot_normalized_steps_per_reward, plot_bob_win_percentage,
+           plot_bob_win_tie_percentage]
+
 if __name__ == "__main__":
   figure_sizes = FigureSizes(figure = (50,25),
                              tick_label = 40,
@@ -289,7 +295,9 @@ if __name__ == "__main__":
                           'ambivalent': 'b',
                           'competitive': 'g'}
   collection_name = '5x5_stateinfo_shared128_200k_bestof10'
-  fig = plot_multiple_experiments(list_of_directories = list_of_directories,
-                                 exp_names_and_colors = exp_names_and_colors,
-                                 figure_sizes = figure_sizes,
-                                 collection_name = collection_name)
\ No newline at end of file
+  with FigurePipeline() as pipeline:
+    fig = plot_multiple_experiments(list_of_directories = list_of_directories,
+                                   exp_names_and_colors = exp_names_and_colors,
+                                   figure_sizes = figure_sizes,
+                                   collection_name = collection_name,
+                                   pipeline = pipeline)
\ No newline at end of file
@@ -1,67 +1,67 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+from plotting.figure_pipeline import save_figure
+
+# grids with more cells per side get one set of arrows per block of cells
+MAX_ARROWS = 32
 
 def build_grid(grid_size, coord_to_state, metrics, wall_value, skip_value, skip_coord = []):
   """Takes state/goal dependent metrics and represents them on a printable grid."""
   grid = wall_value*np.ones((grid_size[1], grid_size[0])) # -1 assigned to wall color
-  for coord, state in coord_to_state.items():
-    if coord in skip_coord:
-      grid[coord[0],coord[1]] = skip_value # assignment to skip_coords
-    else:
-      grid[coord[0],coord[1]] = metrics[state]
+  coords = np.array(list(coord_to_state.keys())).reshape(-1, 2)
+  states = np.fromiter(coord_to_state.values(), dtype = int, count = len(coord_to_state))
+  grid[coords[:,0], coords[:,1]] = np.asarray(metrics)[states]
+  if len(skip_coord):
+    skip_coord = np.asarray(skip_coord).reshape(-1, 2)
+    grid[skip_coord[:,0], skip_coord[:,1]] = skip_value # assignment to skip_coords
   return np.transpose(grid)
 
 def plot_arrows(action_probs, terminal_states, state_to_coord, grid_size,
-                action_to_index, axis):
-  """Visualizes grid world policy. Arrows proportional to action prob."""
-  # NOTE: quiver uses a different coordinate system than imshow, resulting in
-  #       the necessity of a pretty funky coordinate transform to get them to
-  #       match up. I don't fully understand *why* the below transform works,
-  #       but it does. Could toy with imshow origin param, grid representation,
-  #       etc to make this transformation more understandable.
+                action_to_index, axis, max_arrows = MAX_ARROWS):
+  """Visualizes grid world policy. Arrows proportional to action prob. On
+  grids with more than max_arrows cells per side, cells are grouped into
+  blocks, each with one set of arrows for its mean action probs (over its
+  non-terminal states), so the # of arrows doesn't grow with the grid."""
+  # quiver draws on the imshow grid (x right, y down), with angles = 'uv' so
+  # arrows point up the screen for UP; lengths are in grid cells
   arrow_ratio = .5
-  X = []
-  Y = []
-  U = []
-  V = []
-  for action in range(4):
-    for state in range(action_probs.shape[0]):
-      if state not in terminal_states: # no arrow for goal state
-        X.append(state_to_coord[state][0])
-        Y.append(state_to_coord[state][1])
-        prob = action_probs[state, action]
-        if action == action_to_index['UP']:
-          U.append(0)
-          V.append(+prob)
-        elif action == action_to_index['RIGHT']:
-          U.append(+prob)
-          V.append(0)
-        elif action == action_to_index['DOWN']:
-          U.append(0)
-          V.append(-prob)
-        elif action == action_to_index['LEFT']:
-          U.append(-prob)
-          V.append(0)
-        else:
-          raise ValueError('action out of range: must be 0-3')
-    if action in [action_to_index['LEFT'], action_to_index['RIGHT']]:
-      units = 'x'
-      scale_units = 'height'
-    else:
-      units = 'y'
-      scale_units = 'width'
-    scale = grid_size[0] / arrow_ratio # correct, or max of two grid_size dim?
-    axis.quiver(X, Y, U, V, pivot = 'tail', units = units, scale_units = scale_units, scale = scale, width = .05)
+  n_states = action_probs.shape[0]
+  coords = np.array([state_to_coord[s] for s in range(n_states)]).reshape(-1, 2)
+  keep = ~np.isin(np.arange(n_states), terminal_states) # no arrow for goal state
+  x, y, probs = coords[keep,0], coords[keep,1], action_probs[keep]
+  block = max(1, int(np.ceil(max(grid_size) / float(max_arrows))))
+  if block > 1:
+    # mean action probs per block of block X block cells, drawn at its center
+    n_x = -(-grid_size[1] // block)
+    n_y = -(-grid_size[0] // block)
+    index = (y // block) * n_x + x // block
+    counts = np.bincount(index, minlength = n_x * n_y)
+    sums = np.stack([np.bincount(index, weights = probs[:,a], minlength = n_x * n_y)
+                     for a in range(probs.shape[1])], axis = 1)
+    present = np.flatnonzero(counts)
+    probs = sums[present] / counts[present,None]
+    block_x, block_y = present % n_x, present // n_x
+    x = (block_x * block + np.minimum(block_x * block + block, grid_size[1]) - 1) / 2.
+    y = (block_y * block + np.minimum(block_y * block + block, grid_size[0]) - 1) / 2.
+  directions = {'UP': (0, +1), 'RIGHT': (+1, 0), 'DOWN': (0, -1), 'LEFT': (-1, 0)}
+  actions = [action_to_index[name] for name in directions]
+  unit = np.array([directions[name] for name in directions], dtype = float) # action X (u,v)
+  U = probs[:,actions] * unit[:,0]
+  V = probs[:,actions] * unit[:,1]
+  n_arrows = len(actions)
+  axis.quiver(np.repeat(x, n_arrows), np.repeat(y, n_arrows), U.ravel(), V.ravel(),
+              pivot = 'tail', angles = 'uv', units = 'x', scale_units = 'xy',
+              scale = 1. / (arrow_ratio * block), width = .05 * block)
 
 def fill_subplot(ax, goal, grid_size, coord_to_state, terminal_states, metrics,
-                 max_val, action_probs, action_to_index, colors):
+                 max_val, action_probs, action_to_index, colors, verbose = False):
   """Fills in metric/policy viz for particular goal."""
   state_to_coord = {v: k for k, v in coord_to_state.items()}
   cm = mcolors.LinearSegmentedColormap.from_list('my_colormap', colors)
   grid = build_grid(grid_size, coord_to_state, metrics, wall_value = -max_val,
                     skip_value = -.5*max_val)
-  print(grid)
+  if verbose: print(grid)
   im = ax.imshow(grid,
                  interpolation = 'none', origin = 'upper', cmap = cm,
                  vmin = -max_val, vmax = max_val)  
@@ -89,9 +89,7 @@ def plot_value_map(values, action_probs, env, figure_sizes, noshow = False, dire
   cbar.ax.tick_params(labelsize = figure_sizes.tick_label)
   #plt.suptitle('Value function', fontsize = figure_sizes.title)
   if directory:
-      plt.savefig(directory+'values.eps', format='eps')
-      plt.savefig(directory+'values.pdf', format='pdf')
-      plt.savefig(directory+'values.png', format='png')
+      save_figure(directory+'values', formats = ['eps', 'pdf', 'png'])
   if noshow: plt.close(fig)
   else: plt.show(block = False)
   
@@ -114,9 +112,7 @@ def plot_kl_map(kls, action_probs, env, figure_sizes, noshow = False, directory
   cbar.ax.tick_params(labelsize = figure_sizes.tick_label)
   #plt.suptitle('I(action;goal|state)', fontsize = figure_sizes.title)
   if directory:
-      plt.savefig(directory+'kls.eps', format='eps')
-      plt.savefig(directory+'kls.pdf', format='pdf')
-      plt.savefig(directory+'kls.png', format='png')
+      save_figure(directory+'kls', formats = ['eps', 'pdf', 'png'])
   if noshow: plt.close(fig)
   else: plt.show(block = False)
   
@@ -139,9 +135,7 @@ def plot_lso_map(lsos, action_probs, env, figure_sizes, noshow = False, director
   cbar.ax.tick_params(labelsize = figure_sizes.tick_label)
   #plt.suptitle('I(state;goal)', fontsize = figure_sizes.title)
   if directory:
-      plt.savefig(directory+'lsos'+ext+'.eps', format='eps')
-      plt.savefig(directory+'lsos'+ext+'.pdf', format='pdf')
-      plt.savefig(directory+'lsos'+ext+'.png', format='png')
+      save_figure(directory+'lsos'+ext, formats = ['eps', 'pdf', 'png'])
   if noshow: plt.close(fig)
   else: plt.show(block = False)
 
@@ -168,9 +162,7 @@ def plot_state_densities(state_goal_counts, action_probs, env, figure_sizes, nos
   cbar.ax.tick_params(labelsize = figure_sizes.tick_label)
   #plt.suptitle('I(state;goal)', fontsize = figure_sizes.title)
   if directory:
-      plt.savefig(directory+'state_densities.eps', format='eps')
-      plt.savefig(directory+'state_densities.pdf', format='pdf')
-      plt.savefig(directory+'state_densities.png', format='png')
+      save_figure(directory+'state_densities', formats = ['eps', 'pdf', 'png'])
   if noshow: plt.close(fig)
   else: plt.show(block = False)
 
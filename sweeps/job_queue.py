@@ -0,0 +1,233 @@
+import os
+import sys
+import ast
+import time
+import json
+import socket
+import sqlite3
+import importlib
+import importlib.util
+import threading
+import traceback
+import multiprocessing
+if "../" not in sys.path: sys.path.append("../")
+
+# shorthand targets; anything else is given as 'module:function'
+TARGETS = {'alice': 'train_alice:train_alice',
+           'bob': 'train_bob:train_bob'}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  target TEXT NOT NULL,
+  kwargs TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending', -- pending, running, done, failed
+  worker TEXT,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  heartbeat REAL,
+  submitted REAL,
+  started REAL,
+  finished REAL,
+  result TEXT,
+  error TEXT)
+'''
+
+class JobQueue:
+  """Work queue of training runs backed by a single SQLite file, which can sit
+  in a directory shared between nodes. Workers atomically claim pending jobs,
+  heartbeat while running them, and record a result or error. Running jobs
+  whose heartbeat is older than heartbeat_timeout seconds (i.e. dead workers)
+  are put back in the queue, up to max_attempts tries per job.
+  Claims rely on SQLite's file locking (BEGIN IMMEDIATE), which is unreliable
+  on NFS and other network filesystems: two workers may then claim the same
+  job, or the file may be corrupted. Keep the queue on a local disk of a
+  single node, or on a shared filesystem known to support POSIX locks
+  (e.g. Lustre mounted with flock), not on an NFS home directory."""
+
+  def __init__(self, path, heartbeat_timeout = 300, max_attempts = 3):
+    self.path = path
+    self.heartbeat_timeout = heartbeat_timeout
+    self.max_attempts = max_attempts
+    with self._connect() as conn:
+      conn.execute(SCHEMA)
+
+  def _connect(self):
+    # autocommit mode, so transactions are explicit (BEGIN IMMEDIATE locks)
+    return _Connection(self.path)
+
+  def submit(self, target, **kwargs):
+    """Adds a job: target is 'alice', 'bob' or 'module:function', called with
+    kwargs (which must be json-serializable). Returns the job id."""
+    with self._connect() as conn:
+      cursor = conn.execute('INSERT INTO jobs (target, kwargs, submitted) VALUES (?, ?, ?)',
+                            (target, json.dumps(kwargs, sort_keys = True), time.time()))
+      return cursor.lastrowid
+
+  def claim(self, worker):
+    """Atomically claims the oldest pending job, re-queueing jobs of dead
+    workers first. Returns (job id, target, kwargs), or None if none pending."""
+    now = time.time()
+    with self._connect() as conn:
+      conn.execute('BEGIN IMMEDIATE')
+      conn.execute('''UPDATE jobs SET status = 'pending', worker = NULL
+                      WHERE status = 'running' AND heartbeat < ? AND attempts < ?''',
+                   (now - self.heartbeat_timeout, self.max_attempts))
+      conn.execute('''UPDATE jobs SET status = 'failed', error = 'worker died'
+                      WHERE status = 'running' AND heartbeat < ?''',
+                   (now - self.heartbeat_timeout,))
+      row = conn.execute('''SELECT id, target, kwargs FROM jobs WHERE status = 'pending'
+                            ORDER BY id LIMIT 1''').fetchone()
+      if row is None:
+        conn.execute('COMMIT')
+        return None
+      conn.execute('''UPDATE jobs SET status = 'running', worker = ?, heartbeat = ?,
+                      started = ?, attempts = attempts + 1 WHERE id = ?''',
+                   (worker, now, now, row[0]))
+      conn.execute('COMMIT')
+    return row[0], row[1], json.loads(row[2])
+
+  def heartbeat(self, job_id, worker):
+    with self._connect() as conn:
+      conn.execute('UPDATE jobs SET heartbeat = ? WHERE id = ? AND worker = ?',
+                   (time.time(), job_id, worker))
+
+  def finish(self, job_id, worker, result):
+    with self._connect() as conn:
+      conn.execute('''UPDATE jobs SET status = 'done', finished = ?, result = ?
+                      WHERE id = ? AND worker = ?''',
+                   (time.time(), json.dumps(result, default = str), job_id, worker))
+
+  def fail(self, job_id, worker, error):
+    """Records an error; the job is retried until it has used max_attempts."""
+    with self._connect() as conn:
+      conn.execute('''UPDATE jobs SET finished = ?, error = ?, worker = NULL,
+                      status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END
+                      WHERE id = ? AND worker = ?''',
+                   (time.time(), error, self.max_attempts, job_id, worker))
+
+  def counts(self):
+    """Number of jobs per status."""
+    with self._connect() as conn:
+      return dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+  def jobs(self, status = None):
+    """All jobs (optionally with a given status) as dicts."""
+    with self._connect() as conn:
+      conn.row_factory = sqlite3.Row
+      if status is None: rows = conn.execute('SELECT * FROM jobs ORDER BY id').fetchall()
+      else: rows = conn.execute('SELECT * FROM jobs WHERE status = ? ORDER BY id', (status,)).fetchall()
+      return [dict(r) for r in rows]
+
+class _Connection:
+  """sqlite3 connection as a context manager that also closes on exit."""
+
+  def __init__(self, path):
+    self.conn = sqlite3.connect(path, timeout = 60, isolation_level = None)
+
+  def __enter__(self):
+    return self.conn
+
+  def __exit__(self, *args):
+    self.conn.close()
+
+def resolve_target(target):
+  module_name, function_name = TARGETS.get(target, target).split(':')
+  return getattr(importlib.import_module(module_name), function_name)
+
+def target_parameters(target):
+  """Parameter names of target and whether each defaults to a string, and
+  whether it takes **kwargs, read from its module's source, so submitting a
+  job doesn't import the trainer (and tensorflow)."""
+  module_name, function_name = TARGETS.get(target, target).split(':')
+  spec = importlib.util.find_spec(module_name)
+  if spec is None or spec.origin is None: raise ValueError('no module %s' % module_name)
+  with open(spec.origin) as f: tree = ast.parse(f.read(), spec.origin)
+  for node in tree.body:
+    if isinstance(node, ast.FunctionDef) and node.name == function_name: break
+  else:
+    raise ValueError('no function %s in %s' % (function_name, module_name))
+  args = node.args
+  positional = args.posonlyargs + args.args
+  defaults = [None]*(len(positional) - len(args.defaults)) + args.defaults
+  parameters = {}
+  for arg, default in list(zip(positional, defaults)) + list(zip(args.kwonlyargs, args.kw_defaults)):
+    parameters[arg.arg] = isinstance(default, ast.Constant) and isinstance(default.value, str)
+  return parameters, args.kwarg is not None
+
+def parse_kwargs(target, args):
+  """key=value command line args as kwargs for target. Values are parsed as
+  JSON (numbers, true/false/null, lists, quoted strings), falling back to the
+  raw string, except for arguments whose default is a string, which are kept
+  as given (e.g. alice_config_ext=0). Keys target doesn't take raise a
+  ValueError."""
+  parameters, takes_kwargs = target_parameters(target)
+  kwargs = {}
+  for arg in args:
+    key, value = arg.split('=', 1)
+    if key not in parameters and not takes_kwargs:
+      raise ValueError('%s takes no argument %s' % (target, key))
+    if not parameters.get(key, False):
+      try:
+        value = json.loads(value)
+      except ValueError:
+        pass
+    kwargs[key] = value
+  return kwargs
+
+def work(queue_path, worker = None, heartbeat_every = 30, poll_every = 10,
+         exit_when_empty = True, **queue_kwargs):
+  """Worker loop: claims and runs jobs until the queue is empty (or forever,
+  polling every poll_every seconds, if exit_when_empty is False)."""
+  queue = JobQueue(queue_path, **queue_kwargs)
+  if worker is None: worker = '%s:%i' % (socket.gethostname(), os.getpid())
+  while True:
+    job = queue.claim(worker)
+    if job is None:
+      if exit_when_empty: return
+      time.sleep(poll_every)
+      continue
+    job_id, target, kwargs = job
+    print('Worker %s running job %i: %s(%s)' % (worker, job_id, target, kwargs))
+    # heartbeat from a background thread while the job runs
+    done = threading.Event()
+    def beat():
+      while not done.wait(heartbeat_every): queue.heartbeat(job_id, worker)
+    thread = threading.Thread(target = beat, daemon = True)
+    thread.start()
+    try:
+      result = resolve_target(target)(**kwargs)
+    except Exception:
+      done.set()
+      queue.fail(job_id, worker, traceback.format_exc())
+      print('Worker %s: job %i failed' % (worker, job_id))
+    else:
+      done.set()
+      queue.finish(job_id, worker, result)
+      print('Worker %s: job %i done' % (worker, job_id))
+    thread.join()
+
+def run_local_workers(queue_path, n_workers, **work_kwargs):
+  """Runs n_workers worker processes on this machine until the queue is empty."""
+  processes = [multiprocessing.Process(target = work, args = (queue_path,), kwargs = work_kwargs)
+               for _ in range(n_workers)]
+  for p in processes: p.start()
+  for p in processes: p.join()
+
+if __name__ == "__main__":
+  # usage: python -m sweeps.job_queue QUEUE.db submit alice|bob|module:function [key=value ...]
+  #        python -m sweeps.job_queue QUEUE.db work [n_workers]
+  #        python -m sweeps.job_queue QUEUE.db status
+  queue_path, command = sys.argv[1], sys.argv[2]
+  if command == 'submit':
+    kwargs = parse_kwargs(sys.argv[3], sys.argv[4:])
+    print(JobQueue(queue_path).submit(sys.argv[3], **kwargs))
+  elif command == 'work':
+    n_workers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    if n_workers == 1: work(queue_path)
+    else: run_local_workers(queue_path, n_workers)
+  elif command == 'status':
+    print(JobQueue(queue_path).counts())
+    for job in JobQueue(queue_path).jobs('failed'):
+      print('job %i (%s %s) failed:\n%s' % (job['id'], job['target'], job['kwargs'], job['error']))
+  else:
+    raise ValueError('unknown command %s' % command)
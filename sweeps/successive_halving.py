@@ -0,0 +1,132 @@
+import os
+import sys
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+if "../" not in sys.path: sys.path.append("../")
+from util.stats import rate_last_N, mean_last_N
+
+def reward_rate(stats, N = 10000):
+  """Reward per step over the last N steps (bob's, for two-agent stats)."""
+  if isinstance(stats, tuple) and not hasattr(stats, '_fields'): stats = stats[1]
+  return rate_last_N(np.cumsum(stats.episode_lengths), np.cumsum(stats.episode_rewards), N = N)
+
+def state_info(stats, N = 10000):
+  """Mean LSO per step, i.e. an I(S;G) estimate, over the last N steps (alice's)."""
+  if isinstance(stats, tuple) and not hasattr(stats, '_fields'): stats = stats[0]
+  lengths = np.asarray(stats.episode_lengths)
+  return mean_last_N(np.cumsum(lengths), np.asarray(stats.episode_lso)/lengths, N = N)
+
+def _trainer(kind):
+  """kind's training module (train_alice or train_bob)."""
+  if kind == 'alice': import train_alice as trainer
+  elif kind == 'bob': import train_bob as trainer
+  else: raise ValueError("kind must be 'alice' or 'bob'")
+  return trainer
+
+def _train(kind, train_kwargs, budget, results_directory, exp_name_prefix, final):
+  """Trains (or resumes) one config up to budget steps; runs in a worker.
+  Only a config's final rung writes a results directory."""
+  trainer = _trainer(kind)
+  train = trainer.train_alice if kind == 'alice' else trainer.train_bob
+  train(exp_name_prefix = exp_name_prefix, results_directory = results_directory,
+        max_steps = budget, plot = False, write_results = final, **train_kwargs)
+
+def _score(kind, train_kwargs, results_directory, exp_name_prefix, metric):
+  from util.checkpoint import load_train_state
+  directory = _trainer(kind).checkpoint_directory(exp_name_prefix = exp_name_prefix,
+                                                  results_directory = results_directory,
+                                                  **train_kwargs)
+  train_state = load_train_state(directory)
+  if train_state is None: raise RuntimeError('no checkpoint in %s' % directory)
+  return metric(train_state.stats)
+
+def successive_halving(configs, kind = 'alice', min_steps = 10000, max_steps = 500000,
+                       eta = 3, metric = reward_rate, maximize = True,
+                       n_workers = None, results_directory = None, sweep_name = 'sh'):
+  """Successive halving over training configs.
+
+  All configs are trained to min_steps, scored with metric, and only the top
+  1/eta are promoted to eta times the budget, resuming from their checkpoints,
+  until max_steps. Training runs on a local process pool. Intermediate rungs
+  are scored from checkpoints; only the final rung writes results directories.
+
+  Args:
+    configs: list of dicts of keyword args for train_alice / train_bob,
+      e.g. [{'alice_config_ext': '0'}, {'alice_config_ext': '1'}]
+    kind: 'alice' or 'bob'
+    metric: function of a checkpoint's episode stats (EpisodeStats for alice,
+      (alice_stats, bob_stats) for bob) returning a score
+    maximize: whether higher scores are better
+    n_workers: process pool size (defaults to # of cpus)
+    sweep_name: prefix distinguishing this sweep's runs and checkpoints;
+      re-running a sweep with the same name resumes it
+
+  Returns:
+    List of (config, final score, budget reached) tuples, best first, and the
+    history: one {config index: score} dict per rung.
+  """
+
+  if results_directory is None: results_directory = os.getcwd()+'/results/'
+  prefixes = ['%s_c%03i_' % (sweep_name, i) for i in range(len(configs))]
+  survivors = list(range(len(configs)))
+  scores = {}
+  reached = {}
+  history = []
+  budget = min_steps
+
+  with ProcessPoolExecutor(max_workers = n_workers) as pool:
+    while True:
+      print('Rung with budget %i steps: %i configs' % (budget, len(survivors)))
+      final = budget >= max_steps or len(survivors) == 1
+      futures = {i: pool.submit(_train, kind, configs[i], budget,
+                                results_directory, prefixes[i], final) for i in survivors}
+      rung = {}
+      for i, future in futures.items():
+        future.result() # re-raises worker errors
+        rung[i] = _score(kind, configs[i], results_directory, prefixes[i], metric)
+        scores[i] = rung[i]
+        reached[i] = budget
+      history.append(rung)
+      if budget >= max_steps or len(survivors) == 1: break
+      # promote the top 1/eta
+      ranked = sorted(survivors, key = lambda i: rung[i], reverse = maximize)
+      survivors = ranked[:max(1, len(survivors)//eta)]
+      budget = min(budget*eta, max_steps)
+
+  order = sorted(scores, key = lambda i: (reached[i], scores[i] if maximize else -scores[i]),
+                 reverse = True)
+  return [(configs[i], scores[i], reached[i]) for i in order], history
+
+def hyperband(sample_configs, kind = 'alice', min_steps = 10000, max_steps = 500000,
+              eta = 3, metric = reward_rate, maximize = True, n_workers = None,
+              results_directory = None, sweep_name = 'hb'):
+  """Hyperband: successive halving brackets trading off # of configs against
+  starting budget. sample_configs(n) returns a list of n config dicts (see
+  successive_halving). Returns the best (config, score, budget) per bracket."""
+
+  s_max = int(math.floor(math.log(max_steps/min_steps, eta) + 1e-9))
+  best = []
+  for s in range(s_max, -1, -1):
+    n = int(math.ceil((s_max+1)/(s+1) * eta**s))
+    ranking, _ = successive_halving(sample_configs(n),
+                                    kind = kind,
+                                    min_steps = int(max_steps * eta**(-s)),
+                                    max_steps = max_steps,
+                                    eta = eta,
+                                    metric = metric,
+                                    maximize = maximize,
+                                    n_workers = n_workers,
+                                    results_directory = results_directory,
+                                    sweep_name = '%s_b%i' % (sweep_name, s))
+    best.append(ranking[0])
+  return best
+
+if __name__ == "__main__":
+  # reg strength sweep over the alice configs written by auto_config
+  configs = [{'alice_config_ext': str(i)} for i in range(5)]
+  ranking, history = successive_halving(configs, kind = 'alice',
+                                        min_steps = 20000, max_steps = 500000,
+                                        metric = reward_rate)
+  for config, score, budget in ranking:
+    print('%s: %.4f (%i steps)' % (config, score, budget))
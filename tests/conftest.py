@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the repo's modules are imported from its root (as the training scripts do)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
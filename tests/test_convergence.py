@@ -0,0 +1,82 @@
+import copy
+from collections import namedtuple
+from util.convergence import ConvergenceMonitor
+from training.loop import TrainingLoop
+
+# stand-in for util.checkpoint.TrainState (which needs tensorflow)
+State = namedtuple('State', ['step_count', 'learning_rate_scale', 'sampler_states',
+                             'monitor_state'])
+
+class MemoryCheckpointer:
+  """util.checkpoint.Checkpointer's interface, in memory."""
+
+  def __init__(self, every):
+    self.every = every
+    self.last_step = 0
+    self.saved = []
+
+  def due(self, step_count):
+    return step_count - self.last_step >= self.every
+
+  def latest(self):
+    return 'model-%i' % self.saved[-1].step_count if self.saved else None
+
+  def save(self, train_state):
+    self.saved.append(copy.deepcopy(train_state))
+    self.last_step = train_state.step_count
+
+  def restore(self, env = None):
+    if not self.saved: return None
+    self.last_step = self.saved[-1].step_count
+    return copy.deepcopy(self.saved[-1])
+
+def _monitor():
+  return ConvergenceMonitor(window = 20, patience = 60, check_every = 10)
+
+def _state(step_count, monitor_state = None):
+  return State(step_count = step_count, learning_rate_scale = 1, sampler_states = None,
+               monitor_state = monitor_state)
+
+def _run(loop, step_count, steps, reward):
+  """Feeds 5-step episodes up to steps; returns the step count reached and
+  whether the loop reported convergence."""
+  while step_count < steps:
+    step_count += 5
+    if loop.end_episode(step_count, 5, reward, lambda: _state(step_count)):
+      return step_count, True
+  return step_count, False
+
+def test_rollback_restores_monitor():
+  loop = TrainingLoop(env = None, checkpointer = MemoryCheckpointer(every = 20), monitor = _monitor())
+  step_count, converged = _run(loop, 0, 40, reward = 1.)
+  assert not converged and loop.checkpointer.last_step == 40
+  checkpointed = loop.monitor.get_state()
+  
+  # episodes after the checkpoint, then nans: they are rolled back
+  _run(loop, step_count, 55, reward = -3.)
+  assert loop.monitor.last_check_step == 50
+  train_state = loop.rollback()
+  assert train_state.step_count == 40
+  assert loop.monitor.last_check_step == checkpointed['last_check_step']
+  assert loop.monitor.reward_rate.rate() == checkpointed['reward_rate'].rate()
+  assert loop.monitor.history == checkpointed['history']
+  
+  # training on from the checkpoint checks and converges exactly as a run
+  # that never saw the discarded episodes
+  step_count, converged = _run(loop, train_state.step_count, 200, reward = 1.)
+  reference = TrainingLoop(env = None, monitor = _monitor())
+  reference_step_count, reference_converged = _run(reference, 0, 200, reward = 1.)
+  assert converged and reference_converged
+  assert step_count == reference_step_count
+  assert loop.monitor.stop_step == reference.monitor.stop_step
+  assert loop.monitor.history == reference.monitor.history
+
+def test_resume_without_monitor_state_resets_monitor():
+  checkpointer = MemoryCheckpointer(every = 20)
+  checkpointer.save(_state(40))
+  monitor = _monitor()
+  loop = TrainingLoop(env = None, checkpointer = checkpointer, monitor = monitor)
+  _run(loop, 0, 30, reward = 1.)
+  loop.resume()
+  assert monitor.last_check_step == 0 and monitor.history == []
+  assert monitor.reward_rate.rate() is None
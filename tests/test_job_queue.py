@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import multiprocessing
+import pytest
+from sweeps.job_queue import JobQueue, parse_kwargs, run_local_workers, work
+
+def _claim_all(args):
+  """Claims jobs as worker until none are pending; returns their ids."""
+  path, worker = args
+  queue = JobQueue(path)
+  claimed = []
+  while True:
+    job = queue.claim(worker)
+    if job is None: return claimed
+    claimed.append(job[0])
+    queue.finish(job[0], worker, None)
+
+def record(log, n):
+  """Job target: appends n to log (O_APPEND, so concurrent lines don't mix)."""
+  with open(log, 'a') as f: f.write('%i\n' % n)
+  return n
+
+def fail_once(flag):
+  """Job target: fails on its first run, succeeds after."""
+  if not os.path.exists(flag):
+    open(flag, 'w').close()
+    raise RuntimeError('first attempt fails')
+  return 'ok'
+
+def always_fail():
+  raise RuntimeError('always fails')
+
+def test_concurrent_claims_are_disjoint(tmp_path):
+  path = str(tmp_path / 'queue.db')
+  queue = JobQueue(path)
+  job_ids = [queue.submit('alice', seed = i) for i in range(200)]
+  with multiprocessing.get_context('fork').Pool(8) as pool:
+    claims = pool.map(_claim_all, [(path, 'worker%i' % i) for i in range(8)])
+  claimed = [job_id for c in claims for job_id in c]
+  assert sorted(claimed) == job_ids
+  assert queue.counts() == {'done': 200}
+  assert all(job['attempts'] == 1 for job in queue.jobs())
+
+def test_local_workers_run_each_job_once(tmp_path):
+  path, log = str(tmp_path / 'queue.db'), str(tmp_path / 'log')
+  queue = JobQueue(path)
+  for n in range(40): queue.submit('%s:record' % __name__, log = log, n = n)
+  run_local_workers(path, 4)
+  with open(log) as f: assert sorted(int(line) for line in f) == list(range(40))
+  jobs = queue.jobs()
+  assert all(job['status'] == 'done' and job['attempts'] == 1 for job in jobs)
+  assert sorted(json.loads(job['result']) for job in jobs) == list(range(40))
+
+def test_failed_job_is_requeued(tmp_path):
+  path = str(tmp_path / 'queue.db')
+  queue = JobQueue(path, max_attempts = 3)
+  retried = queue.submit('%s:fail_once' % __name__, flag = str(tmp_path / 'flag'))
+  failed = queue.submit('%s:always_fail' % __name__)
+  work(path, worker = 'w', max_attempts = 3)
+  retried, failed = [job for job in queue.jobs() if job['id'] in (retried, failed)]
+  assert retried['status'] == 'done' and retried['attempts'] == 2
+  assert json.loads(retried['result']) == 'ok'
+  assert 'first attempt fails' in retried['error']
+  assert failed['status'] == 'failed' and failed['attempts'] == 3
+  assert 'always fails' in failed['error']
+
+def test_dead_worker_job_is_requeued(tmp_path):
+  path = str(tmp_path / 'queue.db')
+  queue = JobQueue(path, heartbeat_timeout = -1) # every heartbeat is stale
+  job_id = queue.submit('alice')
+  assert queue.claim('dead')[0] == job_id
+  assert queue.claim('alive')[0] == job_id
+  job, = queue.jobs()
+  assert job['worker'] == 'alive' and job['attempts'] == 2
+
+def test_parse_kwargs_does_not_import_trainer():
+  kwargs = parse_kwargs('alice', ['alice_config_ext=0', 'seed=3', 'max_steps=null', 'plot=false'])
+  assert kwargs == {'alice_config_ext': '0', 'seed': 3, 'max_steps': None, 'plot': False}
+  assert 'train_alice' not in sys.modules and 'tensorflow' not in sys.modules
+  with pytest.raises(ValueError):
+    parse_kwargs('alice', ['sed=3'])
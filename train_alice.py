@@ -5,41 +5,180 @@ import sys
 import pickle
 import datetime
 import importlib
+import functools
 from collections import namedtuple
+import shutil
 from shutil import copy
 if "../" not in sys.path:
   sys.path.append("../") 
 from envs.TwoGoalGridWorld import TwoGoalGridWorld
 from agents.alice import TabularREINFORCE, get_values, get_kls, get_action_probs
 from training.REINFORCE_alice import reinforce
-from plotting.plot_episode_stats import plot_episode_stats
+from training.actor_critic_alice import actor_critic
+from training.exact_gradient_alice import exact_gradient
+from plotting.plot_episode_stats import summarize_episode_stats, episode_stats_tasks, FigureSizes
+from plotting.derived_series import RunSeries
+from plotting.figure_pipeline import FigurePipeline, run_detached
 from plotting.visualize_grid_world import plot_value_map, plot_kl_map, plot_lso_map, plot_state_densities, print_policy
-from util.stats import first_time_to
+from util.stats import RewardTimes
+from util.checkpoint import Checkpointer, latest_checkpoint, link_checkpoint
+from util.convergence import ConvergenceMonitor
+from util.profiler import Profiler
+from util.memory import MemoryMonitor
+from util.results_store import save_results
+from plotting.lod import save_pyramids, lod_series
+from util.cache import ResultCache, fingerprint, code_version
 
 Result = namedtuple('Result',
                    ['episode_lengths', 'episode_rewards', 'values',
                     'action_kls', 'log_state_odds',
                     'action_probs', 'state_goal_counts',
-                    'steps_per_reward', 'total_steps'])
+                    'steps_per_reward', 'total_steps', 'stop_step'])
+Result.__new__.__defaults__ = (None,) # results saved before early stopping
+# episode_* fields are numpy arrays (lists in results saved before columnar stats)
+
+# an alice run's configs, as loaded by _load_run
+Run = namedtuple('Run', ['env_param', 'agent_param', 'training_param', 'experiment_name',
+                         'convergence_param', 'algorithm', 'trace_decay', 'exact_updates'])
+
+def _load_run(alice_config_ext, env_config_ext, exp_name_ext):
+  config = importlib.import_module('alice_config'+alice_config_ext)
+  env_config = importlib.import_module('env_config'+env_config_ext)
+  env_param, env_exp_name_ext = env_config.get_config()
+  agent_param, training_param, experiment_name = config.get_config()
+  # 'reinforce' (default), 'actor_critic' (online TD(lambda), lambda = trace_decay)
+  # or 'exact_gradient' (model-based full-batch updates, exact_updates of them)
+  algorithm = getattr(config, 'algorithm', 'reinforce')
+  if algorithm not in ['reinforce', 'actor_critic', 'exact_gradient']: raise ValueError('unknown algorithm %s' % algorithm)
+  return Run(env_param = env_param,
+             agent_param = agent_param,
+             training_param = training_param,
+             experiment_name = experiment_name + env_exp_name_ext + exp_name_ext,
+             convergence_param = getattr(config, 'convergence_param', None),
+             algorithm = algorithm,
+             trace_decay = getattr(config, 'trace_decay', .9) if algorithm == 'actor_critic' else None,
+             exact_updates = getattr(config, 'exact_updates', 5000) if algorithm == 'exact_gradient' else None)
+
+def _run_key(run, seed):
+  """Identity of a run, for its checkpoints: everything but its length, so a
+  longer budget (e.g. a sweep's next rung) resumes where a shorter one stopped."""
+  return fingerprint('alice', run.env_param, run.agent_param, run.training_param,
+                     run.convergence_param, run.algorithm, run.trace_decay,
+                     run.exact_updates, seed, code_version())
+
+def checkpoint_directory(alice_config_ext = '', env_config_ext = '', exp_name_ext = '',
+                         exp_name_prefix = '', results_directory = None, seed = None, **kwargs):
+  """Where train_alice, given the same arguments, keeps its checkpoints."""
+  if results_directory is None: results_directory = os.getcwd()+'/results/'
+  run = _load_run(alice_config_ext, env_config_ext, exp_name_ext)
+  return _checkpoint_directory(results_directory, exp_name_prefix, run.experiment_name, _run_key(run, seed))
+
+def _checkpoint_directory(results_directory, exp_name_prefix, experiment_name, run_key):
+  return results_directory+'checkpoints/'+exp_name_prefix+experiment_name+'_'+run_key[:12]+'/'
+
+def _in_updates(run, steps):
+  """A cadence of steps (checkpoints, memory samples, convergence checks) in
+  exact_gradient updates, which count steps, scaled as its schedules are
+  (training_param.training_steps over exact_updates), rounding up."""
+  if steps is None or run.algorithm != 'exact_gradient': return steps
+  return -(-steps * run.exact_updates // run.training_param.training_steps)
 
 def train_alice(alice_config_ext = '', env_config_ext = '',
-                exp_name_ext = '', exp_name_prefix = '', results_directory = None):
+                exp_name_ext = '', exp_name_prefix = '', results_directory = None,
+                checkpoint_every = 10000, max_steps = None, plot = True,
+                seed = None, force = False, profile_every = None,
+                memory_every = None, tracemalloc_top = 0, plot_processes = None,
+                detach_plots = False, write_results = True):
+  """Trains alice as configured by alice_config<ext>/env_config<ext>.
+  max_steps stops (resumably) after that many steps of the configured run,
+  e.g. for successive halving; plot = False skips all figures, and
+  write_results = False everything in the results directory (only the
+  summary is returned and the checkpoints kept, e.g. for a sweep's
+  intermediate rungs).
+  
+  Checkpoints are kept per run (configs, seed and code; see
+  checkpoint_directory), so only a relaunch of the same run resumes from
+  them, and are removed once it has finished (unless it had max_steps, or a
+  seed: its cache entry links them, for resuming under another name).
+  With a seed, runs are reproducible and cached: if an identical run (same
+  env/agent/training params, seed, steps and code) is in the results index,
+  its results are returned without training (unless force = True).
+  profile_every = N profiles the training loop, reporting every N episodes.
+  memory_every = N samples memory use every N steps (with the top tracemalloc_top
+  allocation sites, if > 0) into memory.jsonl. For exact_gradient, these,
+  max_steps, checkpoint_every and convergence_param's cadences are scaled to
+  updates.
+  Figures are rendered by plot_processes worker processes (default: one per
+  cpu); with detach_plots, by a background process that outlives this call
+  (each figure's files are done once its .done marker exists)."""
   
   if results_directory is None: results_directory = os.getcwd()+'/results/'
   
-  config = importlib.import_module('alice_config'+alice_config_ext)
-  env_config = importlib.import_module('env_config'+env_config_ext)
+  run = _load_run(alice_config_ext, env_config_ext, exp_name_ext)
+  env_param, agent_param, training_param = run.env_param, run.agent_param, run.training_param
+  experiment_name = run.experiment_name
+  convergence_param = run.convergence_param
+  algorithm, trace_decay, exact_updates = run.algorithm, run.trace_decay, run.exact_updates
+  if algorithm == 'exact_gradient':
+    # training_steps counts updates; schedules still span training_param.training_steps
+    configured_steps = exact_updates
+  else:
+    configured_steps = training_param.training_steps
+  # and so do max_steps and the loop's cadences (the monitor's window weighs
+  # episodes by their expected lengths, so it stays in steps)
+  checkpoint_every = _in_updates(run, checkpoint_every)
+  memory_every = _in_updates(run, memory_every)
+  if convergence_param is not None:
+    convergence_param = convergence_param._replace(
+        patience = _in_updates(run, convergence_param.patience),
+        check_every = _in_updates(run, convergence_param.check_every),
+        min_steps = _in_updates(run, convergence_param.min_steps))
+  training_steps = min(_in_updates(run, max_steps) or configured_steps, configured_steps)
+  run_key = _run_key(run, seed)
+  checkpoint_directory = _checkpoint_directory(results_directory, exp_name_prefix,
+                                               experiment_name, run_key)
+  
+  # unseeded runs are not reproducible, so only seeded runs are cached
+  if seed is not None:
+    cache = ResultCache(results_directory)
+    key = fingerprint(run_key, training_steps)
+    entry = None if force else cache.lookup(key)
+    if entry is not None:
+      print('Identical run found in %s, skipping training.' % entry['directory'])
+      # make the run resumable under this name too (e.g. for longer sweep rungs)
+      if latest_checkpoint(checkpoint_directory) is None:
+        link_checkpoint(entry['checkpoint_directory'], checkpoint_directory)
+      steps_per_reward, action_info, state_info = entry['summary']
+      return steps_per_reward, action_info, state_info, experiment_name
+  else:
+    cache = None
+  
+  # optional per-phase timing of the training loop, saved as profile.json
+  if profile_every is not None: profiler = Profiler(report_every = profile_every)
+  else: profiler = None
+  # optional memory sampling, streamed next to the checkpoints while training
+  # (so it survives a crash) and copied into the results directory after
+  if memory_every is not None:
+    if not os.path.exists(checkpoint_directory): os.makedirs(checkpoint_directory)
+    memory_monitor = MemoryMonitor(checkpoint_directory+'memory.jsonl', every = memory_every,
+                                   tracemalloc_top = tracemalloc_top)
+  else:
+    memory_monitor = None
   
   # run training, and if nans, creep in, train again until they don't
   success = False
+  attempt = 0
   
   while not success:
     # initialize experiment using config.py
     tf.reset_default_graph()
     #global_step = tf.Variable(0, name = "global_step", trainable = False)
-    env_param, env_exp_name_ext = env_config.get_config()
-    agent_param, training_param, experiment_name = config.get_config()
-    experiment_name = experiment_name + env_exp_name_ext + exp_name_ext
+    if seed is not None:
+      # restarts after nans get different, but still deterministic, seeds
+      run_seed = seed + 1000003*attempt
+      np.random.seed(run_seed)
+      tf.set_random_seed(run_seed)
+    attempt += 1
     env = TwoGoalGridWorld(shape = env_param.shape,
                            r_correct = env_param.r_correct,
                            r_incorrect = env_param.r_incorrect,
@@ -48,30 +187,52 @@ def train_alice(alice_config_ext = '', env_config_ext = '',
                            p_rand = env_param.p_rand,
                            goal_locs = env_param.goal_locs,
                            goal_dist = env_param.goal_dist)
+    if seed is not None: env.seed(run_seed)
     print('Initialized environment.')
     with tf.variable_scope('alice'):
       alice = TabularREINFORCE(env,
                                use_action_info = agent_param.use_action_info,
-                               use_state_info = agent_param.use_state_info)
+                               use_state_info = agent_param.use_state_info,
+                               trace_decay = trace_decay,
+                               exact_gradient = algorithm == 'exact_gradient')
       print('Initialized agent.')
     saver = tf.train.Saver()
     
     # run experiment
     with tf.Session() as sess:
       sess.run(tf.global_variables_initializer())
-      stats, success = reinforce(env = env,
-                                 agent = alice,
-                                 training_steps = training_param.training_steps,
-                                 learning_rate = training_param.learning_rate,
-                                 entropy_scale = training_param.entropy_scale,
-                                 value_scale = training_param.value_scale,
-                                 action_info_scale = training_param.action_info_scale,
-                                 state_info_scale = training_param.state_info_scale,
-                                 state_count_discount = training_param.state_count_discount,
-                                 discount_factor = training_param.discount_factor,
-                                 max_episode_length = training_param.max_episode_length)
+      # checkpoints live under a stable name, so a relaunched job resumes
+      checkpointer = Checkpointer(checkpoint_directory, every = checkpoint_every,
+                                  run_key = run_key)
+      # optional early stopping, configured by convergence_param in config
+      if convergence_param is not None: monitor = ConvergenceMonitor(**convergence_param._asdict())
+      else: monitor = None
+      if algorithm == 'exact_gradient':
+        # expected episode lengths are fractional
+        reward_times = RewardTimes(np.float64)
+        train = functools.partial(exact_gradient, schedule_steps = training_param.training_steps)
+      else:
+        reward_times = RewardTimes() # total_steps and steps_per_reward, built while training
+        train = actor_critic if algorithm == 'actor_critic' else reinforce
+      stats, success = train(env = env,
+                             agent = alice,
+                             training_steps = training_steps,
+                             learning_rate = training_param.learning_rate,
+                             entropy_scale = training_param.entropy_scale,
+                             value_scale = training_param.value_scale,
+                             action_info_scale = training_param.action_info_scale,
+                             state_info_scale = training_param.state_info_scale,
+                             state_count_discount = training_param.state_count_discount,
+                             discount_factor = training_param.discount_factor,
+                             max_episode_length = training_param.max_episode_length,
+                             checkpointer = checkpointer,
+                             monitor = monitor,
+                             profiler = profiler,
+                             memory_monitor = memory_monitor,
+                             reward_times = reward_times)
       if success: 
         print('Finished training.')
+        print('Near-overflow events during training: %i' % alice.near_overflow_events)
         values = get_values(alice, env, sess) # state X goal
         print('Extracted values.')
         if alice.use_action_info:
@@ -92,21 +253,22 @@ def train_alice(alice_config_ext = '', env_config_ext = '',
         action_probs = get_action_probs(alice, env, sess) # state X goal X action
         print('Extracted policy.')
         # save session
-        experiment_directory = exp_name_prefix+datetime.datetime.now().strftime("%Y_%m_%d_%H%M")+'_'+experiment_name+'/'
-        directory = results_directory + experiment_directory
-        save_path = saver.save(sess, directory+"alice.ckpt")
-        print('')
-        print("Model saved in path: %s" % save_path)
+        if write_results:
+          experiment_directory = exp_name_prefix+datetime.datetime.now().strftime("%Y_%m_%d_%H%M")+'_'+experiment_name+'/'
+          directory = results_directory + experiment_directory
+          save_path = saver.save(sess, directory+"alice.ckpt")
+          print('')
+          print("Model saved in path: %s" % save_path)
       else:
         print('Unsucessful run - restarting.')
+        checkpointer.clear() # nans persisted through rollbacks, so start fresh
         f = open('error.txt','a')
         d = datetime.datetime.now().strftime("%A, %B %d, %I:%M:%S %p")
         f.write("{}: experiment '{}' failed and reran\n".format(d, exp_name_prefix+experiment_name))
         f.close()
   
   # save experiment stats  
-  total_steps, steps_per_reward = first_time_to(stats.episode_lengths,
-                                                stats.episode_rewards)
+  total_steps, steps_per_reward = reward_times.result()
   result = Result(episode_lengths = stats.episode_lengths,
                   episode_rewards = stats.episode_rewards,
                   values = values,
@@ -115,46 +277,74 @@ def train_alice(alice_config_ext = '', env_config_ext = '',
                   action_probs = action_probs,
                   state_goal_counts = stats.state_goal_counts,
                   steps_per_reward = steps_per_reward,
-                  total_steps = total_steps)
+                  total_steps = total_steps,
+                  stop_step = monitor.stop_step if monitor is not None else None)
+  if not write_results:
+    if memory_monitor is not None: memory_monitor.stop()
+    steps_per_reward, _, action_info, state_info = summarize_episode_stats(stats)
+    print('FINISHED')
+    return steps_per_reward, action_info, state_info, experiment_name
   if not os.path.exists(directory): os.makedirs(directory)
   with open(directory+'results.pkl', 'wb') as output:
     pickle.dump(result, output, pickle.HIGHEST_PROTOCOL)
+  save_results(result, directory) # columnar copy, for lazy loading
+  save_pyramids(directory, lod_series(result)) # for fast plotting of long runs
   print('Saved stats.')
+  if profiler is not None:
+    profiler.save(directory+'profile.json')
+    print('Saved profile.')
+  if memory_monitor is not None:
+    memory_monitor.stop()
+    if os.path.exists(memory_monitor.path): copy(memory_monitor.path, directory+'memory.jsonl')
+    print('Saved memory samples.')
+  # the finished run is in results now; its checkpoints were only kept so a
+  # relaunch could resume it (budgeted runs keep them for a longer budget,
+  # and cached runs for link_checkpoint on a cache hit)
+  if max_steps is None and cache is None:
+    shutil.rmtree(checkpoint_directory, ignore_errors = True)
   
   # copy config file to results directory to ensure experiment repeatable
   copy(os.getcwd()+'/alice_config'+alice_config_ext+'.py', directory+'alice_config.py')
   copy(os.getcwd()+'/env_config'+env_config_ext+'.py', directory+'env_config.py')
   print('Copied configs.')
       
+  # rolling means, saved next to the results for later plots of this run
+  series = RunSeries(stats, directory = directory)
+  if not plot:
+    steps_per_reward, _, action_info, state_info = summarize_episode_stats(stats, series = series)
+    if cache is not None:
+      cache.add(key, directory, checkpoint_directory, [steps_per_reward, action_info, state_info])
+    print('FINISHED')
+    return steps_per_reward, action_info, state_info, experiment_name
+  
   # plot experiment and save figures
-  FigureSizes = namedtuple('FigureSizes', ['figure', 'tick_label', 'axis_label', 'title'])
   figure_sizes = FigureSizes(figure = (50,25),
                              tick_label = 40,
                              axis_label = 50,
                              title = 60)
   
-  steps_per_reward, _, action_info, state_info  = plot_episode_stats(stats,
-                                                                     figure_sizes,
-                                                                     noshow = True,
-                                                                     directory = directory)
-  k = 15
-  print('')
-  print('-'*k+'VALUES'+'-'*k)
-  plot_value_map(values, action_probs, env, figure_sizes, noshow = True, directory = directory)
+  # figures are independent, so they are rendered in parallel
+  figure_kwargs = {'noshow': True, 'directory': directory}
+  tasks = episode_stats_tasks(series, figure_sizes, directory)
+  tasks.append((plot_value_map, (values, action_probs, env, figure_sizes), figure_kwargs))
   if action_kls is not None:
-    print('')
-    print('-'*k+'KLS'+'-'*k)
-    plot_kl_map(action_kls, action_probs, env, figure_sizes, noshow = True, directory = directory)
+    tasks.append((plot_kl_map, (action_kls, action_probs, env, figure_sizes), figure_kwargs))
   if lso is not None:
-    print('')
-    print('-'*k+'LSOS'+'-'*k)
-    plot_lso_map(lso, action_probs, env, figure_sizes, noshow = True, directory = directory)
-    print('')
-    print('-'*k+'STATE DENSITIES'+'-'*k)
-    plot_state_densities(stats.state_goal_counts, action_probs, env, figure_sizes, noshow = True, directory = directory)
+    tasks.append((plot_lso_map, (lso, action_probs, env, figure_sizes), figure_kwargs))
+    tasks.append((plot_state_densities, (stats.state_goal_counts, action_probs, env, figure_sizes), figure_kwargs))
+  if detach_plots:
+    run_detached(tasks, directory, processes = plot_processes)
+    print('Plotting in the background (log in %sfigures.log).' % directory)
+  else:
+    with FigurePipeline(processes = plot_processes) as pipeline:
+      for fn, args, kwargs in tasks: pipeline.submit(fn, *args, **kwargs)
+  steps_per_reward, _, action_info, state_info = summarize_episode_stats(stats, series = series)
+  k = 15
   print('')
   print('-'*k+'POLICY'+'-'*k)
   print_policy(action_probs, env)
+  if cache is not None:
+    cache.add(key, directory, checkpoint_directory, [steps_per_reward, action_info, state_info])
   print('')
   print('FINISHED')
   
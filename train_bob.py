@@ -1,4 +1,5 @@
 import tensorflow as tf
+import numpy as np
 import os
 import sys
 import pickle
@@ -6,17 +7,31 @@ import datetime
 import importlib
 import glob
 import imp
+import functools
 from collections import namedtuple
+import shutil
 from shutil import copy
 if "../" not in sys.path: sys.path.append("../") 
 from envs.TwoGoalGridWorld import TwoGoalGridWorld
-from agents.bob import RNNObserver
+from agents.bob import RNNObserver, export_weights
+from agents.numpy_observer import WEIGHTS_FILE
 from agents.alice import TabularREINFORCE
 from training.REINFORCE_bob import reinforce
-from plotting.plot_episode_stats import plot_episode_stats
-from util.stats import first_time_to
+from training.actor_critic_bob import actor_critic
+from plotting.plot_episode_stats import summarize_episode_stats, episode_stats_tasks, FigureSizes
+from plotting.derived_series import RunSeries
+from plotting.figure_pipeline import FigurePipeline, run_detached
+from util.stats import RewardTimes
+from util.checkpoint import Checkpointer, latest_checkpoint, link_checkpoint
+from util.convergence import ConvergenceMonitor
+from util.profiler import Profiler
+from util.memory import MemoryMonitor
+from util.results_store import save_results
+from plotting.lod import save_pyramids, lod_series
+from util.cache import ResultCache, fingerprint, file_digest, code_version, link_or_copy
 
-Result = namedtuple('Result', ['alice', 'bob'])
+Result = namedtuple('Result', ['alice', 'bob', 'stop_step'])
+Result.__new__.__defaults__ = (None,) # results saved before early stopping
 Stats = namedtuple('Stats', ['episode_lengths',
                              'episode_rewards',
                              'episode_action_kl',
@@ -24,27 +39,90 @@ Stats = namedtuple('Stats', ['episode_lengths',
                              'state_goal_counts',
                              'steps_per_reward',
                              'total_steps'])
+# episode_* fields are numpy arrays (lists in results saved before columnar stats)
+
+# a bob run's configs (and the alice he trains with), as loaded by _load_run
+Run = namedtuple('Run', ['agent_param', 'training_param', 'experiment_name', 'alice_directory',
+                         'alice_files', 'convergence_param', 'algorithm', 'n_step'])
+
+def _load_run(bob_config_ext, exp_name_ext, results_directory):
+  config = importlib.import_module('bob_config'+bob_config_ext)
+  agent_param, training_param, experiment_name, alice_experiment = config.get_config()
+  alice_directory = results_directory+alice_experiment+'/'
+  env_config = imp.load_source('env_config', alice_directory+'env_config.py')
+  _, env_exp_name_ext = env_config.get_config()
+  # 'reinforce' (default) or 'actor_critic' (online, n_step bootstrapped returns)
+  algorithm = getattr(config, 'algorithm', 'reinforce')
+  if algorithm not in ['reinforce', 'actor_critic']: raise ValueError('unknown algorithm %s' % algorithm)
+  return Run(agent_param = agent_param,
+             training_param = training_param,
+             experiment_name = experiment_name + env_exp_name_ext + exp_name_ext,
+             alice_directory = alice_directory,
+             alice_files = glob.glob(alice_directory+'alice.ckpt*') + [alice_directory+'checkpoint'],
+             convergence_param = getattr(config, 'convergence_param', None),
+             algorithm = algorithm,
+             n_step = getattr(config, 'n_step', 5) if algorithm == 'actor_critic' else None)
+
+def _run_key(run, seed):
+  """Identity of a run, for its checkpoints: bob's configs, seed and code and
+  alice's checkpoint and configs (by content, so copies of the same alice
+  share runs), but not its length, so a longer budget resumes a shorter one."""
+  alice_digest = file_digest(run.alice_files + [run.alice_directory+'alice_config.py',
+                                                run.alice_directory+'env_config.py'])
+  return fingerprint('bob', run.agent_param, run.training_param, run.convergence_param,
+                     run.algorithm, run.n_step, alice_digest, seed, code_version())
+
+def checkpoint_directory(bob_config_ext = '', exp_name_ext = '', exp_name_prefix = '',
+                         results_directory = None, seed = None, **kwargs):
+  """Where train_bob, given the same arguments, keeps its checkpoints."""
+  if results_directory is None: results_directory = os.getcwd()+'/results/'
+  run = _load_run(bob_config_ext, exp_name_ext, results_directory)
+  return _checkpoint_directory(results_directory, exp_name_prefix, run.experiment_name, _run_key(run, seed))
+
+def _checkpoint_directory(results_directory, exp_name_prefix, experiment_name, run_key):
+  return results_directory+'checkpoints/'+exp_name_prefix+experiment_name+'_'+run_key[:12]+'/'
 
 def train_bob(bob_config_ext = '', exp_name_ext = '', exp_name_prefix = '',
-              results_directory = None):
+              results_directory = None, checkpoint_every = 10000,
+              max_steps = None, plot = True, seed = None, force = False,
+              profile_every = None, memory_every = None, tracemalloc_top = 0,
+              plot_processes = None, detach_plots = False, write_results = True):
+  """Trains bob as configured by bob_config<ext>, alongside the trained alice
+  it names. max_steps stops (resumably) after that many steps of the
+  configured run, e.g. for successive halving; plot = False skips figures,
+  and write_results = False writes no results directory at all (just
+  returns the summary, keeping the checkpoints; for intermediate rungs).
+  
+  Checkpoints are kept per run (bob's configs, seed and code, and alice; see
+  checkpoint_directory), so only a relaunch of the same run resumes from
+  them, and are removed once it has finished (unless it had max_steps, or a
+  seed: its cache entry links them, for resuming under another name).
+  With a seed, runs are reproducible and cached: if an identical run (same
+  bob params, alice checkpoint and configs, seed, steps and code) is in the
+  results index, its results are returned without training (unless force).
+  profile_every = N profiles the training loop, reporting every N episodes.
+  memory_every = N samples memory use every N steps (with the top tracemalloc_top
+  allocation sites, if > 0) into memory.jsonl.
+  Figures are rendered by plot_processes worker processes (default: one per
+  cpu); with detach_plots, by a background process that outlives this call
+  (each figure's files are done once its .done marker exists)."""
   
   if results_directory is None: results_directory = os.getcwd()+'/results/'
   
   # import bob
-  config = importlib.import_module('bob_config'+bob_config_ext)
-  agent_param, training_param, experiment_name, alice_experiment = config.get_config()
+  run = _load_run(bob_config_ext, exp_name_ext, results_directory)
+  agent_param, training_param, experiment_name = run.agent_param, run.training_param, run.experiment_name
   print('Imported Bob.')
   
   # import alice
-  alice_directory = results_directory+alice_experiment+'/'
+  alice_directory = run.alice_directory
   alice_config = imp.load_source('alice_config', alice_directory+'alice_config.py')
   alice_agent_param, alice_training_param, alice_experiment_name = alice_config.get_config()
   print('Imported Alice.')
   
   # import and init env
   env_config = imp.load_source('env_config', alice_directory+'env_config.py')
-  env_param, env_exp_name_ext = env_config.get_config()
-  experiment_name = experiment_name + env_exp_name_ext + exp_name_ext
+  env_param, _ = env_config.get_config()
   env = TwoGoalGridWorld(shape = env_param.shape,
                          r_correct = env_param.r_correct,
                          r_incorrect = env_param.r_incorrect,
@@ -54,13 +132,55 @@ def train_bob(bob_config_ext = '', exp_name_ext = '', exp_name_prefix = '',
                          goal_locs = env_param.goal_locs,
                          goal_dist = env_param.goal_dist)
   print('Imported environment.')
+  training_steps = min(max_steps or training_param.training_steps, training_param.training_steps)
+  convergence_param = run.convergence_param
+  algorithm, n_step = run.algorithm, run.n_step
+  alice_files = run.alice_files
+  run_key = _run_key(run, seed)
+  checkpoint_directory = _checkpoint_directory(results_directory, exp_name_prefix,
+                                               experiment_name, run_key)
+  
+  # unseeded runs are not reproducible, so only seeded runs are cached
+  if seed is not None:
+    cache = ResultCache(results_directory)
+    key = fingerprint(run_key, training_steps)
+    entry = None if force else cache.lookup(key)
+    if entry is not None:
+      print('Identical run found in %s, skipping training.' % entry['directory'])
+      # make the run resumable under this name too (e.g. for longer sweep rungs)
+      if latest_checkpoint(checkpoint_directory) is None:
+        link_checkpoint(entry['checkpoint_directory'], checkpoint_directory)
+      avg_steps_per_reward, avg_steps_per_reward_alice, action_info, state_info = entry['summary']
+      return avg_steps_per_reward, avg_steps_per_reward_alice, action_info, state_info, experiment_name
+  else:
+    cache = None
    
+  # optional per-phase timing of the training loop, saved as profile.json
+  if profile_every is not None: profiler = Profiler(report_every = profile_every)
+  else: profiler = None
+  # optional memory sampling, streamed next to the checkpoints while training
+  # (so it survives a crash) and copied into the results directory after
+  if memory_every is not None:
+    if not os.path.exists(checkpoint_directory): os.makedirs(checkpoint_directory)
+    memory_monitor = MemoryMonitor(checkpoint_directory+'memory.jsonl', every = memory_every,
+                                   tracemalloc_top = tracemalloc_top)
+  else:
+    memory_monitor = None
+  
   # run training, and if nans, creep in, train again until they don't
   success = False
+  attempt = 0
   while not success:
 
     # initialize alice and bob using configs
     tf.reset_default_graph()
+    if seed is not None:
+      # restarts after nans get different, but still deterministic, seeds
+      run_seed = seed + 1000003*attempt
+      np.random.seed(run_seed)
+      tf.set_random_seed(run_seed)
+      env.seed(run_seed)
+    attempt += 1
     #global_step = tf.Variable(0, name = "global_step", trainable = False)    
     with tf.variable_scope('alice'):  
       alice = TabularREINFORCE(env,
@@ -81,27 +201,47 @@ def train_bob(bob_config_ext = '', exp_name_ext = '', exp_name_prefix = '',
       sess.run(tf.global_variables_initializer())
       alice_saver.restore(sess, alice_directory+'alice.ckpt')
       print('Loaded trained Alice.')
-      alice_stats, bob_stats, success = reinforce(env = env,
-                                                  alice = alice,
-                                                  bob = bob,
-                                                  training_steps = training_param.training_steps,
-                                                  learning_rate = training_param.learning_rate,
-                                                  entropy_scale = training_param.entropy_scale,
-                                                  value_scale = training_param.value_scale,
-                                                  discount_factor = training_param.discount_factor,
-                                                  max_episode_length = training_param.max_episode_length,
-                                                  bob_goal_access = training_param.bob_goal_access)
+      # checkpoints live under a stable name, so a relaunched job resumes
+      checkpointer = Checkpointer(checkpoint_directory, every = checkpoint_every,
+                                  run_key = run_key)
+      # optional early stopping, configured by convergence_param in config
+      if convergence_param is not None: monitor = ConvergenceMonitor(**convergence_param._asdict())
+      else: monitor = None
+      # total_steps and steps_per_reward, built while training
+      alice_reward_times, bob_reward_times = RewardTimes(), RewardTimes()
+      if algorithm == 'actor_critic': train = functools.partial(actor_critic, n_step = n_step)
+      else: train = reinforce
+      alice_stats, bob_stats, success = train(env = env,
+                                              alice = alice,
+                                              bob = bob,
+                                              training_steps = training_steps,
+                                              learning_rate = training_param.learning_rate,
+                                              entropy_scale = training_param.entropy_scale,
+                                              value_scale = training_param.value_scale,
+                                              discount_factor = training_param.discount_factor,
+                                              max_episode_length = training_param.max_episode_length,
+                                              bob_goal_access = training_param.bob_goal_access,
+                                              checkpointer = checkpointer,
+                                              monitor = monitor,
+                                              profiler = profiler,
+                                              memory_monitor = memory_monitor,
+                                              alice_reward_times = alice_reward_times,
+                                              bob_reward_times = bob_reward_times)
       if success:
         print('Finished training.')
+        print('Near-overflow events during training: %i' % bob.near_overflow_events)
         # save session
-        experiment_directory = exp_name_prefix+datetime.datetime.now().strftime("%Y_%m_%d_%H%M%S")+'_'+experiment_name+'/'
-        directory = results_directory + experiment_directory
-        print('Saving results in %s.' % directory)
-        if not os.path.exists(directory+'bob/'): os.makedirs(directory+'bob/')
-        save_path = saver.save(sess, directory+'bob/bob.ckpt')
-        print('Saved bob to %s.' % save_path)
+        if write_results:
+          experiment_directory = exp_name_prefix+datetime.datetime.now().strftime("%Y_%m_%d_%H%M%S")+'_'+experiment_name+'/'
+          directory = results_directory + experiment_directory
+          print('Saving results in %s.' % directory)
+          if not os.path.exists(directory+'bob/'): os.makedirs(directory+'bob/')
+          save_path = saver.save(sess, directory+'bob/bob.ckpt')
+          print('Saved bob to %s.' % save_path)
+          export_weights(save_path, directory+'bob/'+WEIGHTS_FILE) # for TF-free evaluation
       else:
         print('Unsucessful run - restarting.')
+        checkpointer.clear() # nans persisted through rollbacks, so start fresh
         f = open('error.txt','a')
         d = datetime.datetime.now().strftime("%A, %B %d, %I:%M:%S %p")
         f.write("{}: experiment '{}' failed and reran\n".format(d, exp_name_prefix+experiment_name))
@@ -109,8 +249,7 @@ def train_bob(bob_config_ext = '', exp_name_ext = '', exp_name_prefix = '',
   
   # save experiment stats
   print('Building Alice stats.')
-  alice_total_steps, alice_steps_per_reward = first_time_to(alice_stats.episode_lengths,
-                                                            alice_stats.episode_rewards)
+  alice_total_steps, alice_steps_per_reward = alice_reward_times.result()
   a = Stats(episode_lengths = alice_stats.episode_lengths,
             episode_rewards = alice_stats.episode_rewards,
             episode_action_kl = alice_stats.episode_action_kl,
@@ -119,8 +258,7 @@ def train_bob(bob_config_ext = '', exp_name_ext = '', exp_name_prefix = '',
             steps_per_reward = alice_steps_per_reward,
             total_steps = alice_total_steps)  
   print('Building Bob stats.')
-  bob_total_steps, bob_steps_per_reward = first_time_to(bob_stats.episode_lengths,
-                                                        bob_stats.episode_rewards)
+  bob_total_steps, bob_steps_per_reward = bob_reward_times.result()
   b = Stats(episode_lengths = bob_stats.episode_lengths,
             episode_rewards = bob_stats.episode_rewards,
             episode_action_kl = None,
@@ -129,12 +267,30 @@ def train_bob(bob_config_ext = '', exp_name_ext = '', exp_name_prefix = '',
             steps_per_reward = bob_steps_per_reward,
             total_steps = bob_total_steps)
   
-  result = Result(alice = a, bob = b)
+  result = Result(alice = a, bob = b,
+                  stop_step = monitor.stop_step if monitor is not None else None)
+  if not write_results:
+    if memory_monitor is not None: memory_monitor.stop()
+    avg_steps_per_reward, avg_steps_per_reward_alice, action_info, state_info = summarize_episode_stats(result)
+    return avg_steps_per_reward, avg_steps_per_reward_alice, action_info, state_info, experiment_name
   if not os.path.exists(directory): os.makedirs(directory)
   with open(directory+'results.pkl', 'wb') as output:
     # copy to locally-defined Stats objects to make pickle happy
     pickle.dump(result, output, pickle.HIGHEST_PROTOCOL)
+  save_results(result, directory) # columnar copy, for lazy loading
+  save_pyramids(directory, lod_series(result)) # for fast plotting of long runs
   print('Saved stats.')
+  if profiler is not None:
+    profiler.save(directory+'profile.json')
+    print('Saved profile.')
+  if memory_monitor is not None:
+    memory_monitor.stop()
+    if os.path.exists(memory_monitor.path): copy(memory_monitor.path, directory+'memory.jsonl')
+    print('Saved memory samples.')
+  # done with the checkpoints, unless a longer budget may pick this run up
+  # (or a cache hit link them)
+  if max_steps is None and cache is None:
+    shutil.rmtree(checkpoint_directory, ignore_errors = True)
   
   # copy config file to results directory to ensure experiment repeatable
   copy(os.getcwd()+'/bob_config'+bob_config_ext+'.py', directory+'bob_config.py')
@@ -142,24 +298,41 @@ def train_bob(bob_config_ext = '', exp_name_ext = '', exp_name_prefix = '',
   copy(alice_directory+'alice_config.py', directory)
   print('Copied configs.')
   
-  # copy alice checkpoint used
+  # link (or copy) alice checkpoint used; sweeps share a few alices, so
+  # hardlinks avoid storing identical copies per bob run
   if not os.path.exists(directory+'alice/'): os.makedirs(directory+'alice/')
-  for file in glob.glob(alice_directory+'alice.ckpt*'):
-    copy(file, directory+'alice/')
-  copy(alice_directory+'checkpoint', directory+'alice/')
-  print('Copied Alice.')
+  for file in alice_files:
+    link_or_copy(file, directory+'alice/')
+  print('Linked Alice.')
       
+  # rolling means, saved next to the results for later plots of this run
+  series = RunSeries(result, directory = directory)
+  if not plot:
+    avg_steps_per_reward, avg_steps_per_reward_alice, action_info, state_info = summarize_episode_stats(result, series = series)
+    if cache is not None:
+      cache.add(key, directory, checkpoint_directory,
+                [avg_steps_per_reward, avg_steps_per_reward_alice, action_info, state_info])
+    print('\nAll results saved in {}'.format(directory))
+    return avg_steps_per_reward, avg_steps_per_reward_alice, action_info, state_info, experiment_name
+  
   # plot experiment and save figures
-  FigureSizes = namedtuple('FigureSizes', ['figure', 'tick_label', 'axis_label', 'title'])
   figure_sizes = FigureSizes(figure = (50,25),
                              tick_label = 40,
                              axis_label = 50,
                              title = 60)
-  avg_steps_per_reward, avg_steps_per_reward_alice, action_info, state_info = plot_episode_stats(result,
-                                                                                                 figure_sizes,
-                                                                                                 noshow = True,
-                                                                                                 directory = directory)
-  print('Figures saved.')
+  # figures are independent, so they are rendered in parallel
+  tasks = episode_stats_tasks(series, figure_sizes, directory)
+  if detach_plots:
+    run_detached(tasks, directory, processes = plot_processes)
+    print('Plotting in the background (log in %sfigures.log).' % directory)
+  else:
+    with FigurePipeline(processes = plot_processes) as pipeline:
+      for fn, args, kwargs in tasks: pipeline.submit(fn, *args, **kwargs)
+    print('Figures saved.')
+  avg_steps_per_reward, avg_steps_per_reward_alice, action_info, state_info = summarize_episode_stats(result, series = series)
+  if cache is not None:
+    cache.add(key, directory, checkpoint_directory,
+              [avg_steps_per_reward, avg_steps_per_reward_alice, action_info, state_info])
   print('\nAll results saved in {}'.format(directory))
   
   return avg_steps_per_reward, avg_steps_per_reward_alice, action_info, state_info, experiment_name
@@ -1,6 +1,13 @@
 import numpy as np
 import itertools
 from collections import namedtuple
+from util.checkpoint import TrainState
+from util.anneal import as_schedule
+from util.profiler import NULL_PROFILER
+from util.columns import GrowableArray, column, as_views
+from util.sampling import Sampler, sampler_states
+from training.loop import TrainingLoop
+from training.rollout_kernel import rollout, action_kl_table
 
 EpisodeStats = namedtuple('Stats', ['episode_lengths', 'episode_rewards',
                                     'episode_lso', 'episode_action_kl',
@@ -10,7 +17,9 @@ Transition = namedtuple('Transition', ['state', 'action', 'reward', 'state_goal_
 def reinforce(env, agent, training_steps, learning_rate,
               entropy_scale, value_scale, action_info_scale, state_info_scale,
               state_count_discount, discount_factor, max_episode_length,
-              print_updates = False):
+              checkpointer = None, nan_learning_rate_decay = .5,
+              max_nan_rollbacks = 5, monitor = None, profiler = None,
+              memory_monitor = None, reward_times = None, print_updates = False):
   """
   REINFORCE (Monte Carlo Policy Gradient) Algorithm. Optimizes the policy
   function approximator using policy gradient.
@@ -19,72 +28,88 @@ def reinforce(env, agent, training_steps, learning_rate,
     env: OpenAI environment.
     agent: policy/value with predict/update functions
     training_steps: number of time steps to train for
-    learning_rate: scalar, or vector of length training_steps
-    entropy_scale: scalar, or vector of length training_steps
-    value_scale: scalar, or vector of length training_steps
-    info_scale: scalar, or vector of length training_steps
+    learning_rate: scalar, vector of length training_steps, or util.anneal schedule
+    entropy_scale: scalar, vector of length training_steps, or util.anneal schedule
+    value_scale: scalar, vector of length training_steps, or util.anneal schedule
+    info_scale: scalar, vector of length training_steps, or util.anneal schedule
     discount_factor: time-discount factor
     max_episode_length: max time steps before forced env reset
+    checkpointer, nan_learning_rate_decay, max_nan_rollbacks, monitor,
+      profiler, memory_monitor: see training.loop.TrainingLoop
+    reward_times: optional util.stats.RewardTimes, fed each episode's length
+      and reward, so first_time_to's results are ready when training ends
   
   Returns:
       An EpisodeStats object: see above.
   """
   
-  # this allows one to set params to scalars when not wanting to anneal them
-  if not isinstance(learning_rate, (list, np.ndarray)):
-    learning_rate = [learning_rate]*training_steps
-  if not isinstance(entropy_scale, (list, np.ndarray)):
-    entropy_scale = [entropy_scale]*training_steps
-  if not isinstance(value_scale, (list, np.ndarray)):
-    value_scale = [value_scale]*training_steps
-  if not isinstance(action_info_scale, (list, np.ndarray)):
-    action_info_scale = [action_info_scale]*training_steps
-  if not isinstance(state_info_scale, (list, np.ndarray)):
-    state_info_scale = [state_info_scale]*training_steps
-    
-  # flag that tells caller of function whether or not the run had to exit early
-  #   due to nans; useful for triggering retraining with new init
-  success = True
-
-  # keep track of useful statistics
-  episode_lengths = []
-  episode_rewards = []
-  if agent.use_action_info:
-    episode_action_kl = []
-  else:
-    episode_action_kl = None
-  if agent.use_state_info:
-    episode_lso = []
-  else:
-    episode_lso = None
+  # this allows one to set params to scalars, per-step arrays or schedules
+  learning_rate = as_schedule(learning_rate)
+  entropy_scale = as_schedule(entropy_scale)
+  value_scale = as_schedule(value_scale)
+  action_info_scale = as_schedule(action_info_scale)
+  state_info_scale = as_schedule(state_info_scale)
+  if profiler is None: profiler = NULL_PROFILER
+  agent_session_calls = 1 if agent.trainable else 0
   
-  # count state frequencies if using state info
-  if agent.use_state_info:
-    init_count = 1
-    state_goal_counts = init_count * np.ones((env.nS, env.nG))
-  else:
-    state_goal_counts = None
+  # a fixed policy table (e.g. test_artisanal_policy) isn't updated, so its
+  # episodes are generated in batches by the rollout kernel instead
+  if not agent.trainable and checkpointer is None and monitor is None:
+    return _rollout_fixed_policy(env, agent, training_steps, state_count_discount,
+                                 max_episode_length, profiler, reward_times)
+    
+  # keep track of useful statistics (typed, growable numpy columns)
+  (episode_lengths, episode_rewards, episode_lso, episode_action_kl,
+   state_goal_counts) = _new_stats(agent, env)
 
   # count total steps
   step_count = 0
   last_episode_reward = 0   
   
+  # samples actions from pre-drawn uniforms (np.random.choice is slow per step)
+  sampler = Sampler()
+  
+  loop = TrainingLoop(env, checkpointer, nan_learning_rate_decay, max_nan_rollbacks,
+                      monitor, profiler, memory_monitor, sampler)
+  train_state = loop.resume()
+  make_train_state = lambda: _train_state(step_count, episode_lengths, episode_rewards,
+                                          episode_action_kl, episode_lso, state_goal_counts,
+                                          env, loop.learning_rate_scale, sampler)
+  
   # iterate over episodes
-  for i in itertools.count(start = 0):
+  while True:
     
-    this_learning_rate = learning_rate[step_count]
+    # load checkpointed state, either to resume or to roll back after nans
+    if train_state is not None:
+      step_count = train_state.step_count
+      (episode_lengths, episode_rewards, episode_lso, episode_action_kl,
+       state_goal_counts) = _load_stats(train_state.stats)
+      last_episode_reward = episode_rewards[-1] if episode_rewards else 0
+      if reward_times is not None:
+        reward_times.reset()
+        reward_times.extend(episode_lengths, episode_rewards)
+      train_state = None
+    
+    # if exceeded number of steps to train for, quit
+    if step_count >= training_steps: break
+    i = len(episode_lengths) # episode index
+    
+    this_learning_rate = loop.learning_rate_scale * learning_rate[step_count]
     this_entropy_scale = entropy_scale[step_count]
     this_value_scale = value_scale[step_count]
     this_action_info_scale = action_info_scale[step_count]
     this_state_info_scale = state_info_scale[step_count]
     
     # Reset the environment and pick the first action
+    tic = profiler.tic()
     state, goal = env._reset()
+    profiler.toc('reset', tic)
     if agent.use_state_info:
       state_goal_counts *= state_count_discount
       state_goal_counts[state, goal] += 1
     
     episode = []
+    success = True
     episode_length = 0
     total_reward = 0
     if agent.use_action_info: total_action_kl = 0
@@ -98,9 +123,15 @@ def reinforce(env, agent, training_steps, learning_rate,
       step_count += 1
         
       # Take a step
+      tic = profiler.tic()
       action_probs, value = agent.predict(state = state, goal = goal)
-      action = np.random.choice(np.arange(len(action_probs)), p = action_probs)
+      profiler.toc('predict', tic, session_calls = agent_session_calls)
+      tic = profiler.tic()
+      action = sampler.choice(action_probs)
+      profiler.toc('sample', tic)
+      tic = profiler.tic()
       next_state, reward, done, _ = env.step(action)
+      profiler.toc('env_step', tic)
       
       # Keep track of the transition
       episode.append(Transition(state = state,
@@ -110,11 +141,15 @@ def reinforce(env, agent, training_steps, learning_rate,
       
       # Update statistics
       if agent.use_action_info:
+        tic = profiler.tic()
         total_action_kl += agent.get_kl(state = state, goal = goal)
+        profiler.toc('get_kl', tic, session_calls = 1)
       if agent.use_state_info:
+        tic = profiler.tic()
         ps_g = state_goal_counts[state, goal] / np.sum(state_goal_counts[:,goal])
         ps = np.sum(state_goal_counts[state,:]) / np.sum(state_goal_counts)
         total_lso += np.log2(ps_g/ps)
+        profiler.toc('lso', tic)
         
       total_reward += reward
       episode_length = t
@@ -138,50 +173,156 @@ def reinforce(env, agent, training_steps, learning_rate,
       
       if done or t > max_episode_length: break
     
-    # no more episodes if nans
-    if not success: break
-    
-    # save episode stats
-    final_state = next_state
-    episode_rewards.append(total_reward)
-    episode_lengths.append(episode_length)
-    if agent.use_action_info:
-      episode_action_kl.append(total_action_kl)
-    if agent.use_state_info:
-      episode_lso.append(total_lso)
-    last_episode_reward = total_reward
-
-    # go through episode and make agent updates
-    for t, transition in enumerate(episode):
-      total_return = sum(discount_factor**tau * future.reward for tau, future in enumerate(episode[t:]))
-      # if last transition, use next_state from above, since not saved as transition
+    # skip stats and updates for episodes with nans
+    if success:
+      
+      # save episode stats
+      final_state = next_state
+      episode_rewards.append(total_reward)
+      episode_lengths.append(episode_length)
+      if agent.use_action_info:
+        episode_action_kl.append(total_action_kl)
       if agent.use_state_info:
-        if t == len(episode)-1:
-          next_state = final_state
+        episode_lso.append(total_lso)
+      last_episode_reward = total_reward
+      if reward_times is not None: reward_times.push(episode_length, total_reward)
+  
+      # go through episode and make agent updates
+      for t, transition in enumerate(episode):
+        tic = profiler.tic()
+        total_return = sum(discount_factor**tau * future.reward for tau, future in enumerate(episode[t:]))
+        profiler.toc('returns', tic)
+        # if last transition, use next_state from above, since not saved as transition
+        if agent.use_state_info:
+          if t == len(episode)-1:
+            next_state = final_state
+          else:
+            next_state = episode[t+1].state
         else:
-          next_state = episode[t+1].state
-      else:
-        next_state = None
-      agent.update(state = transition.state,
-                   goal = goal,
-                   action = transition.action,
-                   return_estimate = total_return,
-                   learning_rate = this_learning_rate,
-                   entropy_scale = this_entropy_scale,
-                   value_scale = this_value_scale,
-                   action_info_scale = this_action_info_scale,
-                   state_info_scale = this_state_info_scale,
-                   state_goal_counts = transition.state_goal_counts,
-                   next_state = next_state)
-      
-    # if exceeded number of steps to train for, quit
-    if step_count >= training_steps: break
+          next_state = None
+        tic = profiler.tic()
+        loss = agent.update(state = transition.state,
+                            goal = goal,
+                            action = transition.action,
+                            return_estimate = total_return,
+                            learning_rate = this_learning_rate,
+                            entropy_scale = this_entropy_scale,
+                            value_scale = this_value_scale,
+                            action_info_scale = this_action_info_scale,
+                            state_info_scale = this_state_info_scale,
+                            state_goal_counts = transition.state_goal_counts,
+                            next_state = next_state)
+        profiler.toc('update', tic, session_calls = agent_session_calls)
+        profiler.count_feed(agent.last_feed_dict)
+        if loss is not None and not np.isfinite(loss):
+          print('NaN loss at %i steps' % step_count)
+          success = False
+          break
+    
+    # on nans, roll back to last good checkpoint with a lower learning rate
+    if not success:
+      train_state = loop.rollback()
+      if train_state is None: break
+      continue
+    
+    structures = lambda: {'episode_lengths': episode_lengths,
+                          'episode_rewards': episode_rewards,
+                          'episode_action_kl': episode_action_kl,
+                          'episode_lso': episode_lso,
+                          'state_goal_counts': state_goal_counts,
+                          'episode_buffer': episode,
+                          'schedules': [learning_rate, entropy_scale, value_scale,
+                                        action_info_scale, state_info_scale]}
+    if loop.end_episode(step_count, episode_length, total_reward, make_train_state, structures,
+                        action_kl = total_action_kl,
+                        lso = total_lso,
+                        policy = agent.get_policy):
+      break
   
-  # package up stats
+  loop.finish(step_count, make_train_state)
+  
+  # package up stats, as zero-copy numpy arrays
   stats = EpisodeStats(episode_lengths = episode_lengths,
                        episode_rewards = episode_rewards,
                        episode_action_kl = episode_action_kl,
                        episode_lso = episode_lso,
                        state_goal_counts = state_goal_counts)
   
-  return stats, success
\ No newline at end of file
+  return as_views(stats), loop.success
+
+def _new_stats(agent, env):
+  """Empty EpisodeStats columns for agent (None where it doesn't use action
+  or state info), and state-goal counts starting at one."""
+  if agent.use_state_info:
+    init_count = 1
+    state_goal_counts = init_count * np.ones((env.nS, env.nG))
+  else:
+    state_goal_counts = None
+  return EpisodeStats(episode_lengths = GrowableArray(np.int64),
+                      episode_rewards = GrowableArray(np.float64),
+                      episode_lso = GrowableArray(np.float64) if agent.use_state_info else None,
+                      episode_action_kl = GrowableArray(np.float64) if agent.use_action_info else None,
+                      state_goal_counts = state_goal_counts)
+
+def _load_stats(stats):
+  """Checkpointed EpisodeStats as growable columns (checkpoints written
+  before columnar stats hold lists)."""
+  return EpisodeStats(episode_lengths = column(stats.episode_lengths, np.int64),
+                      episode_rewards = column(stats.episode_rewards),
+                      episode_lso = column(stats.episode_lso),
+                      episode_action_kl = column(stats.episode_action_kl),
+                      state_goal_counts = stats.state_goal_counts)
+
+def _train_state(step_count, episode_lengths, episode_rewards, episode_action_kl,
+                 episode_lso, state_goal_counts, env, learning_rate_scale, sampler = None):
+  """Packages up everything needed to resume training for a checkpoint."""
+  stats = EpisodeStats(episode_lengths = episode_lengths,
+                       episode_rewards = episode_rewards,
+                       episode_action_kl = episode_action_kl,
+                       episode_lso = episode_lso,
+                       state_goal_counts = state_goal_counts)
+  return TrainState(step_count = step_count,
+                    stats = stats,
+                    rng_state = np.random.get_state(),
+                    env_rng_state = env.np_random.get_state(),
+                    learning_rate_scale = learning_rate_scale,
+                    sampler_states = sampler_states(env, sampler))
+
+def _rollout_fixed_policy(env, agent, training_steps, state_count_discount,
+                          max_episode_length, profiler, reward_times,
+                          max_batch_size = 10000):
+  """reinforce's episodes and stats for a non-trainable agent, from
+  training.rollout_kernel (numba if installed) on the env's RNG. Batches
+  are sized so that every episode in them starts before training_steps."""
+  policy = agent.get_policy()
+  dynamics = env.get_dynamics()
+  action_kls = action_kl_table(policy) if agent.use_action_info else None
+  (episode_lengths, episode_rewards, episode_lso, episode_action_kl,
+   state_goal_counts) = _new_stats(agent, env)
+  step_count = 0
+  while step_count < training_steps:
+    n = min(max(1, (training_steps - step_count) // (max_episode_length + 1)), max_batch_size)
+    tic = profiler.tic()
+    episodes = rollout(policy, dynamics, env.goal_dist, n, max_episode_length,
+                       random_state = env.np_random,
+                       action_kls = action_kls,
+                       state_goal_counts = state_goal_counts,
+                       state_count_discount = state_count_discount)
+    profiler.toc('rollout', tic)
+    rewards = np.sum(episodes.rewards, axis = 1)
+    episode_lengths.extend(episodes.lengths)
+    episode_rewards.extend(rewards)
+    if agent.use_action_info: episode_action_kl.extend(np.sum(episodes.action_kl, axis = 1))
+    if agent.use_state_info: episode_lso.extend(np.sum(episodes.lso, axis = 1))
+    if reward_times is not None: reward_times.extend(episodes.lengths, rewards)
+    # each episode ends at its own cumulative step count
+    for length in episodes.lengths:
+      step_count += int(length)
+      profiler.end_episode(step_count, length)
+  profiler.report(step_count)
+  stats = EpisodeStats(episode_lengths = episode_lengths,
+                       episode_rewards = episode_rewards,
+                       episode_action_kl = episode_action_kl,
+                       episode_lso = episode_lso,
+                       state_goal_counts = state_goal_counts)
+  return as_views(stats), True
@@ -1,8 +1,14 @@
 import numpy as np
 import itertools
-import copy
 from collections import namedtuple
 from play_episode import play
+from envs.JointTwoGoalGridWorld import JointTwoGoalGridWorld
+from util.checkpoint import TrainState
+from util.anneal import as_schedule
+from util.profiler import NULL_PROFILER
+from util.columns import GrowableArray, column, as_views
+from util.sampling import Sampler, sampler_states
+from training.loop import TrainingLoop
 
 EpisodeStats = namedtuple('Stats', ['episode_lengths', 'episode_rewards',
                                     'episode_lso', 'episode_action_kl',
@@ -13,6 +19,9 @@ Bobservation = namedtuple('Bobservation', ['alice_states', 'alice_actions', 'sta
 def reinforce(env, alice, bob, training_steps, learning_rate,
               entropy_scale, value_scale, discount_factor,
               max_episode_length, state_count_discount = 1, bob_goal_access = None,
+              checkpointer = None, nan_learning_rate_decay = .5, max_nan_rollbacks = 5,
+              monitor = None, profiler = None, memory_monitor = None,
+              alice_reward_times = None, bob_reward_times = None,
               viz_episode_every = 1000, print_updates = False):
   """
   REINFORCE (Monte Carlo Policy Gradient) Algorithm for a two-agent system,
@@ -23,84 +32,96 @@ def reinforce(env, alice, bob, training_steps, learning_rate,
     alice: a trained agent with a predict function 
     bob: an agent to be trained with predict and update functions
     training_steps: number of time steps to train for
-    entropy_scale: vector of length num_episodes, or scalar
-    value_scale: vector of length num_episodes, or scalar
+    entropy_scale: scalar, vector of length training_steps, or util.anneal schedule
+    value_scale: scalar, vector of length training_steps, or util.anneal schedule
     discount_factor: time-discount factor
     max_episode_length: maximum number of time steps for an episode
     bob_goal_access = 'immediate' -> z = +- 1 depending on goal
                     = 'delayed' -> z = +- 1 once alice kl crosses kl_thresh; z = 0 before
+                      (alice must have use_action_info, else ValueError)
                     = None -> z produced by RNN applied to alice trajectory
+    checkpointer, nan_learning_rate_decay, max_nan_rollbacks, monitor,
+      profiler, memory_monitor: see training.loop.TrainingLoop
+    alice_reward_times, bob_reward_times: optional util.stats.RewardTimes,
+      fed each episode's length and reward, so first_time_to's results are
+      ready when training ends
   
   Returns:
     An EpisodeStats object with two numpy arrays for episode_lengths and episode_rewards.
   """
   
-  # this allows one to set params to scalars when not wanting to anneal them
-  if not isinstance(learning_rate, (list, np.ndarray)):
-    learning_rate = [learning_rate]*training_steps
-  if not isinstance(entropy_scale, (list, np.ndarray)):
-    entropy_scale = [entropy_scale]*training_steps
-  if not isinstance(value_scale, (list, np.ndarray)):
-    value_scale = [value_scale]*training_steps
+  # this allows one to set params to scalars, per-step arrays or schedules
+  learning_rate = as_schedule(learning_rate)
+  entropy_scale = as_schedule(entropy_scale)
+  value_scale = as_schedule(value_scale)
+  if profiler is None: profiler = NULL_PROFILER
+  _check_goal_access(alice, bob_goal_access)
+  alice_session_calls = 1 if alice.trainable else 0
 
-  # flag that tells caller of function whether or not the run had to exit early
-  #   due to nans; useful for triggering retraining with new init
-  success = True
-
-  # Keeps track of useful statistics
-  if alice.use_action_info: init_kl = []
-  else: init_kl = None
-  if alice.use_state_info:
-    init_lso = []
-    init_count = 1
-    init_state_goal_counts = init_count * np.ones((env.nS, env.nG))
-  else:
-    init_lso = None
-    init_state_goal_counts = None
-  alice_stats = EpisodeStats(episode_lengths = [],
-                             episode_rewards = [],
-                             episode_action_kl = init_kl,
-                             episode_lso = init_lso,
-                             state_goal_counts = init_state_goal_counts)
-  bob_stats = EpisodeStats(episode_lengths = [],
-                           episode_rewards = [],
-                           episode_action_kl = None,
-                           episode_lso = None,
-                           state_goal_counts = None)
+  # Keeps track of useful statistics (typed, growable numpy columns)
+  alice_stats, bob_stats = _new_stats(alice, env)
   
   # count total steps
   step_count = 0
   last_bob_reward = 0
   
-  # each agent needs own copy of env
-  alice_env = env
-  bob_env = copy.copy(alice_env)
+  # alice and bob share one episode (goal and transition model)
+  joint_env = JointTwoGoalGridWorld(env)
+  
+  # samples both agents' actions from pre-drawn uniforms (also used by play)
+  sampler = Sampler()
+  
+  loop = TrainingLoop(env, checkpointer, nan_learning_rate_decay, max_nan_rollbacks,
+                      monitor, profiler, memory_monitor, sampler)
+  train_state = loop.resume()
+  make_train_state = lambda: _train_state(step_count, alice_stats, bob_stats, env,
+                                          loop.learning_rate_scale, sampler)
   
   # iterate over episodes
-  for i in itertools.count(start = 0):
+  while True:
+    
+    # load checkpointed state, either to resume or to roll back after nans
+    if train_state is not None:
+      step_count = train_state.step_count
+      alice_stats, bob_stats = [_columns(stats) for stats in train_state.stats]
+      last_bob_reward = bob_stats.episode_rewards[-1] if bob_stats.episode_rewards else 0
+      for times, stats in [(alice_reward_times, alice_stats), (bob_reward_times, bob_stats)]:
+        if times is not None:
+          times.reset()
+          times.extend(stats.episode_lengths, stats.episode_rewards)
+      train_state = None
+    
+    # if exceeded number of steps to train for, quit
+    if step_count >= training_steps: break
+    i = len(bob_stats.episode_lengths) # episode index
     
-    this_learning_rate = learning_rate[step_count]
+    this_learning_rate = loop.learning_rate_scale * learning_rate[step_count]
     this_entropy_scale = entropy_scale[step_count]
     this_value_scale = value_scale[step_count]
     
     # occasional viz
     if i % viz_episode_every == 0:
+      tic = profiler.tic()
       print('----- EPISODE %i, STEP %i -----\n' % (i, step_count))
       play(env = env,
            alice = alice,
            state_goal_counts = alice_stats.state_goal_counts,
            bob = bob,
            max_episode_length = max_episode_length,
-           bob_goal_access = bob_goal_access)
+           bob_goal_access = bob_goal_access,
+           sampler = sampler)
+      profiler.toc('viz', tic)
   
     # reset envs
-    alice_state, goal = alice_env._reset()
-    bob_state, _ = bob_env.set_goal(goal)
+    tic = profiler.tic()
+    alice_state, bob_state, goal = joint_env.reset()
+    profiler.toc('reset', tic)
     if alice.use_state_info:
 #      alice_stats.state_goal_counts *= state_count_discount
       alice_stats.state_goal_counts[alice_state, goal] += 1
     
     # initialize alice and bob episode stat trackers
+    success = True
     alice_states = []
     alice_actions = []
     alice_done = False
@@ -117,30 +138,36 @@ def reinforce(env, alice, bob, training_steps, learning_rate,
     
     # iterate over steps of alice+bob
     for t in itertools.count(start = 1):
+      alice_active, bob_active = not alice_done, not bob_done
       
-      # first alice takes a step
-      if not alice_done:        
+      # first alice picks an action
+      if alice_active:
+        tic = profiler.tic()
         alice_action_probs, alice_value = alice.predict(alice_state, goal)
-        alice_action = np.random.choice(np.arange(len(alice_action_probs)), p = alice_action_probs)
-        next_alice_state, alice_reward, alice_done, _ = alice_env.step(alice_action)
+        profiler.toc('alice_predict', tic, session_calls = alice_session_calls)
+        tic = profiler.tic()
+        alice_action = sampler.choice(alice_action_probs)
+        profiler.toc('sample', tic)
         # update alice stats
-        alice_total_reward += alice_reward
-        alice_episode_length = t
         if alice.use_action_info:
+          tic = profiler.tic()
           total_action_kl += alice.get_kl(state = alice_state, goal = goal)
+          profiler.toc('get_kl', tic, session_calls = 1)
         if alice.use_state_info:
+          tic = profiler.tic()
           ps_g = alice_stats.state_goal_counts[alice_state, goal] / np.sum(alice_stats.state_goal_counts[:,goal])
           ps = np.sum(alice_stats.state_goal_counts[alice_state,:]) / np.sum(alice_stats.state_goal_counts)
           total_lso += np.log2(ps_g/ps)
+          profiler.toc('lso', tic)
       else: # if done, sit still
-        alice_action = alice_env.action_to_index['STAY']
-        next_alice_state = alice_state
+        alice_action = joint_env.action_to_index['STAY']
       alice_states.append(alice_state)
       alice_actions.append(alice_action)
       
-      # then bob takes a step
-      if not bob_done:
+      # then bob picks his, given alice's trajectory so far
+      if bob_active:
         step_count += 1
+        tic = profiler.tic()
         if bob_goal_access is None:
           bob_action_probs, bob_value, z, _ = bob.predict(state = bob_state,
                                                           obs_states = alice_states,
@@ -152,15 +179,31 @@ def reinforce(env, alice, bob, training_steps, learning_rate,
                                                           z = z)
         elif bob_goal_access == 'delayed':
           kl_thresh = .8
-          if alice_stats.episode_kls[i]>kl_thresh:
+          if total_action_kl>kl_thresh:
             if goal == 0: z = [-1]
             elif goal == 1: z = [+1]
           else:
             z = [0]
           bob_action_probs, bob_value, _, _ = bob.predict(state = bob_state,
                                                           z = z)
-        bob_action = np.random.choice(np.arange(len(bob_action_probs)), p = bob_action_probs)
-        next_bob_state, bob_reward, bob_done, _ = bob_env.step(bob_action)
+        profiler.toc('bob_predict', tic, session_calls = 1)
+        tic = profiler.tic()
+        bob_action = sampler.choice(bob_action_probs)
+        profiler.toc('sample', tic)
+      else: # if done, sit still
+        bob_action = joint_env.action_to_index['STAY']
+      
+      # both move (whoever is done stays put)
+      tic = profiler.tic()
+      next_states, rewards, dones = joint_env.step(alice_action, bob_action)
+      profiler.toc('env_step', tic)
+      next_alice_state, next_bob_state = next_states
+      alice_reward, bob_reward = rewards
+      alice_done, bob_done = dones
+      if alice_active:
+        alice_total_reward += alice_reward
+        alice_episode_length = t
+      if bob_active:
         bob_total_reward += bob_reward
         bob_episode_length = t
         # keep track of the transition for post-episode training
@@ -171,8 +214,6 @@ def reinforce(env, alice, bob, training_steps, learning_rate,
                                         action = bob_action,
                                         reward = bob_reward,
                                         z = z))
-      else: # if done, sit still
-        next_bob_state = bob_state
       
       if print_updates:
         # print out which step we're on, useful for debugging.
@@ -194,48 +235,118 @@ def reinforce(env, alice, bob, training_steps, learning_rate,
       # check if episode over
       if (alice_done and bob_done) or t > max_episode_length: break
     
-    # no more episodes if nans
-    if not success: break
-  
-    # otherwise, update episode stats
-    alice_stats.episode_rewards.append(alice_total_reward)
-    alice_stats.episode_lengths.append(alice_episode_length)
-    if alice.use_action_info: alice_stats.episode_action_kl.append(total_action_kl)
-    if alice.use_state_info: alice_stats.episode_lso.append(total_lso)
-    bob_stats.episode_rewards.append(bob_total_reward)
-    bob_stats.episode_lengths.append(bob_episode_length)
-    last_bob_reward = bob_total_reward
-  
-    # go through the episode and make policy updates
-    for t, transition in enumerate(bob_episode):
-      total_return = sum(discount_factor**i * t.reward for i, t in enumerate(bob_episode[t:]))
-      if bob_goal_access is None: # provide alice trajectory
-        bob.update(state = transition.state,
-                   action = transition.action,
-                   return_estimate = total_return,
-                   learning_rate = this_learning_rate,
-                   entropy_scale = this_entropy_scale,
-                   value_scale = this_value_scale,
-                   obs_states = transition.alice_states,
-                   obs_actions = transition.alice_actions)
-      elif bob_goal_access == 'immediate': # provide static z
-        bob.update(state = transition.state,
-                   action = transition.action,
-                   return_estimate = total_return,
-                   learning_rate = this_learning_rate,
-                   entropy_scale = this_entropy_scale,
-                   value_scale = this_value_scale,
-                   z = z)
-      elif bob_goal_access == 'delayed': # provide dynamic z
-        bob.update(state = transition.state,
-                   action = transition.action,
-                   return_estimate = total_return,
-                   learning_rate = this_learning_rate,
-                   entropy_scale = this_entropy_scale,
-                   value_scale = this_value_scale,
-                   z = transition.z)
+    # skip stats and updates for episodes with nans
+    if success:
+      
+      # otherwise, update episode stats
+      alice_stats.episode_rewards.append(alice_total_reward)
+      alice_stats.episode_lengths.append(alice_episode_length)
+      if alice.use_action_info: alice_stats.episode_action_kl.append(total_action_kl)
+      if alice.use_state_info: alice_stats.episode_lso.append(total_lso)
+      bob_stats.episode_rewards.append(bob_total_reward)
+      bob_stats.episode_lengths.append(bob_episode_length)
+      last_bob_reward = bob_total_reward
+      if alice_reward_times is not None: alice_reward_times.push(alice_episode_length, alice_total_reward)
+      if bob_reward_times is not None: bob_reward_times.push(bob_episode_length, bob_total_reward)
     
-    # if exceeded number of steps to train for, quit
-    if step_count >= training_steps: break
+      # go through the episode and make policy updates
+      for t, transition in enumerate(bob_episode):
+        tic = profiler.tic()
+        total_return = sum(discount_factor**i * t.reward for i, t in enumerate(bob_episode[t:]))
+        profiler.toc('returns', tic)
+        tic = profiler.tic()
+        if bob_goal_access is None: # provide alice trajectory
+          loss = bob.update(state = transition.state,
+                            action = transition.action,
+                            return_estimate = total_return,
+                            learning_rate = this_learning_rate,
+                            entropy_scale = this_entropy_scale,
+                            value_scale = this_value_scale,
+                            obs_states = transition.alice_states,
+                            obs_actions = transition.alice_actions)
+        elif bob_goal_access == 'immediate': # provide static z
+          loss = bob.update(state = transition.state,
+                            action = transition.action,
+                            return_estimate = total_return,
+                            learning_rate = this_learning_rate,
+                            entropy_scale = this_entropy_scale,
+                            value_scale = this_value_scale,
+                            z = z)
+        elif bob_goal_access == 'delayed': # provide dynamic z
+          loss = bob.update(state = transition.state,
+                            action = transition.action,
+                            return_estimate = total_return,
+                            learning_rate = this_learning_rate,
+                            entropy_scale = this_entropy_scale,
+                            value_scale = this_value_scale,
+                            z = transition.z)
+        profiler.toc('update', tic, session_calls = 1)
+        profiler.count_feed(bob.last_feed_dict)
+        if not np.isfinite(loss):
+          print('NaN loss at %i steps' % step_count)
+          success = False
+          break
+    
+    # on nans, roll back to last good checkpoint with a lower learning rate
+    if not success:
+      train_state = loop.rollback()
+      if train_state is None: break
+      continue
+    
+    structures = lambda: {'alice_stats': alice_stats,
+                          'bob_stats': bob_stats,
+                          'bob_episode_buffer': bob_episode,
+                          'schedules': [learning_rate, entropy_scale, value_scale]}
+    if loop.end_episode(step_count, bob_episode_length, bob_total_reward, make_train_state,
+                        structures):
+      break
+  
+  loop.finish(step_count, make_train_state)
   
-  return alice_stats, bob_stats, success
\ No newline at end of file
+  return as_views(alice_stats), as_views(bob_stats), loop.success
+
+def _check_goal_access(alice, bob_goal_access):
+  """'delayed' goal access thresholds alice's action kl, which she only
+  computes with use_action_info."""
+  if bob_goal_access == 'delayed' and not alice.use_action_info:
+    raise ValueError("bob_goal_access = 'delayed' needs an alice with use_action_info")
+
+def _new_stats(alice, env):
+  """Empty alice and bob EpisodeStats columns (alice's action kl and lso
+  only if she uses them), with alice's state-goal counts starting at one."""
+  if alice.use_action_info: init_kl = GrowableArray(np.float64)
+  else: init_kl = None
+  if alice.use_state_info:
+    init_lso = GrowableArray(np.float64)
+    init_count = 1
+    init_state_goal_counts = init_count * np.ones((env.nS, env.nG))
+  else:
+    init_lso = None
+    init_state_goal_counts = None
+  alice_stats = EpisodeStats(episode_lengths = GrowableArray(np.int64),
+                             episode_rewards = GrowableArray(np.float64),
+                             episode_action_kl = init_kl,
+                             episode_lso = init_lso,
+                             state_goal_counts = init_state_goal_counts)
+  bob_stats = EpisodeStats(episode_lengths = GrowableArray(np.int64),
+                           episode_rewards = GrowableArray(np.float64),
+                           episode_action_kl = None,
+                           episode_lso = None,
+                           state_goal_counts = None)
+  return alice_stats, bob_stats
+
+def _columns(stats):
+  """Stats with list fields (checkpoints from before columnar stats) as columns."""
+  return stats._replace(episode_lengths = column(stats.episode_lengths, np.int64),
+                        episode_rewards = column(stats.episode_rewards),
+                        episode_action_kl = column(stats.episode_action_kl),
+                        episode_lso = column(stats.episode_lso))
+
+def _train_state(step_count, alice_stats, bob_stats, env, learning_rate_scale, sampler = None):
+  """Packages up everything needed to resume training for a checkpoint."""
+  return TrainState(step_count = step_count,
+                    stats = (alice_stats, bob_stats),
+                    rng_state = np.random.get_state(),
+                    env_rng_state = env.np_random.get_state(),
+                    learning_rate_scale = learning_rate_scale,
+                    sampler_states = sampler_states(env, sampler))
\ No newline at end of file
@@ -0,0 +1,224 @@
+import numpy as np
+import itertools
+from util.anneal import as_schedule
+from util.profiler import NULL_PROFILER
+from util.columns import as_views
+from util.sampling import Sampler
+from training.loop import TrainingLoop
+from training.REINFORCE_alice import EpisodeStats, _new_stats, _load_stats, _train_state
+
+def actor_critic(env, agent, training_steps, learning_rate,
+                 entropy_scale, value_scale, action_info_scale, state_info_scale,
+                 state_count_discount, discount_factor, max_episode_length,
+                 checkpointer = None, nan_learning_rate_decay = .5,
+                 max_nan_rollbacks = 5, monitor = None, profiler = None,
+                 memory_monitor = None, reward_times = None, print_updates = False):
+  """
+  Online actor-critic with TD(lambda) eligibility traces: the agent's value
+  table is the critic, and policy and values are updated after every step
+  along td error X trace, rather than after each episode from Monte Carlo
+  returns (training.REINFORCE_alice). Nothing is buffered per episode.
+  Same arguments and results as REINFORCE_alice.reinforce.
+  
+  Args:
+    env: OpenAI environment.
+    agent: TabularREINFORCE built with trace_decay (lambda), with
+      predict/update_td/reset_traces functions
+    training_steps: number of time steps to train for
+    learning_rate: scalar, vector of length training_steps, or util.anneal schedule
+    entropy_scale: scalar, vector of length training_steps, or util.anneal schedule
+    value_scale: scalar, vector of length training_steps, or util.anneal schedule
+    info_scale: scalar, vector of length training_steps, or util.anneal schedule
+    discount_factor: time-discount factor
+    max_episode_length: max time steps before forced env reset
+    checkpointer, nan_learning_rate_decay, max_nan_rollbacks, monitor,
+      profiler, memory_monitor: see training.loop.TrainingLoop
+    reward_times: optional util.stats.RewardTimes, fed each episode's length
+      and reward, so first_time_to's results are ready when training ends
+  
+  Returns:
+      An EpisodeStats object: see above.
+  """
+  
+  # this allows one to set params to scalars, per-step arrays or schedules
+  learning_rate = as_schedule(learning_rate)
+  entropy_scale = as_schedule(entropy_scale)
+  value_scale = as_schedule(value_scale)
+  action_info_scale = as_schedule(action_info_scale)
+  state_info_scale = as_schedule(state_info_scale)
+  if profiler is None: profiler = NULL_PROFILER
+  agent_session_calls = 1 if agent.trainable else 0
+    
+  # keep track of useful statistics (typed, growable numpy columns)
+  (episode_lengths, episode_rewards, episode_lso, episode_action_kl,
+   state_goal_counts) = _new_stats(agent, env)
+
+  # count total steps
+  step_count = 0
+  last_episode_reward = 0   
+  
+  # action sampler, see util.sampling
+  sampler = Sampler()
+  
+  loop = TrainingLoop(env, checkpointer, nan_learning_rate_decay, max_nan_rollbacks,
+                      monitor, profiler, memory_monitor, sampler)
+  train_state = loop.resume()
+  make_train_state = lambda: _train_state(step_count, episode_lengths, episode_rewards,
+                                          episode_action_kl, episode_lso, state_goal_counts,
+                                          env, loop.learning_rate_scale, sampler)
+  
+  # iterate over episodes
+  while True:
+    
+    # load checkpointed state, either to resume or to roll back after nans
+    if train_state is not None:
+      step_count = train_state.step_count
+      (episode_lengths, episode_rewards, episode_lso, episode_action_kl,
+       state_goal_counts) = _load_stats(train_state.stats)
+      last_episode_reward = episode_rewards[-1] if episode_rewards else 0
+      if reward_times is not None:
+        reward_times.reset()
+        reward_times.extend(episode_lengths, episode_rewards)
+      train_state = None
+    
+    # if exceeded number of steps to train for, quit
+    if step_count >= training_steps: break
+    i = len(episode_lengths) # episode index
+    
+    this_learning_rate = loop.learning_rate_scale * learning_rate[step_count]
+    this_entropy_scale = entropy_scale[step_count]
+    this_value_scale = value_scale[step_count]
+    this_action_info_scale = action_info_scale[step_count]
+    this_state_info_scale = state_info_scale[step_count]
+    
+    # Reset the environment and pick the first action
+    tic = profiler.tic()
+    state, goal = env._reset()
+    profiler.toc('reset', tic)
+    if agent.use_state_info:
+      state_goal_counts *= state_count_discount
+      state_goal_counts[state, goal] += 1
+    agent.reset_traces()
+    
+    success = True
+    episode_length = 0
+    total_reward = 0
+    if agent.use_action_info: total_action_kl = 0
+    else: total_action_kl = None
+    if agent.use_state_info: total_lso = 0
+    else: total_lso = None
+    
+    # One step in the environment
+    for t in itertools.count(start = 1):
+      
+      step_count += 1
+        
+      # Take a step
+      tic = profiler.tic()
+      action_probs, value = agent.predict(state = state, goal = goal)
+      profiler.toc('predict', tic, session_calls = agent_session_calls)
+      tic = profiler.tic()
+      action = sampler.choice(action_probs)
+      profiler.toc('sample', tic)
+      tic = profiler.tic()
+      next_state, reward, done, _ = env.step(action)
+      profiler.toc('env_step', tic)
+      
+      # Update statistics
+      if agent.use_action_info:
+        tic = profiler.tic()
+        total_action_kl += agent.get_kl(state = state, goal = goal)
+        profiler.toc('get_kl', tic, session_calls = 1)
+      if agent.use_state_info:
+        tic = profiler.tic()
+        ps_g = state_goal_counts[state, goal] / np.sum(state_goal_counts[:,goal])
+        ps = np.sum(state_goal_counts[state,:]) / np.sum(state_goal_counts)
+        total_lso += np.log2(ps_g/ps)
+        profiler.toc('lso', tic)
+        
+      total_reward += reward
+      episode_length = t
+      
+      # update on this transition (bootstrapping from next_state unless done)
+      tic = profiler.tic()
+      loss = agent.update_td(state = state,
+                             goal = goal,
+                             action = action,
+                             reward = reward,
+                             next_state = next_state,
+                             done = done,
+                             discount_factor = discount_factor,
+                             learning_rate = this_learning_rate,
+                             entropy_scale = this_entropy_scale,
+                             value_scale = this_value_scale,
+                             action_info_scale = this_action_info_scale,
+                             state_info_scale = this_state_info_scale,
+                             state_goal_counts = state_goal_counts)
+      profiler.toc('update', tic, session_calls = agent_session_calls)
+      profiler.count_feed(agent.last_feed_dict)
+      
+      if print_updates:
+        # Print out which step we're on, useful for debugging.
+        print("\r{}/{} steps, last reward {}, step {} @ episode {}     ".format(
+                step_count, training_steps, last_episode_reward, t, i+1), end="")
+        # sys.stdout.flush()
+          
+      state = next_state
+      if agent.use_state_info:
+        state_goal_counts *= state_count_discount
+        state_goal_counts[state, goal] += 1
+        
+      # check if nans creeped in (to the action probabilities or the update)
+      if np.isnan(action_probs).any():
+        print('NaN alert at %i steps' % step_count)
+        success = False
+        break
+      if loss is not None and not np.isfinite(loss):
+        print('NaN loss at %i steps' % step_count)
+        success = False
+        break
+      
+      if done or t > max_episode_length: break
+    
+    # skip stats and updates for episodes with nans
+    if success:
+      
+      # save episode stats
+      episode_rewards.append(total_reward)
+      episode_lengths.append(episode_length)
+      if agent.use_action_info:
+        episode_action_kl.append(total_action_kl)
+      if agent.use_state_info:
+        episode_lso.append(total_lso)
+      last_episode_reward = total_reward
+      if reward_times is not None: reward_times.push(episode_length, total_reward)
+    
+    # on nans, roll back to last good checkpoint with a lower learning rate
+    if not success:
+      train_state = loop.rollback()
+      if train_state is None: break
+      continue
+    
+    structures = lambda: {'episode_lengths': episode_lengths,
+                          'episode_rewards': episode_rewards,
+                          'episode_action_kl': episode_action_kl,
+                          'episode_lso': episode_lso,
+                          'state_goal_counts': state_goal_counts,
+                          'schedules': [learning_rate, entropy_scale, value_scale,
+                                        action_info_scale, state_info_scale]}
+    if loop.end_episode(step_count, episode_length, total_reward, make_train_state, structures,
+                        action_kl = total_action_kl,
+                        lso = total_lso,
+                        policy = agent.get_policy):
+      break
+  
+  loop.finish(step_count, make_train_state)
+  
+  # package up stats, as zero-copy numpy arrays
+  stats = EpisodeStats(episode_lengths = episode_lengths,
+                       episode_rewards = episode_rewards,
+                       episode_action_kl = episode_action_kl,
+                       episode_lso = episode_lso,
+                       state_goal_counts = state_goal_counts)
+  
+  return as_views(stats), loop.success
@@ -0,0 +1,326 @@
+import numpy as np
+import itertools
+from collections import deque
+from play_episode import play
+from envs.JointTwoGoalGridWorld import JointTwoGoalGridWorld
+from util.anneal import as_schedule
+from util.profiler import NULL_PROFILER
+from util.columns import as_views
+from util.sampling import Sampler
+from training.loop import TrainingLoop
+from training.REINFORCE_bob import Bobservation, _check_goal_access, _new_stats, _columns, _train_state
+
+def actor_critic(env, alice, bob, training_steps, learning_rate,
+                 entropy_scale, value_scale, discount_factor,
+                 max_episode_length, n_step = 5, state_count_discount = 1, bob_goal_access = None,
+                 checkpointer = None, nan_learning_rate_decay = .5, max_nan_rollbacks = 5,
+                 monitor = None, profiler = None, memory_monitor = None,
+                 alice_reward_times = None, bob_reward_times = None,
+                 viz_episode_every = 1000, print_updates = False):
+  """
+  Online actor-critic for bob, with n-step bootstrapped returns: each of
+  bob's transitions is updated n_step steps later, with return
+  r_t + ... + discount^(n-1) r_t+n-1 + discount^n V(s_t+n) from bob's value
+  head, rather than after the episode from Monte Carlo returns
+  (training.REINFORCE_bob). Only the last n_step transitions are buffered.
+  Same arguments and results as REINFORCE_bob.reinforce, plus n_step.
+  
+  Args:
+    env: OpenAI environment.
+    alice: a trained agent with a predict function 
+    bob: an agent to be trained with predict and update functions
+    training_steps: number of time steps to train for
+    entropy_scale: scalar, vector of length training_steps, or util.anneal schedule
+    value_scale: scalar, vector of length training_steps, or util.anneal schedule
+    discount_factor: time-discount factor
+    max_episode_length: maximum number of time steps for an episode
+    bob_goal_access = 'immediate' -> z = +- 1 depending on goal
+                    = 'delayed' -> z = +- 1 once alice kl crosses kl_thresh; z = 0 before
+                      (alice must have use_action_info, else ValueError)
+                    = None -> z produced by RNN applied to alice trajectory
+    checkpointer, nan_learning_rate_decay, max_nan_rollbacks, monitor,
+      profiler, memory_monitor: see training.loop.TrainingLoop
+    alice_reward_times, bob_reward_times: optional util.stats.RewardTimes,
+      fed each episode's length and reward, so first_time_to's results are
+      ready when training ends
+  
+  Returns:
+    An EpisodeStats object with two numpy arrays for episode_lengths and episode_rewards.
+  """
+  
+  # this allows one to set params to scalars, per-step arrays or schedules
+  learning_rate = as_schedule(learning_rate)
+  entropy_scale = as_schedule(entropy_scale)
+  value_scale = as_schedule(value_scale)
+  if profiler is None: profiler = NULL_PROFILER
+  _check_goal_access(alice, bob_goal_access)
+  alice_session_calls = 1 if alice.trainable else 0
+
+  # Keeps track of useful statistics (typed, growable numpy columns)
+  alice_stats, bob_stats = _new_stats(alice, env)
+  
+  # count total steps
+  step_count = 0
+  last_bob_reward = 0
+  
+  # both agents step through the same episode
+  joint_env = JointTwoGoalGridWorld(env)
+  
+  # action sampler for both agents, see util.sampling
+  sampler = Sampler()
+  
+  loop = TrainingLoop(env, checkpointer, nan_learning_rate_decay, max_nan_rollbacks,
+                      monitor, profiler, memory_monitor, sampler)
+  train_state = loop.resume()
+  make_train_state = lambda: _train_state(step_count, alice_stats, bob_stats, env,
+                                          loop.learning_rate_scale, sampler)
+  
+  # iterate over episodes
+  while True:
+    
+    # load checkpointed state, either to resume or to roll back after nans
+    if train_state is not None:
+      step_count = train_state.step_count
+      alice_stats, bob_stats = [_columns(stats) for stats in train_state.stats]
+      last_bob_reward = bob_stats.episode_rewards[-1] if bob_stats.episode_rewards else 0
+      for times, stats in [(alice_reward_times, alice_stats), (bob_reward_times, bob_stats)]:
+        if times is not None:
+          times.reset()
+          times.extend(stats.episode_lengths, stats.episode_rewards)
+      train_state = None
+    
+    # if exceeded number of steps to train for, quit
+    if step_count >= training_steps: break
+    i = len(bob_stats.episode_lengths) # episode index
+    
+    this_learning_rate = loop.learning_rate_scale * learning_rate[step_count]
+    this_entropy_scale = entropy_scale[step_count]
+    this_value_scale = value_scale[step_count]
+    
+    # occasional viz
+    if i % viz_episode_every == 0:
+      tic = profiler.tic()
+      print('----- EPISODE %i, STEP %i -----\n' % (i, step_count))
+      play(env = env,
+           alice = alice,
+           state_goal_counts = alice_stats.state_goal_counts,
+           bob = bob,
+           max_episode_length = max_episode_length,
+           bob_goal_access = bob_goal_access,
+           sampler = sampler)
+      profiler.toc('viz', tic)
+  
+    # reset envs
+    tic = profiler.tic()
+    alice_state, bob_state, goal = joint_env.reset()
+    profiler.toc('reset', tic)
+    if alice.use_state_info:
+#      alice_stats.state_goal_counts *= state_count_discount
+      alice_stats.state_goal_counts[alice_state, goal] += 1
+    
+    # initialize alice and bob episode stat trackers
+    success = True
+    alice_states = []
+    alice_actions = []
+    alice_done = False
+    alice_episode_length = 0
+    alice_total_reward = 0
+    if alice.use_action_info: total_action_kl = 0
+    else: total_action_kl = None
+    if alice.use_state_info: total_lso = 0
+    else: total_lso = None
+    bob_pending = deque() # transitions awaiting their n-step return
+    bob_done = False
+    bob_episode_length = 0
+    bob_total_reward = 0
+    
+    # iterate over steps of alice+bob
+    for t in itertools.count(start = 1):
+      alice_active, bob_active = not alice_done, not bob_done
+      
+      # first alice picks an action
+      if alice_active:
+        tic = profiler.tic()
+        alice_action_probs, alice_value = alice.predict(alice_state, goal)
+        profiler.toc('alice_predict', tic, session_calls = alice_session_calls)
+        tic = profiler.tic()
+        alice_action = sampler.choice(alice_action_probs)
+        profiler.toc('sample', tic)
+        # update alice stats
+        if alice.use_action_info:
+          tic = profiler.tic()
+          total_action_kl += alice.get_kl(state = alice_state, goal = goal)
+          profiler.toc('get_kl', tic, session_calls = 1)
+        if alice.use_state_info:
+          tic = profiler.tic()
+          ps_g = alice_stats.state_goal_counts[alice_state, goal] / np.sum(alice_stats.state_goal_counts[:,goal])
+          ps = np.sum(alice_stats.state_goal_counts[alice_state,:]) / np.sum(alice_stats.state_goal_counts)
+          total_lso += np.log2(ps_g/ps)
+          profiler.toc('lso', tic)
+      else: # if done, sit still
+        alice_action = joint_env.action_to_index['STAY']
+      alice_states.append(alice_state)
+      alice_actions.append(alice_action)
+      
+      # then bob picks one, seeing alice's trajectory so far
+      if bob_active:
+        step_count += 1
+        tic = profiler.tic()
+        if bob_goal_access is None:
+          bob_action_probs, bob_value, z, _ = bob.predict(state = bob_state,
+                                                          obs_states = alice_states,
+                                                          obs_actions = alice_actions)
+        elif bob_goal_access == 'immediate':
+          if goal == 0: z = [-1]
+          elif goal == 1: z = [+1]
+          bob_action_probs, bob_value, _, _ = bob.predict(state = bob_state,
+                                                          z = z)
+        elif bob_goal_access == 'delayed':
+          kl_thresh = .8
+          if total_action_kl>kl_thresh:
+            if goal == 0: z = [-1]
+            elif goal == 1: z = [+1]
+          else:
+            z = [0]
+          bob_action_probs, bob_value, _, _ = bob.predict(state = bob_state,
+                                                          z = z)
+        profiler.toc('bob_predict', tic, session_calls = 1)
+        # the oldest pending transition's return bootstraps from this value
+        if len(bob_pending) == n_step:
+          loss = _update_oldest(bob, bob_pending, bob_value, discount_factor, bob_goal_access,
+                                this_learning_rate, this_entropy_scale, this_value_scale, profiler)
+          if not np.isfinite(loss):
+            print('NaN loss at %i steps' % step_count)
+            success = False
+            break
+        tic = profiler.tic()
+        bob_action = sampler.choice(bob_action_probs)
+        profiler.toc('sample', tic)
+      else: # if done, sit still
+        bob_action = joint_env.action_to_index['STAY']
+      
+      # joint step; an agent that's done doesn't move
+      tic = profiler.tic()
+      next_states, rewards, dones = joint_env.step(alice_action, bob_action)
+      profiler.toc('env_step', tic)
+      next_alice_state, next_bob_state = next_states
+      alice_reward, bob_reward = rewards
+      alice_done, bob_done = dones
+      if alice_active:
+        alice_total_reward += alice_reward
+        alice_episode_length = t
+      if bob_active:
+        bob_total_reward += bob_reward
+        bob_episode_length = t
+        # keep track of the transition (with the trajectory bob saw so far)
+        bob_pending.append(Bobservation(alice_states = alice_states[:],
+                                        alice_actions = alice_actions[:],
+                                        state = bob_state,
+                                        value = bob_value,
+                                        action = bob_action,
+                                        reward = bob_reward,
+                                        z = z))
+      
+      if print_updates:
+        # print out which step we're on, useful for debugging.
+        print("\r{}/{} steps, last reward {}, step {} @ episode {}     ".format(
+                step_count, training_steps, last_bob_reward, t, i+1), end="")
+        # sys.stdout.flush()
+    
+      # check if nans creeped in (to bob's action probabilities)
+      if np.isnan(bob_action_probs).any():
+        success = False
+        break
+          
+      alice_state = next_alice_state
+      bob_state = next_bob_state
+      if alice.use_state_info:
+#        alice_stats.state_goal_counts *= state_count_discount
+        alice_stats.state_goal_counts[alice_state, goal] += 1
+      
+      # check if episode over
+      if (alice_done and bob_done) or t > max_episode_length: break
+    
+    # skip stats and updates for episodes with nans
+    if success:
+      
+      # otherwise, update episode stats
+      alice_stats.episode_rewards.append(alice_total_reward)
+      alice_stats.episode_lengths.append(alice_episode_length)
+      if alice.use_action_info: alice_stats.episode_action_kl.append(total_action_kl)
+      if alice.use_state_info: alice_stats.episode_lso.append(total_lso)
+      bob_stats.episode_rewards.append(bob_total_reward)
+      bob_stats.episode_lengths.append(bob_episode_length)
+      last_bob_reward = bob_total_reward
+      if alice_reward_times is not None: alice_reward_times.push(alice_episode_length, alice_total_reward)
+      if bob_reward_times is not None: bob_reward_times.push(bob_episode_length, bob_total_reward)
+    
+      # update the transitions still pending, bootstrapping from the value
+      # of bob's last state if the episode was cut off before he was done
+      if bob_done: last_value = 0.
+      else: last_value = _value(bob, next_bob_state, alice_states, alice_actions, z, bob_goal_access)
+      while bob_pending:
+        loss = _update_oldest(bob, bob_pending, last_value, discount_factor, bob_goal_access,
+                              this_learning_rate, this_entropy_scale, this_value_scale, profiler)
+        if not np.isfinite(loss):
+          print('NaN loss at %i steps' % step_count)
+          success = False
+          break
+    
+    # on nans, roll back to last good checkpoint with a lower learning rate
+    if not success:
+      train_state = loop.rollback()
+      if train_state is None: break
+      continue
+    
+    structures = lambda: {'alice_stats': alice_stats,
+                          'bob_stats': bob_stats,
+                          'bob_episode_buffer': bob_pending,
+                          'schedules': [learning_rate, entropy_scale, value_scale]}
+    if loop.end_episode(step_count, bob_episode_length, bob_total_reward, make_train_state,
+                        structures):
+      break
+  
+  loop.finish(step_count, make_train_state)
+  
+  return as_views(alice_stats), as_views(bob_stats), loop.success
+
+def _update_oldest(bob, pending, bootstrap_value, discount_factor, bob_goal_access,
+                   learning_rate, entropy_scale, value_scale, profiler):
+  """Pops the oldest pending transition and updates bob on it, with the
+  discounted rewards of the pending transitions plus the discounted
+  bootstrap_value as its return."""
+  tic = profiler.tic()
+  n_step_return = bootstrap_value
+  for transition in reversed(pending): n_step_return = transition.reward + discount_factor * n_step_return
+  transition = pending.popleft()
+  profiler.toc('returns', tic)
+  tic = profiler.tic()
+  if bob_goal_access is None: # provide alice trajectory
+    loss = bob.update(state = transition.state,
+                      action = transition.action,
+                      return_estimate = n_step_return,
+                      learning_rate = learning_rate,
+                      entropy_scale = entropy_scale,
+                      value_scale = value_scale,
+                      obs_states = transition.alice_states,
+                      obs_actions = transition.alice_actions)
+  else: # provide z
+    loss = bob.update(state = transition.state,
+                      action = transition.action,
+                      return_estimate = n_step_return,
+                      learning_rate = learning_rate,
+                      entropy_scale = entropy_scale,
+                      value_scale = value_scale,
+                      z = transition.z)
+  profiler.toc('update', tic, session_calls = 1)
+  profiler.count_feed(bob.last_feed_dict)
+  return loss
+
+def _value(bob, state, alice_states, alice_actions, z, bob_goal_access):
+  """bob's value estimate of state, given alice's trajectory (or z)."""
+  if bob_goal_access is None:
+    _, value, _, _ = bob.predict(state = state, obs_states = alice_states, obs_actions = alice_actions)
+  else:
+    _, value, _, _ = bob.predict(state = state, z = z)
+  return value
@@ -0,0 +1,277 @@
+import numpy as np
+from collections import namedtuple
+from util.anneal import as_schedule
+from util.profiler import NULL_PROFILER
+from util.columns import GrowableArray, column, as_views
+from envs.TwoGoalGridWorld import expected_next, push_forward
+from training.loop import TrainingLoop
+from training.REINFORCE_alice import EpisodeStats, _train_state
+
+# expected per-episode totals under the current policy (and goal prior)
+Expectations = namedtuple('Expectations', ['length', 'reward', 'action_kl', 'lso',
+                                           'state_goal_counts', 'values'])
+
+def exact_gradient(env, agent, training_steps, learning_rate,
+                   entropy_scale, value_scale, action_info_scale, state_info_scale,
+                   state_count_discount, discount_factor, max_episode_length,
+                   schedule_steps = None, checkpointer = None, nan_learning_rate_decay = .5,
+                   max_nan_rollbacks = 5, monitor = None, profiler = None,
+                   memory_monitor = None, reward_times = None, print_updates = False):
+  """
+  Model-based, full-batch training of a tabular alice: each update follows
+  the exact expected gradient of the sampled trainers' objective
+  (expected_gradient below), computed from the env's transition model for
+  all (state, goal) at once, so training is deterministic and needs
+  thousands of updates rather than hundreds of thousands of steps.
+  The value table is set to the exact values at each update (value_scale is
+  unused), and state_count_discount is ignored.
+  Takes the same arguments as REINFORCE_alice.reinforce, except that
+  training_steps counts updates; schedules (indexed in env steps) are
+  stretched over them from schedule_steps (default training_steps).
+  Each update is logged as one episode with the expected length, reward,
+  action kl and lso, so stats have the same fields (episode lengths being
+  fractional) and state_goal_counts are expected visits per episode.
+  
+  Args:
+    env: TwoGoalGridWorld, with get_transition_model
+    agent: TabularREINFORCE built with exact_gradient = True
+    see REINFORCE_alice.reinforce for the rest
+  
+  Returns:
+      An EpisodeStats object, and success.
+  """
+  
+  # this allows one to set params to scalars, per-step arrays or schedules
+  learning_rate = as_schedule(learning_rate)
+  entropy_scale = as_schedule(entropy_scale)
+  action_info_scale = as_schedule(action_info_scale)
+  state_info_scale = as_schedule(state_info_scale)
+  if schedule_steps is None: schedule_steps = training_steps
+  if profiler is None: profiler = NULL_PROFILER
+  
+  # the model: start states are uniform over non-terminal states (env._reset)
+  T, R = env.get_transition_model()
+  terminal = env.get_dynamics().terminal
+  start_dist = ~terminal / np.sum(~terminal)
+  
+  # keep track of useful statistics (typed, growable numpy columns)
+  episode_lengths = GrowableArray(np.float64)
+  episode_rewards = GrowableArray(np.float64)
+  episode_action_kl = GrowableArray(np.float64) if agent.use_action_info else None
+  episode_lso = GrowableArray(np.float64) if agent.use_state_info else None
+  state_goal_counts = None
+  
+  # count updates
+  step_count = 0
+  
+  loop = TrainingLoop(env, checkpointer, nan_learning_rate_decay, max_nan_rollbacks,
+                      monitor, profiler, memory_monitor, unit = 'updates')
+  train_state = loop.resume()
+  make_train_state = lambda: _train_state(step_count, episode_lengths, episode_rewards,
+                                          episode_action_kl, episode_lso, state_goal_counts,
+                                          env, loop.learning_rate_scale)
+  
+  while True:
+    
+    # load checkpointed state, either to resume or to roll back after nans
+    if train_state is not None:
+      step_count = train_state.step_count
+      episode_lengths = column(train_state.stats.episode_lengths)
+      episode_rewards = column(train_state.stats.episode_rewards)
+      episode_action_kl = column(train_state.stats.episode_action_kl)
+      episode_lso = column(train_state.stats.episode_lso)
+      state_goal_counts = train_state.stats.state_goal_counts
+      if reward_times is not None:
+        reward_times.reset()
+        reward_times.extend(episode_lengths, episode_rewards)
+      train_state = None
+    
+    # if exceeded number of updates to train for, quit
+    if step_count >= training_steps: break
+    schedule_step = step_count * schedule_steps // training_steps
+    
+    # exact gradient of the current policy
+    tic = profiler.tic()
+    policy = agent.get_policy()
+    profiler.toc('predict', tic, session_calls = 1)
+    tic = profiler.tic()
+    gradient, expected = expected_gradient(policy, T, R, terminal, start_dist, env.goal_dist,
+                                           discount_factor, max_episode_length,
+                                           entropy_scale = entropy_scale[schedule_step],
+                                           action_info_scale = action_info_scale[schedule_step] if agent.use_action_info else None,
+                                           state_info_scale = state_info_scale[schedule_step] if agent.use_state_info else None)
+    profiler.toc('gradient', tic)
+    step_count += 1
+    
+    # check if nans creeped in (to the policy or the gradient)
+    success = True
+    if not (np.all(np.isfinite(gradient)) and np.isfinite(expected.length)):
+      print('NaN alert at %i updates' % step_count)
+      success = False
+    
+    if success:
+      
+      # ascend the gradient (optimizer descends), and set values
+      tic = profiler.tic()
+      agent.update_exact(logits_gradient = -gradient,
+                         values = expected.values,
+                         learning_rate = loop.learning_rate_scale * learning_rate[schedule_step])
+      profiler.toc('update', tic, session_calls = 1)
+      profiler.count_feed(agent.last_feed_dict)
+      
+      # save expected episode stats
+      episode_lengths.append(expected.length)
+      episode_rewards.append(expected.reward)
+      if agent.use_action_info:
+        episode_action_kl.append(expected.action_kl)
+      if agent.use_state_info:
+        episode_lso.append(expected.lso)
+      state_goal_counts = expected.state_goal_counts
+      if reward_times is not None: reward_times.push(expected.length, expected.reward)
+      
+      if print_updates:
+        print("\r{}/{} updates, expected reward {:.3f}     ".format(
+                step_count, training_steps, expected.reward), end="")
+    
+    # on nans, roll back to last good checkpoint with a lower learning rate
+    if not success:
+      train_state = loop.rollback()
+      if train_state is None: break
+      continue
+    
+    structures = lambda: {'episode_lengths': episode_lengths,
+                          'episode_rewards': episode_rewards,
+                          'episode_action_kl': episode_action_kl,
+                          'episode_lso': episode_lso,
+                          'state_goal_counts': state_goal_counts,
+                          'schedules': [learning_rate, entropy_scale,
+                                        action_info_scale, state_info_scale]}
+    if loop.end_episode(step_count, expected.length, expected.reward, make_train_state, structures,
+                        profiled_length = 1,
+                        action_kl = expected.action_kl,
+                        lso = expected.lso,
+                        policy = agent.get_policy):
+      break
+  
+  loop.finish(step_count, make_train_state)
+  
+  # package up stats, as zero-copy numpy arrays
+  stats = EpisodeStats(episode_lengths = episode_lengths,
+                       episode_rewards = episode_rewards,
+                       episode_action_kl = episode_action_kl,
+                       episode_lso = episode_lso,
+                       state_goal_counts = state_goal_counts)
+  
+  return as_views(stats), loop.success
+
+def expected_gradient(policy, T, R, terminal, start_dist, goal_dist, discount_factor,
+                      max_episode_length, entropy_scale = 0, action_info_scale = None,
+                      state_info_scale = None):
+  """
+  Expected (full-batch) gradient of REINFORCE_alice's objective wrt alice's
+  logits, from the known model (T, R) of TwoGoalGridWorld.get_transition_model,
+  with no sampling: step distributions are propagated forward and values
+  backward over the max_episode_length + 1 steps of an episode, vectorized
+  over all (state, goal). As in the sampled trainers, expected visits rho
+  (steps taken in each state) weight the discounted advantages Q - V of the
+  remaining episode, the entropy bonus and the action info (KL to the
+  goal-averaged policy, ASSUMES UNIFORM P(G) as in agents.alice). State info
+  is the expected episode total of log state odds, log2 p(s|g)/p(s) with
+  p(s|g) = rho_g/|rho_g|, differentiated through p(s|g) but not through
+  episode lengths |rho_g| (the sampled trainers never put it in the returns;
+  otherwise a positive state_info_scale pays alice to never finish).
+
+  Args:
+    policy: goal X state X action probabilities (TabularREINFORCE.get_policy)
+    T: transition model (envs.TwoGoalGridWorld.Transitions)
+    R: goal X state X action expected rewards
+    terminal: state, whether a state ends the episode
+    start_dist: start state distribution
+    goal_dist: goal distribution
+    discount_factor: time-discount factor of the returns
+    max_episode_length: episodes are cut after max_episode_length + 1 steps
+    entropy_scale, action_info_scale, state_info_scale: regularizer weights
+      (None for info terms that aren't used)
+
+  Returns:
+    Gradient (goal X state X action) to ascend, and Expectations.
+  """
+  nG, nS, nA = policy.shape
+  goal_dist = np.asarray(goal_dist, dtype = float)
+  # episodes end in terminal states, so no steps are taken there
+  terminal = np.asarray(terminal, dtype = bool)
+  T = T._replace(probs = T.probs * ~terminal[:, None, None])
+  
+  # distribution of the state at each step of an episode
+  H = max_episode_length + 1
+  step_dists = np.zeros((H, nG, nS))
+  step_dists[0] = start_dist * ~terminal
+  for t in range(1, H):
+    step_dists[t] = push_forward(T, step_dists[t-1][:, :, None] * policy) * ~terminal
+  steps = np.sum(step_dists, axis = 0) # goal X state, expected steps taken
+  w = goal_dist[:, None] * steps
+  
+  # returns: discounted advantages of the remaining episode at each step
+  advantages, V = _advantage_visits(policy, T, R, discount_factor, step_dists)
+  gradient = goal_dist[:, None, None] * policy * advantages
+  
+  # entropy bonus (nats)
+  log_policy = np.log(np.maximum(policy, np.finfo(float).tiny))
+  gradient += entropy_scale * w[:, :, None] * _softmax_backward(policy, -log_policy)
+  
+  # action info: KL (bits) of each goal's policy to the mean policy
+  if action_info_scale is not None:
+    log_base = np.log(np.mean(policy, axis = 0)) # state X action
+    kl = np.sum(policy * (log_policy - log_base), axis = 2) / np.log(2)
+    d_policy = w[:, :, None] * (log_policy - log_base) - \
+               np.sum(w[:, :, None] * policy, axis = 0) / np.exp(log_base) / nG
+    gradient += action_info_scale * _softmax_backward(policy, d_policy) / np.log(2)
+    action_kl = np.sum(w * kl)
+  else:
+    action_kl = None
+  
+  # state info: d/d rho of sum_g p(g) sum_s rho_g(s) log2 p(s|g)/p(s), with
+  # episode lengths |rho_g| held fixed, pushed back through the step
+  # distributions like an (undiscounted) state reward
+  if state_info_scale is not None:
+    lengths = np.sum(steps, axis = 1, keepdims = True)
+    ps_g = steps / lengths
+    ps = np.sum(goal_dist[:, None] * ps_g, axis = 0)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+      log_odds = np.where(terminal, 0., np.log(ps_g / ps))
+      M = np.where(terminal, 0., np.sum(w, axis = 0) / ps)
+    info = np.sum(ps_g * log_odds, axis = 1, keepdims = True) # I(S;G=g), nats
+    d_steps = goal_dist[:, None] * (log_odds - info - (M - np.sum(ps_g * M, axis = 1, keepdims = True)) / lengths)
+    d_steps = d_steps * ~terminal / np.log(2)
+    advantages, _ = _advantage_visits(policy, T, np.repeat(d_steps[:, :, None], nA, axis = 2), 1., step_dists)
+    gradient += state_info_scale * policy * advantages
+    lso = np.sum(w * log_odds) / np.log(2)
+  else:
+    lso = None
+  
+  # visits as counted by the sampled trainers: start states and every next state
+  state_goal_counts = step_dists[0] + push_forward(T, steps[:, :, None] * policy)
+  expectations = Expectations(length = np.sum(w),
+                              reward = np.sum(w[:, :, None] * policy * R),
+                              action_kl = action_kl,
+                              lso = lso,
+                              state_goal_counts = (goal_dist[:, None] * state_goal_counts).T, # state X goal
+                              values = V)
+  return gradient, expectations
+
+def _advantage_visits(policy, T, R, discount_factor, step_dists):
+  """Advantages Q - V (goal X state X action) of rewards R for the remaining
+  episode, summed over steps weighted by the step distributions, and the
+  values of whole episodes, by backward recursion over the episode."""
+  H = len(step_dists)
+  V = np.zeros(R.shape[:2]) # goal X state, 0 steps left
+  advantages = np.zeros(R.shape)
+  for k in range(1, H+1): # steps left
+    Q = R + discount_factor * expected_next(T, V)
+    V = np.sum(policy * Q, axis = 2)
+    advantages += step_dists[H-k][:, :, None] * (Q - V[:, :, None])
+  return advantages, V
+
+def _softmax_backward(policy, d_policy):
+  """Chain rule through the softmax over actions: gradient wrt logits."""
+  return policy * (d_policy - np.sum(policy * d_policy, axis = 2, keepdims = True))
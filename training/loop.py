@@ -0,0 +1,124 @@
+from util.profiler import NULL_PROFILER
+
+class TrainingLoop:
+  """
+  Scaffolding around a trainer's episode loop: resuming from the latest
+  checkpoint, rolling back to the last good one (with a lower learning
+  rate) after NaNs, periodic and final checkpoints, memory samples and early
+  stopping. The trainer keeps its own stats and step count and runs
+
+    train_state = loop.resume()
+    while True:
+      if train_state is not None: ... load stats, step_count ...
+      if step_count >= training_steps: break
+      ... one episode, at loop.learning_rate_scale ...
+      if nans:
+        train_state = loop.rollback()
+        if train_state is None: break
+        continue
+      if loop.end_episode(...): break
+    loop.finish(step_count, make_train_state)
+
+  and returns loop.success. Checkpointed state is passed as a function
+  (make_train_state), called only when a checkpoint is written.
+
+  Args:
+    env: the trainer's env, whose RNG (and sampler) checkpoints restore
+    checkpointer: optional util.checkpoint.Checkpointer; if given, training
+      resumes from its latest checkpoint, saves every checkpointer.every steps,
+      and on NaNs rolls back to the last good checkpoint
+    nan_learning_rate_decay: learning rate multiplier applied on each rollback
+    max_nan_rollbacks: rollbacks allowed before giving up (success = False)
+    monitor: optional util.convergence.ConvergenceMonitor; training stops
+      early (at monitor.stop_step) once it reports convergence. Its state is
+      checkpointed too, so it forgets episodes that are rolled back
+    profiler: optional util.profiler.Profiler timing each phase of the loop
+    memory_monitor: optional util.memory.MemoryMonitor sampling RSS and the
+      sizes of stats, counts and buffers every memory_monitor.every steps
+    sampler: the trainer's util.sampling.Sampler for actions, restored
+      along with the checkpoint
+    unit: what step_count counts, for messages
+  """
+
+  def __init__(self, env, checkpointer = None, nan_learning_rate_decay = .5,
+               max_nan_rollbacks = 5, monitor = None, profiler = None,
+               memory_monitor = None, sampler = None, unit = 'steps'):
+    self.env = env
+    self.checkpointer = checkpointer
+    self.nan_learning_rate_decay = nan_learning_rate_decay
+    self.max_nan_rollbacks = max_nan_rollbacks
+    self.monitor = monitor
+    self.profiler = NULL_PROFILER if profiler is None else profiler
+    self.memory_monitor = memory_monitor
+    self.sampler = sampler
+    self.unit = unit
+    self.learning_rate_scale = 1
+    self.nan_rollbacks = 0
+    # whether or not the run had to exit early due to nans; useful for
+    # triggering retraining with new init
+    self.success = True
+
+  def resume(self):
+    """TrainState of the latest checkpoint, if any (e.g. preempted job), with
+    RNGs, the sampler and the monitor restored; None otherwise."""
+    if self.checkpointer is None: return None
+    train_state = self.checkpointer.restore(self.env)
+    if train_state is not None:
+      self.learning_rate_scale = min(self.learning_rate_scale, train_state.learning_rate_scale)
+      if self.sampler is not None and train_state.sampler_states is not None:
+        self.sampler.set_state(train_state.sampler_states['actions'])
+      if self.monitor is not None:
+        # (checkpoints written before monitor states: start it over)
+        if train_state.monitor_state is not None: self.monitor.set_state(train_state.monitor_state)
+        else: self.monitor.reset()
+    return train_state
+
+  def rollback(self):
+    """After nans, the TrainState of the last good checkpoint, to continue
+    from at a lower learning rate; None (and success = False) if there is
+    none, or the rollbacks are used up."""
+    checkpointer = self.checkpointer
+    if (checkpointer is not None and checkpointer.latest() is not None and
+        self.nan_rollbacks < self.max_nan_rollbacks):
+      self.nan_rollbacks += 1
+      self.learning_rate_scale *= self.nan_learning_rate_decay
+      print('Rolling back to %s, learning rate scale %g' %
+            (checkpointer.latest(), self.learning_rate_scale))
+      return self.resume()
+    self.success = False
+    return None
+
+  def end_episode(self, step_count, episode_length, episode_reward, make_train_state,
+                  structures = None, profiled_length = None, **monitor_stats):
+    """Bookkeeping after a nan-free episode (and its updates): checkpoint if
+    due, profiler and memory samples (structures: a function returning the
+    named structures to size; profiled_length: the steps the profiler counts,
+    default episode_length) and the convergence check. Returns True once
+    training should stop early."""
+    profiler = self.profiler
+    # the monitor sees the episode first, so checkpoints include it
+    converged = self.monitor is not None and self.monitor.update(step_count, episode_length,
+                                                                 episode_reward, **monitor_stats)
+    if self.checkpointer is not None and self.checkpointer.due(step_count):
+      tic = profiler.tic()
+      self._save(make_train_state)
+      profiler.toc('checkpoint', tic)
+    profiler.end_episode(step_count, episode_length if profiled_length is None else profiled_length)
+    if self.memory_monitor is not None and self.memory_monitor.due(step_count):
+      self.memory_monitor.sample(step_count, structures() if structures is not None else None)
+    if converged: print('Converged at %i %s' % (step_count, self.unit))
+    return converged
+
+  def finish(self, step_count, make_train_state):
+    """Final checkpoint, so a longer run can pick up exactly where this one
+    ended, and the profiler's last partial window."""
+    checkpointer = self.checkpointer
+    if self.success and checkpointer is not None and checkpointer.last_step != step_count:
+      self._save(make_train_state)
+    self.profiler.report(step_count)
+
+  def _save(self, make_train_state):
+    train_state = make_train_state()
+    if self.monitor is not None:
+      train_state = train_state._replace(monitor_state = self.monitor.get_state())
+    self.checkpointer.save(train_state)
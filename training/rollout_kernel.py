@@ -0,0 +1,199 @@
+import numpy as np
+from collections import namedtuple
+try:
+  import numba
+except ImportError:
+  numba = None
+
+# episodes generated by rollout, episode X step arrays; steps past an
+# episode's length hold state/action -1 and reward/kl/lso 0
+# states has one more column: the final (next) state of each episode
+Rollouts = namedtuple('Rollouts', ['goals', 'states', 'actions', 'rewards', 'lengths',
+                                   'action_kl', 'lso'])
+
+def rollout(policy, dynamics, goal_dist, n_episodes, max_episode_length,
+            random_state = None, action_kls = None, state_goal_counts = None,
+            state_count_discount = 1, use_numba = None):
+  """
+  Rolls out n_episodes complete episodes of a fixed tabular policy in the
+  array transition model of TwoGoalGridWorld.get_dynamics, as
+  REINFORCE_alice.reinforce would (uniform non-terminal start states,
+  episodes cut after max_episode_length + 1 steps), into preallocated arrays.
+  Jitted with numba when it's installed (use_numba = None), with numpy
+  otherwise; both consume the same uniforms, drawn up front from
+  random_state (np.random by default), so they generate the same episodes.
+
+  Args:
+    policy: goal X state X action probabilities
+    dynamics: TwoGoalGridWorld.get_dynamics()
+    goal_dist: goal distribution
+    action_kls: optional goal X state table of per-step action kl (bits),
+      e.g. action_kl_table(policy)
+    state_goal_counts: optional state X goal visit counts; per-step log state
+      odds are computed from them as they're updated (in place) with every
+      visit, discounted by state_count_discount, as in the trainers
+
+  Returns:
+    A Rollouts object (action_kl/lso None unless their tables are given).
+  """
+  if random_state is None: random_state = np.random
+  if use_numba is None: use_numba = numba is not None
+  if use_numba and numba is None: raise ImportError('numba is not installed')
+  nG, nS, nA = policy.shape
+  H = max_episode_length + 1
+  cdf = np.cumsum(policy, axis = 2)
+  goal_cdf = np.cumsum(np.asarray(goal_dist, dtype = float))
+  start_states = np.flatnonzero(~dynamics.terminal)
+  u_episode = random_state.rand(n_episodes, 2) # goal, start state
+  u_step = random_state.rand(n_episodes, H, 2) # action, random transition
+
+  goals = np.zeros(n_episodes, dtype = np.int64)
+  states = -np.ones((n_episodes, H+1), dtype = np.int64)
+  actions = -np.ones((n_episodes, H), dtype = np.int64)
+  rewards = np.zeros((n_episodes, H))
+  lengths = np.zeros(n_episodes, dtype = np.int64)
+  action_kl = np.zeros((n_episodes, H))
+  lso = np.zeros((n_episodes, H))
+  use_kl = action_kls is not None
+  use_lso = state_goal_counts is not None
+  if not use_kl: action_kls = np.zeros((nG, nS))
+  if not use_lso: state_goal_counts = np.zeros((nS, nG))
+
+  args = (cdf, goal_cdf, start_states, dynamics.next_states, dynamics.hit_wall,
+          dynamics.state_rewards, dynamics.terminal, float(dynamics.r_wall),
+          float(dynamics.p_rand), u_episode, u_step)
+  if use_numba:
+    _jitted_rollout_kernel(*args, action_kls, use_lso, state_goal_counts, float(state_count_discount),
+                           goals, states, actions, rewards, lengths, action_kl, lso)
+  else:
+    _rollout_numpy(*args, goals, states, actions, rewards, lengths)
+    action_kl[:] = action_kls[goals[:, None], np.maximum(states[:, :-1], 0)]
+    if use_lso: _running_lso(goals, states, lengths, state_goal_counts, state_count_discount, lso)
+    steps = np.arange(H) < lengths[:, None]
+    action_kl *= steps
+    lso *= steps
+  return Rollouts(goals = goals,
+                  states = states,
+                  actions = actions,
+                  rewards = rewards,
+                  lengths = lengths,
+                  action_kl = action_kl if use_kl else None,
+                  lso = lso if use_lso else None)
+
+def action_kl_table(policy):
+  """KL (bits) of each goal's policy to the mean policy over goals (ASSUMES
+  UNIFORM P(G), as agents.alice), goal X state."""
+  tiny = np.finfo(float).tiny # 0 log 0 = 0
+  log_policy = np.log(np.maximum(policy, tiny))
+  log_base = np.log(np.maximum(np.mean(policy, axis = 0), tiny))
+  return np.sum(policy * (log_policy - log_base), axis = 2) / np.log(2)
+
+def _rollout_numpy(cdf, goal_cdf, start_states, next_states, hit_wall, state_rewards,
+                   terminal, r_wall, p_rand, u_episode, u_step,
+                   goals, states, actions, rewards, lengths):
+  """All episodes in lockstep, until every one is done or cut."""
+  n, H = u_step.shape[:2]
+  nA = cdf.shape[2]
+  goals[:] = np.minimum(np.sum(goal_cdf[:-1] <= u_episode[:, :1], axis = 1), len(goal_cdf)-1)
+  s = start_states[np.minimum((u_episode[:, 1] * len(start_states)).astype(np.int64), len(start_states)-1)]
+  states[:, 0] = s
+  running = np.ones(n, dtype = bool)
+  for t in range(H):
+    i = np.flatnonzero(running)
+    if len(i) == 0: break
+    s, g = states[i, t], goals[i]
+    a = np.sum(cdf[g, s, :-1] <= u_step[i, t, :1], axis = 1)
+    rand = u_step[i, t, 1] < p_rand
+    # a random transition is any action's outcome, without the wall penalty
+    outcome = a.copy()
+    if p_rand > 0: outcome[rand] = np.minimum((u_step[i[rand], t, 1] / p_rand * nA).astype(np.int64), nA-1)
+    next_s = next_states[s, outcome]
+    actions[i, t] = a
+    rewards[i, t] = state_rewards[g, next_s] + r_wall * (hit_wall[s, a] & ~rand)
+    states[i, t+1] = next_s
+    lengths[i] = t+1
+    running[i] = ~terminal[next_s] & (t+1 < H)
+
+def _running_lso(goals, states, lengths, counts, discount, lso):
+  """Per-step log state odds (bits) from counts updated with every visit (start
+  states and next states, in episode order), as the trainers keep them."""
+  H = lso.shape[1]
+  visited = np.arange(H+1) <= lengths[:, None]
+  episode_index, step_index = np.nonzero(visited) # in visit order
+  s, g = states[episode_index, step_index], goals[episode_index]
+  if discount == 1:
+    # counts at each visit (including it): initial counts + earlier visits
+    nS, nG = counts.shape
+    c_sg = counts[s, g] + _running_count(s*nG + g)
+    c_g = np.sum(counts, axis = 0)[g] + _running_count(g)
+    c_s = np.sum(counts, axis = 1)[s] + _running_count(s)
+    c = np.sum(counts) + np.arange(1, len(s)+1)
+    np.add.at(counts, (s, g), 1)
+  else:
+    c_sg, c_g, c_s, c = [np.zeros(len(s)) for _ in range(4)]
+    for j in range(len(s)):
+      counts *= discount
+      counts[s[j], g[j]] += 1
+      c_sg[j], c_g[j] = counts[s[j], g[j]], np.sum(counts[:, g[j]])
+      c_s[j], c[j] = np.sum(counts[s[j], :]), np.sum(counts)
+  steps = step_index < lengths[episode_index] # final states are only counted
+  lso[episode_index[steps], step_index[steps]] = np.log2((c_sg/c_g) / (c_s/c))[steps]
+
+def _running_count(keys):
+  """# of occurrences of each key so far (including this one)."""
+  order = np.argsort(keys, kind = 'mergesort')
+  sorted_keys = keys[order]
+  starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+  group_start = np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+  count = np.empty(len(keys))
+  count[order] = np.arange(len(keys)) - group_start + 1
+  return count
+
+def _rollout_kernel(cdf, goal_cdf, start_states, next_states, hit_wall, state_rewards,
+                    terminal, r_wall, p_rand, u_episode, u_step, action_kls,
+                    use_lso, counts, discount, goals, states, actions, rewards,
+                    lengths, action_kl, lso):
+  """Episodes one after the other, step by step (compiled by numba)."""
+  n, H = u_step.shape[0], u_step.shape[1]
+  nS, nG = counts.shape
+  nA = cdf.shape[2]
+  for e in range(n):
+    g = 0
+    while g < len(goal_cdf)-1 and u_episode[e, 0] >= goal_cdf[g]: g += 1
+    goals[e] = g
+    s = start_states[min(int(u_episode[e, 1] * len(start_states)), len(start_states)-1)]
+    states[e, 0] = s
+    if use_lso: _visit(counts, s, g, discount)
+    for t in range(H):
+      a = 0
+      while a < nA-1 and u_step[e, t, 0] >= cdf[g, s, a]: a += 1
+      rand = u_step[e, t, 1] < p_rand
+      if rand: next_s = next_states[s, min(int(u_step[e, t, 1] / p_rand * nA), nA-1)]
+      else: next_s = next_states[s, a]
+      actions[e, t] = a
+      rewards[e, t] = state_rewards[g, next_s]
+      if hit_wall[s, a] and not rand: rewards[e, t] += r_wall
+      action_kl[e, t] = action_kls[g, s]
+      if use_lso:
+        c_g, c_s, c = 0., 0., 0.
+        for i in range(nS): c_g += counts[i, g]
+        for j in range(nG): c_s += counts[s, j]
+        for i in range(nS):
+          for j in range(nG): c += counts[i, j]
+        lso[e, t] = np.log2((counts[s, g]/c_g) / (c_s/c))
+        _visit(counts, next_s, g, discount)
+      states[e, t+1] = next_s
+      lengths[e] = t+1
+      s = next_s
+      if terminal[s]: break
+
+def _visit(counts, s, g, discount):
+  if discount != 1:
+    for i in range(counts.shape[0]):
+      for j in range(counts.shape[1]): counts[i, j] *= discount
+  counts[s, g] += 1
+
+if numba is not None:
+  # compiled lazily, on first call (and cached on disk)
+  _visit = numba.njit(cache = True)(_visit)
+  _jitted_rollout_kernel = numba.njit(cache = True)(_rollout_kernel)
@@ -1,4 +1,124 @@
+import bisect
+import hashlib
 import numpy as np
 
 def log_decay(start, end, length):
-    return np.logspace(np.log10(start), np.log10(end), length)
\ No newline at end of file
+    return np.logspace(np.log10(start), np.log10(end), length)
+
+class Schedule:
+  """Hyperparameter schedule evaluated lazily at step t. Indexing with
+  schedule[t] is supported, so schedules drop in wherever a per-step list
+  of values used to be used. Steps past the end hold the final value."""
+
+  def value(self, t):
+    raise NotImplementedError
+
+  def __getitem__(self, t):
+    return self.value(t)
+
+  def __eq__(self, other):
+    return type(self) == type(other) and repr(self) == repr(other)
+
+  def __hash__(self):
+    return hash(repr(self))
+
+class Constant(Schedule):
+  """Same value at every step."""
+
+  def __init__(self, value):
+    self.constant = value
+
+  def value(self, t):
+    return self.constant
+
+  def __repr__(self):
+    return 'Constant(%r)' % (self.constant,)
+
+class Piecewise(Schedule):
+  """values[k] from boundaries[k-1] (inclusive) to boundaries[k] (exclusive),
+  e.g. Piecewise([0, s], [10000]) == [0]*10000 + [s]*(training_steps-10000)."""
+
+  def __init__(self, values, boundaries):
+    if len(values) != len(boundaries) + 1:
+      raise ValueError('need exactly one more value than boundaries')
+    self.values = list(values)
+    self.boundaries = list(boundaries)
+
+  def value(self, t):
+    return self.values[bisect.bisect_right(self.boundaries, t)]
+
+  def __repr__(self):
+    return 'Piecewise(%r, %r)' % (self.values, self.boundaries)
+
+class Linear(Schedule):
+  """Linear interpolation from start to end over length steps; matches
+  np.linspace(start, end, length)[t]."""
+
+  def __init__(self, start, end, length):
+    self.start = start
+    self.end = end
+    self.length = length
+
+  def value(self, t):
+    if self.length <= 1 or t >= self.length - 1: return self.end
+    return self.start + (self.end - self.start) * t / (self.length - 1)
+
+  def __repr__(self):
+    return 'Linear(%r, %r, %r)' % (self.start, self.end, self.length)
+
+class LogDecay(Schedule):
+  """Log-linear interpolation from start to end over length steps; matches
+  log_decay(start, end, length)[t]."""
+
+  def __init__(self, start, end, length):
+    self.start = start
+    self.end = end
+    self.length = length
+    self._log_start = np.log10(start)
+    self._log_end = np.log10(end)
+
+  def value(self, t):
+    if self.length <= 1 or t >= self.length - 1: return self.end
+    return 10**(self._log_start + (self._log_end - self._log_start) * t / (self.length - 1))
+
+  def __repr__(self):
+    return 'LogDecay(%r, %r, %r)' % (self.start, self.end, self.length)
+
+class Warmup(Schedule):
+  """Ramps linearly from start to the wrapped schedule over the first steps,
+  then follows the wrapped schedule."""
+
+  def __init__(self, schedule, steps, start = 0.):
+    self.schedule = as_schedule(schedule)
+    self.steps = steps
+    self.start = start
+
+  def value(self, t):
+    v = self.schedule[t]
+    if t >= self.steps: return v
+    return self.start + (v - self.start) * t / self.steps
+
+  def __repr__(self):
+    return 'Warmup(%r, %r, start = %r)' % (self.schedule, self.steps, self.start)
+
+class ArraySchedule(Schedule):
+  """Wraps an explicit per-step list/array (backward compatibility)."""
+
+  def __init__(self, values):
+    self.values = values
+
+  def value(self, t):
+    return self.values[min(t, len(self.values)-1)]
+
+  def __repr__(self):
+    # compact, but distinguishes different arrays by a digest of their
+    # contents (so schedules wrapping one compare and fingerprint correctly)
+    a = np.ascontiguousarray(self.values, dtype = float)
+    return 'ArraySchedule(len = %i, first = %r, last = %r, sha1 = %s)' % \
+           (len(a), float(a[0]), float(a[-1]), hashlib.sha1(a.tobytes()).hexdigest())
+
+def as_schedule(x):
+  """Converts scalars (or None) and per-step lists/arrays into schedules."""
+  if isinstance(x, Schedule): return x
+  if isinstance(x, (list, tuple, np.ndarray)): return ArraySchedule(x)
+  return Constant(x)
@@ -0,0 +1,114 @@
+import os
+import glob
+import json
+import shutil
+import fcntl
+import hashlib
+import numpy as np
+from util.anneal import Schedule, ArraySchedule
+
+# code whose changes invalidate cached results
+CODE_DIRECTORIES = ['envs', 'agents', 'training', 'util']
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _canonical(x):
+  """JSON-able canonical form of configs: namedtuples by field, schedules by
+  repr (per-step array schedules, like arrays, by content hash), arrays by
+  dtype/shape/content hash."""
+  if isinstance(x, ArraySchedule): return ['ArraySchedule', _canonical(np.asarray(x.values))]
+  if isinstance(x, Schedule): return repr(x)
+  if hasattr(x, '_asdict'):
+    return [type(x).__name__, {k: _canonical(v) for k, v in x._asdict().items()}]
+  if isinstance(x, dict): return {str(k): _canonical(v) for k, v in sorted(x.items())}
+  if isinstance(x, (list, tuple)): return [_canonical(v) for v in x]
+  if isinstance(x, np.ndarray):
+    return ['ndarray', str(x.dtype), list(x.shape),
+            hashlib.sha1(np.ascontiguousarray(x).tobytes()).hexdigest()]
+  if isinstance(x, np.generic): return x.item()
+  if isinstance(x, float): return repr(x)
+  return x
+
+def fingerprint(*parts):
+  """sha1 over canonicalized configs, seeds etc.; identical inputs (and code,
+  if code_version() is one of the parts) mean an identical run."""
+  s = json.dumps(_canonical(list(parts)), sort_keys = True)
+  return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+_code_version = None
+def code_version():
+  """sha1 over the sources in CODE_DIRECTORIES (computed once per process)."""
+  global _code_version
+  if _code_version is None:
+    h = hashlib.sha1()
+    for d in CODE_DIRECTORIES:
+      for path in sorted(glob.glob(os.path.join(REPO_DIRECTORY, d, '**', '*.py'), recursive = True)):
+        h.update(os.path.relpath(path, REPO_DIRECTORY).encode('utf-8'))
+        with open(path, 'rb') as f: h.update(f.read())
+    _code_version = h.hexdigest()
+  return _code_version
+
+def file_digest(paths):
+  """sha1 over the contents of files, e.g. a trained agent's checkpoint."""
+  h = hashlib.sha1()
+  for path in sorted(paths):
+    h.update(os.path.basename(path).encode('utf-8'))
+    with open(path, 'rb') as f:
+      for chunk in iter(lambda: f.read(1 << 20), b''): h.update(chunk)
+  return h.hexdigest()
+
+def link_or_copy(src, dst):
+  """Hardlinks src to dst (a file path or directory), copying if linking
+  fails (e.g. across filesystems)."""
+  if os.path.isdir(dst): dst = os.path.join(dst, os.path.basename(src))
+  if os.path.exists(dst): os.remove(dst)
+  try:
+    os.link(src, dst)
+  except OSError:
+    shutil.copy(src, dst)
+
+class ResultCache:
+  """Index of finished runs by fingerprint, stored as json in the results
+  directory (cache_index.json). Entries map a fingerprint to the run's
+  directory, its checkpoint directory and a summary (the training function's
+  return values), so a re-run of an identical config can be skipped."""
+
+  def __init__(self, results_directory):
+    self.path = results_directory+'cache_index.json'
+    self.lock_path = results_directory+'cache_index.lock'
+    if not os.path.exists(results_directory): os.makedirs(results_directory)
+
+  def _read(self):
+    if not os.path.exists(self.path): return {}
+    with open(self.path) as f: return json.load(f)
+
+  def lookup(self, key):
+    """Entry for key, or None if missing or its results have been deleted."""
+    with _Lock(self.lock_path):
+      entry = self._read().get(key)
+    if entry is None or not os.path.exists(entry['directory']+'results.pkl'): return None
+    return entry
+
+  def add(self, key, directory, checkpoint_directory, summary):
+    # locked read-modify-write, since runs finish concurrently
+    with _Lock(self.lock_path):
+      index = self._read()
+      index[key] = {'directory': directory,
+                    'checkpoint_directory': checkpoint_directory,
+                    'summary': summary}
+      with open(self.path+'.tmp', 'w') as f:
+        json.dump(index, f, indent = 1, sort_keys = True, default = float)
+      os.replace(self.path+'.tmp', self.path)
+
+class _Lock:
+  """Exclusive flock on a lock file, as a context manager."""
+
+  def __init__(self, path):
+    self.path = path
+
+  def __enter__(self):
+    self.f = open(self.path, 'a')
+    fcntl.flock(self.f, fcntl.LOCK_EX)
+
+  def __exit__(self, *args):
+    fcntl.flock(self.f, fcntl.LOCK_UN)
+    self.f.close()
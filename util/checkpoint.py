@@ -0,0 +1,118 @@
+import os
+import glob
+import pickle
+import shutil
+import numpy as np
+import tensorflow as tf
+from collections import namedtuple
+from util.cache import link_or_copy
+
+TrainState = namedtuple('TrainState', ['step_count', 'stats', 'rng_state',
+                                       'env_rng_state', 'learning_rate_scale',
+                                       'sampler_states', 'run_key', 'monitor_state'])
+# sampler_states: pre-drawn uniforms of util.sampling.Samplers, {'env': ...,
+# 'actions': ...} (None in checkpoints written before them)
+# run_key: identity of the run that wrote it (see Checkpointer), set on save
+# monitor_state: util.convergence.ConvergenceMonitor.get_state (None without
+# a monitor), set by training.loop.TrainingLoop
+TrainState.__new__.__defaults__ = (None, None, None)
+
+class Checkpointer:
+  """Periodically saves everything needed to resume a training run: TF
+  variables (including optimizer slots), step counter, episode stats (which
+  carry state_goal_counts) and numpy/env RNG state. Used both to restart
+  preempted jobs and to roll back to the last good state when NaNs appear.
+  With a run_key (e.g. a util.cache.fingerprint of configs, seed and code),
+  checkpoints are stamped with it, and restoring one stamped with another key
+  (or none) raises a ValueError rather than resuming someone else's run."""
+
+  def __init__(self, directory, every = 10000, max_to_keep = 2, var_list = None,
+               run_key = None):
+    self.directory = directory
+    self.every = every
+    self.run_key = run_key
+    self.last_step = 0
+    if not os.path.exists(directory): os.makedirs(directory)
+    # must be built after the agent(s), so optimizer slots are included
+    self.saver = tf.train.Saver(var_list = var_list, max_to_keep = max_to_keep)
+
+  def due(self, step_count):
+    return step_count - self.last_step >= self.every
+
+  def latest(self):
+    """Path prefix of the most recent complete checkpoint, or None."""
+    return latest_checkpoint(self.directory)
+
+  def save(self, train_state, sess = None):
+    sess = sess or tf.get_default_session()
+    train_state = train_state._replace(run_key = self.run_key)
+    prefix = os.path.join(self.directory, 'model')
+    # write python-side state first; tf updates its 'checkpoint' index file
+    # last, so latest() never points to a checkpoint without its state
+    state_path = '%s-%i.state.pkl' % (prefix, train_state.step_count)
+    with open(state_path+'.tmp', 'wb') as output:
+      pickle.dump(train_state, output, pickle.HIGHEST_PROTOCOL)
+    os.replace(state_path+'.tmp', state_path)
+    self.saver.save(sess, prefix, global_step = train_state.step_count)
+    self.last_step = train_state.step_count
+    self._remove_stale_states()
+
+  def restore(self, env = None, sess = None):
+    """Restores variables and RNG state (incl. env's sampler) from the latest
+    checkpoint and returns its TrainState, or None if there is no checkpoint
+    yet. Trainers restore their own samplers from sampler_states['actions']."""
+    path = self.latest()
+    if path is None: return None
+    # checked before touching variables, which may not even match the graph
+    train_state = load_train_state(self.directory)
+    if self.run_key is not None and train_state.run_key != self.run_key:
+      raise ValueError('checkpoint %s is from run %s, not %s; remove it or use '
+                       'another exp_name_prefix' % (path, train_state.run_key, self.run_key))
+    sess = sess or tf.get_default_session()
+    self.saver.restore(sess, path)
+    np.random.set_state(train_state.rng_state)
+    if env is not None and train_state.env_rng_state is not None:
+      env.np_random.set_state(train_state.env_rng_state)
+      if train_state.sampler_states is not None:
+        env.sampler.set_state(train_state.sampler_states['env'])
+    self.last_step = train_state.step_count
+    return train_state
+
+  def clear(self):
+    """Removes all checkpoints, e.g. before a from-scratch restart."""
+    shutil.rmtree(self.directory, ignore_errors = True)
+    os.makedirs(self.directory)
+    self.last_step = 0
+
+  def _remove_stale_states(self):
+    ckpt = tf.train.get_checkpoint_state(self.directory)
+    if ckpt is None: return
+    kept = set(os.path.basename(p) for p in ckpt.all_model_checkpoint_paths)
+    for f in glob.glob(os.path.join(self.directory, 'model-*.state.pkl')):
+      if os.path.basename(f)[:-len('.state.pkl')] not in kept: os.remove(f)
+
+def latest_checkpoint(directory):
+  """Path prefix of the most recent complete checkpoint in directory, or None."""
+  if not os.path.exists(directory): return None
+  return tf.train.latest_checkpoint(directory)
+
+def load_train_state(directory):
+  """Loads the python-side TrainState of the latest checkpoint without touching
+  the TF graph (e.g. to score a partially trained run). None if no checkpoint."""
+  path = latest_checkpoint(directory)
+  if path is None: return None
+  with open(path+'.state.pkl', 'rb') as f:
+    return pickle.load(f)
+
+def link_checkpoint(src_directory, dst_directory):
+  """Makes the latest checkpoint in src_directory the latest in dst_directory
+  (hardlinking its files), e.g. so a cached run can be resumed under a new
+  name. Returns the new path prefix, or None if src has no checkpoint."""
+  path = latest_checkpoint(src_directory)
+  if path is None: return None
+  if not os.path.exists(dst_directory): os.makedirs(dst_directory)
+  for f in glob.glob(path+'.*'): link_or_copy(f, dst_directory)
+  # tf's index file may hold absolute paths, so it is rewritten rather than linked
+  new_path = os.path.join(dst_directory, os.path.basename(path))
+  tf.train.update_checkpoint_state(dst_directory, new_path)
+  return new_path
@@ -0,0 +1,78 @@
+import numpy as np
+
+class GrowableArray:
+  """Typed 1-d numpy column with amortized O(1) append (capacity doubles when
+  full). Behaves enough like a list for the trainers (append, len, [-1],
+  iteration) and like an array for numpy/pandas/matplotlib, via zero-copy
+  view() / np.asarray. Pickles only the filled part."""
+
+  def __init__(self, dtype = np.float64, capacity = 1024, values = None):
+    self.dtype = np.dtype(dtype)
+    if values is not None:
+      values = np.asarray(values, dtype = self.dtype)
+      capacity = max(capacity, len(values))
+    self._data = np.empty(capacity, dtype = self.dtype)
+    self._size = 0
+    if values is not None: self.extend(values)
+
+  def append(self, x):
+    if self._size == len(self._data): self._grow(self._size + 1)
+    self._data[self._size] = x
+    self._size += 1
+
+  def extend(self, xs):
+    xs = np.asarray(xs, dtype = self.dtype)
+    if self._size + len(xs) > len(self._data): self._grow(self._size + len(xs))
+    self._data[self._size:self._size+len(xs)] = xs
+    self._size += len(xs)
+
+  def _grow(self, min_capacity):
+    capacity = max(2*len(self._data), min_capacity, 16)
+    data = np.empty(capacity, dtype = self.dtype)
+    data[:self._size] = self._data[:self._size]
+    self._data = data
+
+  def view(self):
+    """Zero-copy array of the filled part; valid until the next append that
+    triggers a reallocation."""
+    return self._data[:self._size]
+
+  def __array__(self, dtype = None, copy = None):
+    if dtype is None: return self.view()
+    return self.view().astype(dtype)
+
+  def __len__(self):
+    return self._size
+
+  def __getitem__(self, i):
+    return self.view()[i]
+
+  def __iter__(self):
+    return iter(self.view())
+
+  def tolist(self):
+    return self.view().tolist()
+
+  def __getstate__(self):
+    return {'dtype': self.dtype.str, 'values': self.view().copy()}
+
+  def __setstate__(self, state):
+    self.dtype = np.dtype(state['dtype'])
+    self._data = state['values']
+    self._size = len(self._data)
+
+  def __repr__(self):
+    return 'GrowableArray(%r, dtype = %s)' % (self.view(), self.dtype)
+
+def column(values = None, dtype = np.float64):
+  """GrowableArray of values (e.g. a list from an old checkpoint); None stays
+  None and GrowableArrays are passed through."""
+  if values is None or isinstance(values, GrowableArray): return values
+  return GrowableArray(dtype, values = values)
+
+def as_views(stats):
+  """Copy of a stats namedtuple with GrowableArray fields replaced by their
+  zero-copy array views (other fields, e.g. lists or arrays, unchanged)."""
+  if not hasattr(stats, '_replace'): return stats # e.g. lazily loaded results
+  return stats._replace(**{k: v.view() for k, v in stats._asdict().items()
+                           if isinstance(v, GrowableArray)})
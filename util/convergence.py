@@ -0,0 +1,115 @@
+import copy
+import numpy as np
+from util.stats import SlidingRate, SlidingMean
+
+# default absolute change tolerances between checks, per metric
+DEFAULT_TOLERANCES = {'reward_rate': .005, # reward per step
+                      'episode_length': 1., # steps
+                      'action_kl': .01, # bits per step
+                      'lso': .01, # bits per step
+                      'policy_change': .01} # mean abs change in action probs
+
+# ConvergenceMonitor attributes that change while training (see get_state)
+_STATE = ['reward_rate', 'episode_length', 'action_kl', 'lso', 'last_check_step',
+          'last_metrics', 'last_policy', 'plateau_start', 'converged', 'stop_step',
+          'history']
+
+class ConvergenceMonitor:
+  """Online plateau detection for training runs, fed once per episode.
+
+  Every check_every steps, sliding-window (last window steps) estimates of
+  reward rate, episode length, action KL and LSO per step are compared with
+  those at the previous check, along with the mean change in the policy table
+  (if provided). Once all changes are within tolerances for patience steps,
+  converged is set and stop_step records the step count at which it happened.
+
+  Args:
+    window: number of steps the sliding-window estimates cover
+    patience: number of steps metrics must stay within tolerance
+    check_every: number of steps between checks
+    tolerances: dict overriding DEFAULT_TOLERANCES (metric -> abs change)
+    min_steps: never declare convergence before this many steps
+  """
+
+  def __init__(self, window = 10000, patience = 50000, check_every = 5000,
+               tolerances = None, min_steps = 0):
+    self.window = window
+    self.patience = patience
+    self.check_every = check_every
+    self.tolerances = dict(DEFAULT_TOLERANCES)
+    if tolerances is not None: self.tolerances.update(tolerances)
+    self.min_steps = min_steps
+    self.reset()
+
+  def reset(self):
+    """Forgets all episodes and checks, as at step 0."""
+    self.reward_rate = SlidingRate(self.window)
+    self.episode_length = SlidingMean(self.window)
+    self.action_kl = SlidingMean(self.window)
+    self.lso = SlidingMean(self.window)
+    self.last_check_step = 0
+    self.last_metrics = None
+    self.last_policy = None
+    self.plateau_start = None
+    self.converged = False
+    self.stop_step = None
+    self.history = [] # (step, metrics) at each check
+
+  def get_state(self):
+    """Everything the monitor has seen (sliding windows, checks, plateau),
+    for util.checkpoint.TrainState.monitor_state."""
+    return copy.deepcopy({k: getattr(self, k) for k in _STATE})
+
+  def set_state(self, state):
+    """Restores get_state's state, e.g. when training resumes or rolls back
+    to a checkpoint, so discarded episodes are forgotten."""
+    for k in _STATE: setattr(self, k, copy.deepcopy(state[k]))
+
+  def update(self, step_count, episode_length, episode_reward,
+             action_kl = None, lso = None, policy = None):
+    """Feeds one episode's totals. policy is an optional callable returning
+    the current policy table; only called at checks. Returns converged."""
+    self.reward_rate.push(episode_length, episode_reward)
+    self.episode_length.push(episode_length, episode_length)
+    if action_kl is not None: self.action_kl.push(episode_length, action_kl/episode_length)
+    if lso is not None: self.lso.push(episode_length, lso/episode_length)
+    if step_count - self.last_check_step >= self.check_every:
+      self.last_check_step = step_count
+      self._check(step_count, policy)
+    return self.converged
+
+  def metrics(self):
+    m = {'reward_rate': self.reward_rate.rate(),
+         'episode_length': self.episode_length.mean(),
+         'action_kl': self.action_kl.mean(),
+         'lso': self.lso.mean()}
+    return {k: v for k, v in m.items() if v is not None}
+
+  def _check(self, step_count, policy):
+    metrics = self.metrics()
+    if policy is not None:
+      action_probs = np.asarray(policy())
+      if self.last_policy is not None:
+        metrics['policy_change'] = float(np.mean(np.abs(action_probs - self.last_policy)))
+      self.last_policy = action_probs
+    self.history.append((step_count, metrics))
+
+    # compare to previous check; a metric without a previous value is not flat
+    flat = self.last_metrics is not None
+    if policy is not None and 'policy_change' not in metrics: flat = False
+    for k, v in metrics.items():
+      if k == 'policy_change': change = v
+      elif flat and k in self.last_metrics: change = abs(v - self.last_metrics[k])
+      else:
+        flat = False
+        break
+      if change > self.tolerances[k]: flat = False
+    self.last_metrics = metrics
+
+    if not flat:
+      self.plateau_start = None
+      return
+    if self.plateau_start is None: self.plateau_start = self.history[-2][0]
+    if step_count - self.plateau_start >= self.patience and step_count >= self.min_steps:
+      self.converged = True
+      self.stop_step = step_count
@@ -0,0 +1,273 @@
+import os
+import re
+import sys
+import json
+import sqlite3
+import importlib.util
+import numpy as np
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIRECTORY not in sys.path: sys.path.append(REPO_DIRECTORY)
+from util.anneal import Schedule
+from util.stats import rate_last_N, mean_last_N
+
+INDEX_FILE = 'experiment_index.db'
+N = 10000 # steps the summary metrics average over, as in plot_episode_stats
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+  directory TEXT PRIMARY KEY, -- name within the results directory
+  kind TEXT, -- alice or bob
+  experiment_name TEXT,
+  prefix TEXT, -- e.g. job17338261_task60_
+  timestamp TEXT,
+  results_mtime REAL,
+  success INTEGER,
+  alice_directory TEXT, -- lineage: the alice a bob run was trained with
+  error TEXT, -- why configs or results could not be read, if so
+  episodes INTEGER,
+  total_steps INTEGER,
+  stop_step INTEGER,
+  steps_per_reward REAL,
+  reward_rate REAL,
+  steps_per_reward_alice REAL,
+  action_info REAL,
+  state_info REAL);
+CREATE TABLE IF NOT EXISTS params (
+  directory TEXT,
+  source TEXT, -- alice, bob or env (config file)
+  name TEXT,
+  value TEXT, -- json
+  num REAL, -- value, if a number
+  PRIMARY KEY (directory, source, name));
+CREATE INDEX IF NOT EXISTS params_by_name ON params (name, num, value);
+'''
+
+RUN_NAME = re.compile(r'^(?P<prefix>.*?)(?P<timestamp>\d{4}_\d{2}_\d{2}_\d{4}(\d{2})?)_(?P<name>.+)$')
+OPERATORS = {'eq': '=', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>=', 'like': 'LIKE'}
+
+class ExperimentIndex:
+  """SQLite catalog of the runs in a results directory: config and env
+  parameters, alice lineage of bob runs, timestamps, success and summary
+  metrics. update() only indexes run directories that are new (or whose
+  results changed) since the last update.
+
+  Usage:
+    index = ExperimentIndex('results/')
+    index.update()
+    runs = index.query(kind = 'alice', state_info_reg_strength__gt = .1,
+                       **{'env.shape': [5,5]})
+  """
+
+  def __init__(self, results_directory = None):
+    if results_directory is None: results_directory = os.getcwd()+'/results/'
+    if not results_directory.endswith('/'): results_directory += '/'
+    self.results_directory = results_directory
+    self.conn = sqlite3.connect(results_directory+INDEX_FILE)
+    self.conn.row_factory = sqlite3.Row
+    self.conn.executescript(SCHEMA)
+
+  def close(self):
+    self.conn.close()
+
+  def update(self, prune = True, verbose = False):
+    """Indexes new or changed run directories (and, if prune, drops runs whose
+    directories are gone). Returns the # of runs (re)indexed."""
+    known = {r['directory']: r['results_mtime'] for r in
+             self.conn.execute('SELECT directory, results_mtime FROM runs')}
+    present = set()
+    n = 0
+    for d in sorted(os.listdir(self.results_directory)):
+      path = self.results_directory + d + '/'
+      results_path = _results_path(path)
+      if results_path is None and not _has_config(path): continue # not a run
+      present.add(d)
+      mtime = os.path.getmtime(results_path) if results_path is not None else None
+      if d in known and known[d] == mtime: continue
+      if verbose: print('Indexing %s' % d)
+      self._index_run(d, path, mtime)
+      n += 1
+    if prune:
+      for d in set(known) - present: self._remove(d)
+    self.conn.commit()
+    return n
+
+  def _remove(self, d):
+    self.conn.execute('DELETE FROM runs WHERE directory = ?', (d,))
+    self.conn.execute('DELETE FROM params WHERE directory = ?', (d,))
+
+  def _index_run(self, d, path, mtime):
+    self._remove(d)
+    m = RUN_NAME.match(d)
+    row = {'directory': d,
+           'prefix': m.group('prefix') if m else None,
+           'timestamp': m.group('timestamp') if m else None,
+           'experiment_name': m.group('name') if m else d,
+           'results_mtime': mtime,
+           'success': int(mtime is not None),
+           'kind': 'bob' if os.path.exists(path+'bob_config.py') else 'alice'}
+    errors = []
+    params = []
+    for source in ['alice', 'bob', 'env']:
+      if not os.path.exists(path+source+'_config.py'): continue
+      try:
+        params += [(source, k, v) for k, v in _config_params(path+source+'_config.py').items()]
+      except Exception as e:
+        errors.append('%s_config.py: %r' % (source, e))
+    lineage = [v for source, k, v in params if source == 'bob' and k == 'alice_experiment']
+    if lineage: row['alice_directory'] = lineage[0]
+    if mtime is not None:
+      try:
+        row.update(_summary(path))
+      except Exception as e:
+        errors.append('results: %r' % e)
+    if errors: row['error'] = '; '.join(errors)
+    self.conn.execute('INSERT INTO runs (%s) VALUES (%s)' % (', '.join(row), ', '.join('?'*len(row))),
+                      list(row.values()))
+    self.conn.executemany('INSERT OR REPLACE INTO params VALUES (?, ?, ?, ?, ?)',
+                          [(d, source, k, json.dumps(v), _number(v)) for source, k, v in params])
+
+  def query(self, kind = None, filters = None, order_by = 'timestamp', **kwargs):
+    """Runs matching all filters, as dicts of run columns. Filters map a
+    parameter name, optionally qualified by source ('env.shape') and suffixed
+    with an operator ('__gt', '__ge', '__lt', '__le', '__ne', '__like'), to a
+    value; names may also be run columns (e.g. 'state_info__gt'). They can be
+    given as filters (for qualified names) and/or keyword arguments."""
+    filters = dict(filters or {}, **kwargs)
+    run_columns = set(r[1] for r in self.conn.execute('PRAGMA table_info(runs)'))
+    clauses, args = [], []
+    if kind is not None:
+      clauses.append('kind = ?')
+      args.append(kind)
+    for key, value in filters.items():
+      name, op = key, 'eq'
+      if '__' in key and key.rsplit('__', 1)[1] in OPERATORS: name, op = key.rsplit('__', 1)
+      if name in run_columns:
+        clauses.append('%s %s ?' % (name, OPERATORS[op]))
+        args.append(value)
+        continue
+      source = None
+      if '.' in name: source, name = name.split('.', 1)
+      if op != 'like' and _number(value) is not None: column, value = 'num', _number(value)
+      elif op == 'like': column = 'value'
+      else: column, value = 'value', json.dumps(_plain(value))
+      clause = 'directory IN (SELECT directory FROM params WHERE name = ? AND %s %s ?' % (column, OPERATORS[op])
+      clause_args = [name, value]
+      if source is not None:
+        clause += ' AND source = ?'
+        clause_args.append(source)
+      clauses.append(clause + ')')
+      args += clause_args
+    sql = 'SELECT * FROM runs'
+    if clauses: sql += ' WHERE ' + ' AND '.join(clauses)
+    if order_by is not None: sql += ' ORDER BY %s' % order_by
+    return [dict(r) for r in self.conn.execute(sql, args)]
+
+  def params(self, directory):
+    """{source.name: value} of one run."""
+    rows = self.conn.execute('SELECT source, name, value FROM params WHERE directory = ?', (directory,))
+    return {'%s.%s' % (r['source'], r['name']): json.loads(r['value']) for r in rows}
+
+  def children(self, alice_directory):
+    """Bob runs trained with the given alice."""
+    return self.query(kind = 'bob', alice_directory = alice_directory)
+
+def _results_path(path):
+  for f in ['results_columns/manifest.json', 'results.pkl']:
+    if os.path.exists(path+f): return path+f
+  return None
+
+def _has_config(path):
+  return any(os.path.exists(path+c+'_config.py') for c in ['alice', 'bob'])
+
+def _config_params(path):
+  """Flattened parameters of a copied config file: the fields of the
+  namedtuples get_config returns, plus module-level scalars."""
+  spec = importlib.util.spec_from_file_location('_indexed_config', path)
+  config = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(config)
+  params = {}
+  for k, v in vars(config).items():
+    if not k.startswith('_') and isinstance(v, (bool, int, float, str)): params[k] = v
+  for x in config.get_config():
+    if hasattr(x, '_fields'):
+      for k, v in x._asdict().items(): params[k] = _plain(v)
+  return params
+
+def _plain(x):
+  """json-able version of a parameter value."""
+  if isinstance(x, Schedule): return repr(x)
+  if isinstance(x, np.ndarray): return x.tolist()
+  if isinstance(x, np.generic): return x.item()
+  if hasattr(x, '_asdict'): return {k: _plain(v) for k, v in x._asdict().items()}
+  if isinstance(x, (list, tuple)): return [_plain(v) for v in x]
+  if isinstance(x, dict): return {str(k): _plain(v) for k, v in x.items()}
+  if x is None or isinstance(x, (bool, int, float, str)): return x
+  return repr(x)
+
+def _number(x):
+  if isinstance(x, bool) or not isinstance(x, (int, float, np.number)): return None
+  return float(x)
+
+def _summary(path):
+  """Summary metrics over the last N steps, from the stored results."""
+  from util.results_store import load_results
+  result = load_results(path)
+  if hasattr(result, 'bob'):
+    stats, alice = result.bob, result.alice
+  else:
+    stats, alice = result, None
+  lengths = np.asarray(stats.episode_lengths)
+  cumulative_steps = np.cumsum(lengths)
+  summary = {'episodes': len(lengths),
+             'total_steps': int(cumulative_steps[-1]) if len(lengths) else 0,
+             'stop_step': getattr(result, 'stop_step', None),
+             'reward_rate': float(rate_last_N(cumulative_steps,
+                                              np.cumsum(stats.episode_rewards), N = N))}
+  total_steps = getattr(stats, 'total_steps', None)
+  if total_steps is not None and len(total_steps):
+    summary['steps_per_reward'] = float(mean_last_N(np.asarray(total_steps),
+                                                    np.asarray(stats.steps_per_reward), N = N))
+  if alice is None: alice = stats
+  else: summary['steps_per_reward_alice'] = float(np.sum(alice.episode_lengths)/np.sum(alice.episode_rewards))
+  alice_lengths = np.asarray(alice.episode_lengths)
+  alice_steps = np.cumsum(alice_lengths)
+  for field, column in [('episode_action_kl', 'action_info'), ('episode_lso', 'state_info')]:
+    values = getattr(alice, field, None)
+    if values is not None and len(values):
+      # per-step information over the last N steps (unsmoothed)
+      summary[column] = float(mean_last_N(alice_steps, np.asarray(values)/alice_lengths, N = N))
+  return summary
+
+def _parse_value(s):
+  try:
+    return json.loads(s)
+  except ValueError:
+    return s
+
+if __name__ == "__main__":
+  # usage: python -m util.experiment_index [RESULTS_DIRECTORY] update
+  #        python -m util.experiment_index [RESULTS_DIRECTORY] query [kind=alice|bob] [name[__op]=value ...]
+  #        python -m util.experiment_index [RESULTS_DIRECTORY] show RUN_DIRECTORY
+  args = sys.argv[1:]
+  results_directory = None
+  if args and args[0] not in ('update', 'query', 'show'): results_directory = args.pop(0)
+  index = ExperimentIndex(results_directory)
+  command = args[0] if args else 'update'
+  if command == 'update':
+    print('Indexed %i new or changed runs.' % index.update(verbose = True))
+  elif command == 'query':
+    index.update()
+    filters = dict(a.split('=', 1) for a in args[1:])
+    kind = filters.pop('kind', None)
+    for run in index.query(kind = kind, filters = {k: _parse_value(v) for k, v in filters.items()}):
+      print('%-80s %-5s steps/reward %s, state info %s' %
+            (run['directory'], run['kind'], run['steps_per_reward'], run['state_info']))
+  elif command == 'show':
+    index.update()
+    run = index.query(directory = args[1])
+    if not run: raise ValueError('no run %s in index' % args[1])
+    for k, v in sorted(run[0].items()): print('%s: %s' % (k, v))
+    for k, v in sorted(index.params(args[1]).items()): print('%s = %s' % (k, json.dumps(v)))
+  else:
+    raise ValueError('unknown command %s' % command)
+  index.close()
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import time
+import resource
+import tracemalloc
+import numpy as np
+try:
+  import psutil
+except ImportError:
+  psutil = None
+
+def rss_bytes():
+  """Current resident set size of this process, in bytes."""
+  if psutil is not None: return psutil.Process().memory_info().rss
+  try:
+    with open('/proc/self/statm') as f:
+      return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (OSError, ValueError):
+    return peak_rss_bytes() # best we can do without /proc
+
+def peak_rss_bytes():
+  """Peak resident set size of this process, in bytes."""
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak if sys.platform == 'darwin' else peak * 1024 # kB on linux
+
+def sizeof(obj, max_items = 1000, _seen = None):
+  """Approximate deep size of obj in bytes, counting shared objects once.
+  Arrays count their buffers; containers longer than max_items are sized by
+  extrapolating from an even sample of their items."""
+  if _seen is None: _seen = set()
+  if obj is None or id(obj) in _seen: return 0
+  _seen.add(id(obj))
+  if isinstance(obj, np.ndarray):
+    return sys.getsizeof(obj) + (obj.nbytes if obj.base is None else 0)
+  size = sys.getsizeof(obj)
+  if isinstance(obj, dict): items = list(obj.keys()) + list(obj.values())
+  elif isinstance(obj, (list, tuple, set, frozenset)): items = obj
+  elif hasattr(obj, '__dict__'): items = [obj.__dict__]
+  else: return size
+  n = len(items)
+  if n > max_items:
+    items = list(items)
+    sample = [items[int(k)] for k in np.linspace(0, n-1, max_items)]
+    return size + int(sum(sizeof(x, max_items, _seen) for x in sample) * n / max_items)
+  return size + sum(sizeof(x, max_items, _seen) for x in items)
+
+class MemoryMonitor:
+  """Samples RSS (and optionally tracemalloc top allocations) every `every`
+  steps, along with the sizes of named training structures (episode stats,
+  counts, buffers), streaming one json record per line to path. Records are
+  appended, so a resumed run continues its file.
+
+  Args:
+    path: jsonl file to append records to (None keeps them in memory only)
+    every: number of steps between samples
+    tracemalloc_top: if > 0, traces python allocations and records the top
+      allocation sites by size and by growth since the last sample
+  """
+
+  def __init__(self, path = None, every = 10000, tracemalloc_top = 0):
+    self.path = path
+    self.every = every
+    self.tracemalloc_top = tracemalloc_top
+    self.last_step = None
+    self.records = []
+    self._last_snapshot = None
+    if tracemalloc_top > 0 and not tracemalloc.is_tracing(): tracemalloc.start()
+
+  def due(self, step_count):
+    return self.last_step is None or step_count - self.last_step >= self.every
+
+  def sample(self, step_count, structures = None):
+    """Records memory use; structures maps names to objects to size."""
+    self.last_step = step_count
+    record = {'step_count': step_count,
+              'time': time.time(),
+              'rss': rss_bytes(),
+              'peak_rss': peak_rss_bytes()}
+    if structures is not None:
+      record['sizes'] = {name: sizeof(obj) for name, obj in structures.items()}
+    if self.tracemalloc_top > 0:
+      snapshot = tracemalloc.take_snapshot()
+      record['traced'] = tracemalloc.get_traced_memory()[0]
+      record['top'] = [_stat(s) for s in snapshot.statistics('lineno')[:self.tracemalloc_top]]
+      if self._last_snapshot is not None:
+        growth = snapshot.compare_to(self._last_snapshot, 'lineno')[:self.tracemalloc_top]
+        record['growth'] = [dict(_stat(s), size_diff = s.size_diff) for s in growth]
+      self._last_snapshot = snapshot
+    self.records.append(record)
+    if self.path is not None:
+      with open(self.path, 'a') as f: f.write(json.dumps(record) + '\n')
+    return record
+
+  def stop(self):
+    if self.tracemalloc_top > 0 and tracemalloc.is_tracing(): tracemalloc.stop()
+    self._last_snapshot = None
+
+def _stat(stat):
+  return {'location': str(stat.traceback), 'size': stat.size, 'count': stat.count}
+
+def load_memory_records(path):
+  with open(path) as f:
+    return [json.loads(line) for line in f if line.strip()]
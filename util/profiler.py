@@ -0,0 +1,115 @@
+import json
+import time
+import numpy as np
+from collections import defaultdict
+
+class Profiler:
+  """Per-phase timers and counters for the training loops.
+
+  Phases are timed with tic/toc pairs around the hot-path calls (env reset,
+  predict, get_kl, updates, ...), which also count tf session calls. Every
+  report_every episodes, the aggregates since the last report are appended to
+  records (and printed, if verbose); save writes all records as json.
+
+  Usage:
+    tic = profiler.tic()
+    action_probs, value = agent.predict(state, goal)
+    profiler.toc('predict', tic, session_calls = 1)
+  """
+
+  def __init__(self, report_every = 1000, verbose = True):
+    self.report_every = report_every
+    self.verbose = verbose
+    self.records = []
+    self.start_time = time.perf_counter()
+    self._reset_window()
+
+  def _reset_window(self):
+    self.seconds = defaultdict(float)
+    self.calls = defaultdict(int)
+    self.counters = defaultdict(float)
+    self.episodes = 0
+    self.steps = 0
+    self.window_start = time.perf_counter()
+
+  def tic(self):
+    return time.perf_counter()
+
+  def toc(self, phase, tic, session_calls = 0):
+    self.seconds[phase] += time.perf_counter() - tic
+    self.calls[phase] += 1
+    if session_calls: self.counters['session_calls'] += session_calls
+
+  def count(self, name, n = 1):
+    self.counters[name] += n
+
+  def count_feed(self, feed_dict):
+    """Counts bytes fed to tf in an update (feed_dict as last used by the agent)."""
+    if feed_dict is None: return
+    self.counters['bytes_fed'] += sum(np.asarray(v).nbytes for v in feed_dict.values()
+                                      if v is not None)
+    self.counters['feeds'] += 1
+
+  def end_episode(self, step_count, episode_length):
+    self.episodes += 1
+    self.steps += episode_length
+    if self.episodes >= self.report_every: self.report(step_count)
+
+  def report(self, step_count):
+    """Appends (and returns) the aggregates since the last report."""
+    if self.episodes == 0: return None
+    wall = time.perf_counter() - self.window_start
+    phases = {phase: {'seconds': self.seconds[phase],
+                      'calls': self.calls[phase],
+                      'us_per_call': 1e6 * self.seconds[phase] / self.calls[phase],
+                      'fraction': self.seconds[phase] / wall}
+              for phase in self.seconds}
+    steps = max(self.steps, 1)
+    record = {'step_count': step_count,
+              'episodes': self.episodes,
+              'steps': self.steps,
+              'wall_seconds': wall,
+              'steps_per_second': self.steps / wall,
+              'session_calls_per_step': self.counters['session_calls'] / steps,
+              'bytes_fed_per_update': self.counters['bytes_fed'] / max(self.counters['feeds'], 1),
+              'counters': dict(self.counters),
+              'phases': phases}
+    self.records.append(record)
+    if self.verbose:
+      top = sorted(phases, key = lambda p: -phases[p]['seconds'])[:4]
+      print('\nProfile @ %i steps: %.0f steps/s, %.2f session calls/step, %s' %
+            (step_count, record['steps_per_second'], record['session_calls_per_step'],
+             ', '.join('%s %.0f%%' % (p, 100*phases[p]['fraction']) for p in top)))
+    self._reset_window()
+    return record
+
+  def summary(self):
+    """Totals over all reported windows."""
+    seconds = defaultdict(float)
+    calls = defaultdict(int)
+    for record in self.records:
+      for phase, p in record['phases'].items():
+        seconds[phase] += p['seconds']
+        calls[phase] += p['calls']
+    return {'wall_seconds': time.perf_counter() - self.start_time,
+            'phase_seconds': dict(seconds),
+            'phase_calls': dict(calls)}
+
+  def save(self, path):
+    with open(path, 'w') as f:
+      json.dump({'summary': self.summary(), 'records': self.records}, f, indent = 1)
+
+class NullProfiler:
+  """Profiler stand-in that does nothing, so profiling off costs ~a no-op call."""
+
+  records = []
+
+  def tic(self): return 0
+  def toc(self, phase, tic, session_calls = 0): pass
+  def count(self, name, n = 1): pass
+  def count_feed(self, feed_dict): pass
+  def end_episode(self, step_count, episode_length): pass
+  def report(self, step_count): return None
+  def save(self, path): pass
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import pickle
+import shutil
+import numpy as np
+from collections import namedtuple
+
+# results are stored in <run directory>/STORE_DIRECTORY/: one file per series
+# plus MANIFEST, which records the (nested) namedtuple layout and scalars
+STORE_DIRECTORY = 'results_columns/'
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+# field layouts of namedtuples found in results.pkl files, keyed by class name
+# and # of fields, for pickles whose defining module (often __main__) is gone
+KNOWN_FIELDS = {
+  'Result': [['episode_lengths', 'episode_rewards', 'values', 'action_kls',
+              'log_state_odds', 'action_probs', 'state_goal_counts'], # test_artisanal_policy
+             ['episode_lengths', 'episode_rewards', 'values', 'action_kls',
+              'log_state_odds', 'action_probs', 'state_goal_counts',
+              'steps_per_reward', 'total_steps'], # train_alice
+             ['episode_lengths', 'episode_rewards', 'values', 'action_kls',
+              'log_state_odds', 'action_probs', 'state_goal_counts',
+              'steps_per_reward', 'total_steps', 'stop_step'], # train_alice
+             ['alice', 'bob'], # train_bob
+             ['alice', 'bob', 'stop_step']], # train_bob
+  'Stats': [['episode_lengths', 'episode_rewards', 'episode_action_kl', 'episode_lso',
+             'state_goal_counts', 'steps_per_reward', 'total_steps'], # train_bob
+            ['episode_lengths', 'episode_rewards', 'episode_lso', 'episode_action_kl',
+             'state_goal_counts']]} # trainers' EpisodeStats
+
+def save_results(result, directory, compress = False):
+  """Writes a (nested) namedtuple of results to directory+STORE_DIRECTORY: each
+  array-like field as its own .npy (or compressed .npz), everything else in
+  the json manifest. Written to a temporary directory and renamed, so readers
+  never see a partial store."""
+  store = directory + STORE_DIRECTORY
+  tmp = store[:-1] + '.tmp/'
+  if not os.path.exists(tmp): os.makedirs(tmp)
+  layout = _save(result, '', tmp, compress)
+  with open(tmp+MANIFEST, 'w') as f:
+    json.dump({'format': FORMAT_VERSION, 'layout': layout}, f, indent = 1)
+  if os.path.exists(store): shutil.rmtree(store)
+  os.rename(tmp, store)
+  return store
+
+def _save(x, name, store, compress):
+  if hasattr(x, '_fields'):
+    return {'namedtuple': type(x).__name__,
+            'fields': [[k, _save(v, name+k+'.', store, compress)] for k, v in zip(x._fields, x)]}
+  if x is None or isinstance(x, (bool, int, float, str)) or isinstance(x, np.generic):
+    return {'value': x.item() if isinstance(x, np.generic) else x}
+  a = np.asarray(x)
+  if a.dtype == object: return {'value': _json_safe(x)} # e.g. ragged lists
+  filename = name[:-1] + ('.npz' if compress else '.npy')
+  if compress: np.savez_compressed(store+filename, data = a)
+  else: np.save(store+filename, a)
+  return {'file': filename, 'dtype': a.dtype.str, 'shape': list(a.shape)}
+
+def _json_safe(x):
+  return json.loads(json.dumps(x, default = lambda v: np.asarray(v).tolist()))
+
+class LazyRecord:
+  """Read-only stand-in for a stored namedtuple: fields load on first access,
+  .npy files memory-mapped, so reading one series touches only its file.
+  Subclassed per stored type name, so type(r).__name__ matches the original
+  (plotting code dispatches on it)."""
+
+  def __init__(self, store, fields):
+    self._store = store
+    self._layout = dict(fields)
+    self._fields = tuple(k for k, _ in fields)
+    self._cache = {}
+
+  def __getattr__(self, k):
+    if k.startswith('_') or k not in self._layout: raise AttributeError(k)
+    if k not in self._cache: self._cache[k] = _load(self._layout[k], self._store)
+    return self._cache[k]
+
+  def __getitem__(self, i):
+    return getattr(self, self._fields[i])
+
+  def __len__(self):
+    return len(self._fields)
+
+  def __iter__(self):
+    return (getattr(self, k) for k in self._fields)
+
+  def _asdict(self):
+    return {k: getattr(self, k) for k in self._fields}
+
+  def __repr__(self):
+    return '%s(lazy, %s)' % (type(self).__name__, ', '.join(self._fields))
+
+_record_types = {}
+def _record_type(name):
+  if name not in _record_types: _record_types[name] = type(name, (LazyRecord,), {})
+  return _record_types[name]
+
+def _load(layout, store):
+  if 'value' in layout: return layout['value']
+  if 'namedtuple' in layout:
+    return _record_type(layout['namedtuple'])(store, layout['fields'])
+  if layout['file'].endswith('.npz'):
+    with np.load(store+layout['file']) as f: return f['data']
+  return np.load(store+layout['file'], mmap_mode = 'r')
+
+def has_store(directory):
+  return os.path.exists(directory + STORE_DIRECTORY + MANIFEST)
+
+def load_results(directory):
+  """Results of the run in directory: lazily from the columnar store if there
+  is one, else by (tolerantly) unpickling results.pkl."""
+  if not directory.endswith('/'): directory += '/'
+  if has_store(directory):
+    store = directory + STORE_DIRECTORY
+    with open(store+MANIFEST) as f:
+      manifest = json.load(f)
+    if manifest['format'] > FORMAT_VERSION:
+      raise ValueError('results store format %i is newer than supported (%i)' %
+                       (manifest['format'], FORMAT_VERSION))
+    return _load(manifest['layout'], store)
+  return load_pickle(directory+'results.pkl')
+
+class TolerantUnpickler(pickle.Unpickler):
+  """Unpickles results.pkl files whose namedtuple classes can't be imported
+  (e.g. defined in __main__ of the training script), rebuilding them as
+  namedtuples with the field names in KNOWN_FIELDS."""
+
+  def find_class(self, module, name):
+    try:
+      return super(TolerantUnpickler, self).find_class(module, name)
+    except (ImportError, AttributeError):
+      if name in KNOWN_FIELDS: return _standin(name)
+      raise
+
+_standins = {}
+def _standin(name):
+  if name not in _standins:
+    class Standin:
+      def __new__(cls, *args):
+        fields = [f for f in KNOWN_FIELDS[name] if len(f) == len(args)]
+        if fields: fields = tuple(fields[0])
+        else: fields = tuple('field%i' % i for i in range(len(args)))
+        if fields not in _standin_types: _standin_types[fields] = namedtuple(name, fields)
+        return _standin_types[fields](*args)
+    Standin.__name__ = name
+    _standin_types = {}
+    _standins[name] = Standin
+  return _standins[name]
+
+def load_pickle(path):
+  with open(path, 'rb') as f:
+    return TolerantUnpickler(f).load()
+
+def convert_results(directory, compress = False, remove_pickle = False):
+  """Converts a run directory's results.pkl to the columnar store."""
+  if not directory.endswith('/'): directory += '/'
+  store = save_results(load_pickle(directory+'results.pkl'), directory, compress = compress)
+  if remove_pickle: os.remove(directory+'results.pkl')
+  return store
+
+if __name__ == "__main__":
+  # usage: python -m util.results_store [--compress] RUN_DIRECTORY [RUN_DIRECTORY ...]
+  compress = '--compress' in sys.argv[1:]
+  for d in sys.argv[1:]:
+    if d == '--compress': continue
+    print('Converted %s' % convert_results(d, compress = compress))
@@ -0,0 +1,115 @@
+import numpy as np
+
+# uniforms drawn ahead per refill
+BLOCK_SIZE = 4096
+
+class Sampler:
+  """Categorical sampling from blocks of uniforms drawn ahead from
+  random_state (np.random by default), by inverse CDF. A drop-in for
+  np.random.choice(np.arange(len(p)), p = p) in per-step loops, which
+  allocates, validates p and draws a uniform on every call. Since uniforms
+  are drawn ahead, get_state/set_state (the unused part of the block) go into
+  checkpoints alongside random_state's own state."""
+
+  def __init__(self, random_state = None, block_size = BLOCK_SIZE):
+    self.random_state = np.random if random_state is None else random_state
+    self.block_size = block_size
+    self._block = [] # python floats: cheaper to pull one at a time than numpy scalars
+    self._i = 0
+
+  def _refill(self, n = 0):
+    self._block = self.random_state.random_sample(max(self.block_size, n)).tolist()
+    self._i = 0
+
+  def uniform(self):
+    if self._i == len(self._block): self._refill()
+    u = self._block[self._i]
+    self._i += 1
+    return u
+
+  def uniforms(self, n):
+    """n uniforms as an array, continuing the same stream as uniform()."""
+    if len(self._block) - self._i < n:
+      rest = self._block[self._i:]
+      self._refill(n - len(rest))
+      self._block = rest + self._block
+    u = np.array(self._block[self._i:self._i+n])
+    self._i += n
+    return u
+
+  def index(self, n):
+    """Uniform integer in [0, n)."""
+    return min(int(self.uniform() * n), n-1)
+
+  def choice(self, p):
+    """One sample from probabilities p (need not be exactly normalized, e.g.
+    float32 softmax outputs)."""
+    p = p.tolist() if isinstance(p, np.ndarray) else p
+    u = self.uniform() * sum(p)
+    cumulative = 0.
+    for i, q in enumerate(p):
+      cumulative += q
+      if u < cumulative: return i
+    return len(p) - 1
+
+  def choices(self, probs):
+    """One sample per row of probs (batch X outcomes), vectorized."""
+    probs = np.asarray(probs)
+    return inverse_cdf(np.cumsum(probs, axis = 1), self.uniforms(len(probs)))
+
+  def get_state(self):
+    return list(self._block[self._i:])
+
+  def set_state(self, state):
+    self._block = list(state) if state is not None else []
+    self._i = 0
+
+def sampler_states(env, sampler = None):
+  """Unused pre-drawn uniforms of env's sampler and a trainer's (for actions),
+  for util.checkpoint.TrainState.sampler_states."""
+  return {'env': env.sampler.get_state(),
+          'actions': sampler.get_state() if sampler is not None else None}
+
+def inverse_cdf(cdf, u):
+  """Samples from rows of (possibly unnormalized) cumulative probabilities
+  cdf (batch X outcomes), one uniform u per row."""
+  u = np.asarray(u) * cdf[:, -1]
+  return np.minimum(np.sum(cdf <= u[:, None], axis = 1), cdf.shape[1] - 1)
+
+class AliasTable:
+  """Walker/Vose alias tables for the rows of a fixed probability matrix
+  (rows X outcomes, e.g. (state, action) X transitions): one uniform and
+  O(1) work per sample, scalar or vectorized."""
+
+  def __init__(self, probs):
+    probs = np.asarray(probs, dtype = float)
+    n_rows, k = probs.shape
+    self.k = k
+    self.accept = np.ones((n_rows, k))
+    self.alias = np.tile(np.arange(k), (n_rows, 1))
+    for row in range(n_rows):
+      scaled = (k * probs[row] / probs[row].sum()).tolist()
+      small = [i for i in range(k) if scaled[i] < 1]
+      large = [i for i in range(k) if scaled[i] >= 1]
+      while small and large:
+        i, j = small.pop(), large.pop()
+        self.accept[row, i] = scaled[i]
+        self.alias[row, i] = j
+        scaled[j] -= 1 - scaled[i]
+        if scaled[j] < 1: small.append(j)
+        else: large.append(j)
+      # leftovers are 1 up to rounding: always accepted
+    self._accept = self.accept.tolist()
+    self._alias = self.alias.tolist()
+
+  def sample(self, row, u):
+    """Outcome of row given a uniform u."""
+    x = u * self.k
+    i = min(int(x), self.k - 1)
+    return i if x - i < self._accept[row][i] else self._alias[row][i]
+
+  def sample_many(self, rows, u):
+    """Outcomes of an array of rows, one uniform each."""
+    x = np.asarray(u) * self.k
+    i = np.minimum(x.astype(np.int64), self.k - 1)
+    return np.where(x - i < self.accept[rows, i], i, self.alias[rows, i])
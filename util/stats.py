@@ -1,12 +1,20 @@
+import collections
 import numpy as np
+from util.columns import GrowableArray
+
+def _start_of_last_N(x, N):
+  """Index of the first x > x[-1]-N (0 if N is None or there is none), i.e.
+  np.argmax(x > x[-1]-N) in O(log n) for monotonically increasing x."""
+  if N is None: return 0
+  index = np.searchsorted(x, x[-1]-N, side = 'right')
+  return index if index < len(x) else 0
 
 def rate_last_N(x, y, N = None):
   """Calculates the rate of increase in y per increase in x over the final
   stretch covering an increase in N of x. Assumes x monotonically increasing.
   if N is None, calculates rate over the entirety of x."""
   
-  if N is None: index = 0
-  else: index = np.argmax(x>(x[-1]-N))
+  index = _start_of_last_N(x, N)
   delta_x = x[-1]-x[index]
   delta_y = y[-1]-y[index]
   
@@ -16,8 +24,7 @@ def mean_last_N(x, y, N = None):
   """Calculates the mean of y for the last N steps/time measured by x. Assumes
   x monotonically increasing. If N is None, calculates mean of all of y."""
   
-  if N is None: index = 0
-  else: index = np.argmax(x>(x[-1]-N))
+  index = _start_of_last_N(x, N)
   
   return np.mean(y[index:])
 
@@ -28,19 +35,110 @@ def first_time_to(x, y):
   cum_y = np.cumsum(y)
   cum_x = np.cumsum(x)
   
-  # calculate total time passed to reach level n
-  total_time = []
-  # loop over reward levels 1,2,3,...,max(y)
-  for n in range(int(max(cum_y))):
-    index = np.argmax(cum_y>n) # find first index of y that exceeds n
-    total_time.append(cum_x[index]) # append cumulative time to reach n
-    cum_y = cum_y[index+1:] # slice off searched part of cum_y
-    cum_x = cum_x[index+1:] # slice off corresponding part of cum_x
-  
-  # calculate time passed between reaching levels n-1 and n
-  total_time = np.asarray(total_time)
-  time_between = total_time[1:]-total_time[:-1]
-  time_between = np.insert(time_between,0,total_time[0])
-    
+  # level n is reached at the first index after level n-1's where cum_y > n;
+  # the first index overall where cum_y > n is where its running max passes n
+  levels = np.arange(int(max(cum_y)))
+  index = np.searchsorted(np.maximum.accumulate(cum_y), levels, side = 'right')
+  if len(index) and (index[-1] >= len(cum_y) or np.any(np.diff(index) <= 0)):
+    # some episode passed several levels (or cum_y dipped and levels were
+    # passed again later), so levels compete for indices: resolve by a scan
+    times = RewardTimes(dtype = cum_x.dtype)
+    times.extend(x, y)
+    return times.result()
+  total_time = cum_x[index] # cumulative time to reach each level
+  
   # typically, you'll want to plot total_time on x-axis, time_between on y-axis
-  return total_time, time_between
\ No newline at end of file
+  return total_time, _time_between(total_time)
+
+def _time_between(total_time):
+  """Time passed between reaching levels n-1 and n."""
+  time_between = total_time[1:]-total_time[:-1]
+  return np.insert(time_between,0,total_time[0])
+
+class RewardTimes:
+  """Streaming version of first_time_to: fed one (dx, dy) increment at a time
+  (e.g. episode length and reward), records the cumulative x at which each
+  reward level is first reached, so total_steps and steps_per_reward are
+  ready as soon as training ends. result() matches first_time_to."""
+  
+  def __init__(self, dtype = np.int64):
+    self.dtype = np.dtype(dtype)
+    self.reset()
+  
+  def reset(self):
+    self.x = 0
+    self.y = 0.
+    self.max_y = -np.inf
+    self.total_time = GrowableArray(self.dtype) # x when level len(total_time)-1 was reached
+    self.pending = [] # cumulative x of increments since the last level reached
+  
+  def push(self, dx, dy):
+    self.x += dx
+    self.y += dy
+    self.max_y = max(self.max_y, self.y)
+    # as in first_time_to, each increment reaches at most one level
+    if self.y > len(self.total_time):
+      self.total_time.append(self.x)
+      self.pending = []
+    else:
+      self.pending.append(self.x)
+  
+  def extend(self, dxs, dys):
+    for dx, dy in zip(np.asarray(dxs).tolist(), np.asarray(dys).tolist()):
+      self.push(dx, dy)
+  
+  def result(self):
+    """(total_time, time_between) as returned by first_time_to."""
+    n_levels = int(self.max_y)
+    total_time = self.total_time.view()[:max(n_levels, 0)]
+    missing = n_levels - len(total_time)
+    if missing > 0:
+      # levels not passed again after cum_y dipped: first_time_to assigns them
+      # the increments following the last level reached, one each
+      if missing > len(self.pending):
+        raise ValueError('not enough increments left to assign reward levels to')
+      total_time = np.concatenate([total_time, np.asarray(self.pending[:missing], dtype = self.dtype)])
+    return total_time.copy(), _time_between(total_time)
+
+class SlidingRate:
+  """Streaming version of rate_last_N: fed one (dx, dy) increment at a time
+  (e.g. episode length and reward), keeps only the final stretch of N in x."""
+  
+  def __init__(self, N):
+    self.N = N
+    self.x = 0
+    self.y = 0
+    self.window = collections.deque() # (cumulative x, cumulative y)
+  
+  def push(self, dx, dy):
+    self.x += dx
+    self.y += dy
+    self.window.append((self.x, self.y))
+    while self.window[0][0] <= self.x - self.N: self.window.popleft()
+  
+  def rate(self):
+    if not self.window: return None
+    x0, y0 = self.window[0]
+    if self.x == x0: return None
+    return (self.y - y0)/(self.x - x0)
+
+class SlidingMean:
+  """Streaming version of mean_last_N: fed (dx, y) pairs, averages y over the
+  final stretch of N in cumulative x."""
+  
+  def __init__(self, N):
+    self.N = N
+    self.x = 0
+    self.total = 0
+    self.window = collections.deque() # (cumulative x, y)
+  
+  def push(self, dx, y):
+    self.x += dx
+    self.total += y
+    self.window.append((self.x, y))
+    while self.window[0][0] <= self.x - self.N:
+      self.total -= self.window.popleft()[1]
+  
+  def mean(self):
+    if not self.window: return None
+    return self.total/len(self.window)